@@ -6,6 +6,7 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
 from django.core.files.base import ContentFile
 from django.conf import settings
+from server.renditions import read_rendition
 from .models import ChatMessage
 from orders.models import Orders
 
@@ -33,7 +34,7 @@ class PersonalChatConsumer(AsyncWebsocketConsumer):
         messages = ChatMessage.objects.filter(order=order).order_by('timestamp')
         return [{
             'message': msg.message if msg.message_type == 'TEXT' else None,
-            'image_data': base64.b64encode(msg.image.read()).decode('utf-8') if msg.message_type == 'IMAGE' and msg.image else None,
+            'image_data': base64.b64encode(read_rendition(msg.image, 'full')).decode('utf-8') if msg.message_type == 'IMAGE' and msg.image else None,
             'message_type': msg.message_type,
             'sender': str(msg.sender),
             'sender_type': msg.sender_type,
@@ -100,9 +101,9 @@ class PersonalChatConsumer(AsyncWebsocketConsumer):
         if message.message_type == 'TEXT':
             message_data['message'] = message.message
         else:
-            # Send image data directly instead of URL
-            message.image.seek(0)
-            image_data = base64.b64encode(message.image.read()).decode('utf-8')
+            # Send image data directly instead of URL, as the JPEG full
+            # rendition since the chat UI renders it as image/jpeg
+            image_data = base64.b64encode(read_rendition(message.image, 'full')).decode('utf-8')
             message_data['image_data'] = image_data
         await self.channel_layer.group_send(
             self.room_group_name,
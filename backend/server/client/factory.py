@@ -0,0 +1,18 @@
+import factory
+from .models import Client
+
+
+class ClientFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Client
+
+    name = factory.Sequence(lambda n: f"Client {n}")
+    email = factory.Sequence(lambda n: f"client{n}@test.com")
+    password = 'testpass123'
+    mobile_number = factory.Sequence(lambda n: f"8{n:09}")
+    street_address = factory.Sequence(lambda n: f"Street {n}")
+    city = 'Bengaluru'
+    state = 'Karnataka'
+    postal_code = '560001'
+    latitude = '12.971599'
+    longitude = '77.594566'
@@ -1,8 +1,14 @@
 from django.contrib import admin
-from .models import Notification
+from .models import Notification, NotificationOutbox
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     list_display = ['id', 'notification_type', 'recipient_client', 'recipient_provider', 'is_read', 'created_at']
     list_filter = ['notification_type', 'is_read', 'created_at']
-    search_fields = ['message']
\ No newline at end of file
+    search_fields = ['message']
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ['id', 'notification', 'group', 'status', 'attempts', 'next_attempt_at', 'created_at']
+    list_filter = ['status']
+    search_fields = ['group']
@@ -0,0 +1,155 @@
+"""
+In-process stand-in for a Kafka broker, for tests and benchmarks.
+
+FakeKafkaProducer has the parts of KafkaProducer's interface that
+NotificationProducer uses (send/flush/close and futures with callbacks) and
+batches like it: a sender thread collects records for linger_ms or until
+batch_size bytes and ships them to the FakeBroker in one request, which
+costs ``latency`` seconds.
+"""
+import threading
+import time
+from collections import defaultdict
+
+
+class FakeFuture:
+    def __init__(self):
+        self._done = threading.Event()
+        self._callbacks, self._errbacks = [], []
+        self._lock = threading.Lock()
+        self.value = self.exception = None
+
+    def add_callback(self, fn, *args):
+        return self._add(fn, args, errback=False)
+
+    def add_errback(self, fn, *args):
+        return self._add(fn, args, errback=True)
+
+    def _add(self, fn, args, errback):
+        with self._lock:
+            if not self._done.is_set():
+                (self._errbacks if errback else self._callbacks).append((fn, args))
+                return self
+        if errback == (self.exception is not None):
+            fn(*args, self.exception if errback else self.value)
+        return self
+
+    def resolve(self, value=None, exception=None):
+        with self._lock:
+            self.value, self.exception = value, exception
+            self._done.set()
+        if exception is None:
+            for fn, args in self._callbacks:
+                fn(*args, value)
+        else:
+            for fn, args in self._errbacks:
+                fn(*args, exception)
+
+    def get(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError('Send not acknowledged')
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+
+class FakeBroker:
+    """Keeps produced values per topic. Every produce request takes ``latency`` seconds."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.available = True
+        self.requests = 0
+        self.topics = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def produce(self, topic, values):
+        time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            if not self.available:
+                raise ConnectionError('Broker not available')
+            offset = len(self.topics[topic])
+            self.topics[topic].extend(values)
+        return offset
+
+
+class FakeKafkaProducer:
+    def __init__(self, broker, value_serializer=None, linger_ms=0, batch_size=16384, **options):
+        self.broker = broker
+        self.serializer = value_serializer or (lambda value: value)
+        self.linger = linger_ms / 1000
+        self.batch_size = batch_size
+        self._records = []
+        self._in_flight = 0
+        self._flushing = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._sender = threading.Thread(target=self._run, name='fake-kafka-sender', daemon=True)
+        self._sender.start()
+
+    def send(self, topic, value):
+        if self._closed:
+            raise RuntimeError('Producer is closed')
+        future = FakeFuture()
+        with self._condition:
+            self._records.append((topic, self.serializer(value), future))
+            self._condition.notify_all()
+        return future
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._records and not self._closed:
+                self._condition.wait()
+            if not self._records:
+                return None
+            deadline = time.monotonic() + self.linger
+            while (not self._closed and not self._flushing and time.monotonic() < deadline
+                   and sum(len(value) for _, value, _ in self._records) < self.batch_size):
+                self._condition.wait(deadline - time.monotonic())
+            batch, size = [], 0
+            while self._records and (not batch or size < self.batch_size):
+                record = self._records.pop(0)
+                batch.append(record)
+                size += len(record[1])
+            self._in_flight += len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            by_topic = defaultdict(list)
+            for topic, value, future in batch:
+                by_topic[topic].append((value, future))
+            for topic, records in by_topic.items():
+                try:
+                    offset = self.broker.produce(topic, [value for value, _ in records])
+                except Exception as exc:
+                    for _, future in records:
+                        future.resolve(exception=exc)
+                else:
+                    for i, (_, future) in enumerate(records):
+                        future.resolve(value=(topic, offset + i))
+            with self._condition:
+                self._in_flight -= len(batch)
+                self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        with self._condition:
+            # Ship what lingers at once
+            self._flushing += 1
+            self._condition.notify_all()
+            try:
+                if not self._condition.wait_for(lambda: not self._records and not self._in_flight, timeout):
+                    raise TimeoutError('Flush timed out')
+            finally:
+                self._flushing -= 1
+
+    def close(self, timeout=None):
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._sender.join(timeout)
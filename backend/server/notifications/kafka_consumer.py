@@ -1,13 +1,15 @@
 from kafka import KafkaConsumer
 import json
 from .models import Notification
+from .kafka_producer import kafka_settings
 import django
 
 class NotificationConsumer:
     def __init__(self):
+        options = kafka_settings()
         self.consumer = KafkaConsumer(
-            'notifications',
-            bootstrap_servers=['localhost:9092'],
+            options['TOPIC'],
+            bootstrap_servers=options['BOOTSTRAP_SERVERS'],
             value_deserializer=lambda x: json.loads(x.decode('utf-8'))
         )
 
@@ -1,13 +1,157 @@
-from kafka import KafkaProducer
+"""
+Process-wide Kafka producer for notifications.
+
+Sending used to flush after every message, a synchronous broker round trip
+per notification, and every NotificationProducer opened its own connection.
+Now one client per process batches records for LINGER_MS or until
+BATCH_SIZE bytes, compresses each batch and reports delivery through
+callbacks. At most MAX_PENDING messages may be undelivered; further sends
+block for up to BLOCK_SECONDS and then raise ProducerBufferFull, so a slow
+broker pushes back on the callers instead of growing the buffer. Whatever
+is still buffered is flushed when the process exits.
+"""
+import atexit
 import json
+import logging
+import threading
+
+from django.conf import settings
+
+from server.lazy_import import lazy_module
+
+# Imported on first use so processes that never produce do not load kafka
+kafka = lazy_module('kafka')
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'BOOTSTRAP_SERVERS': ['localhost:9092'],
+    'TOPIC': 'notifications',
+    'LINGER_MS': 5,
+    'BATCH_SIZE': 64 * 1024,
+    'COMPRESSION': 'lz4',
+    'ACKS': 1,
+    'BUFFER_MEMORY': 32 * 1024 * 1024,
+    'MAX_PENDING': 10000,
+    'BLOCK_SECONDS': 5,
+    'CLOSE_TIMEOUT': 10,
+}
+
+
+def kafka_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'NOTIFICATION_KAFKA', {})}
+
+
+def serialize(value):
+    return json.dumps(value).encode('utf-8')
+
+
+def create_client(options=None):
+    """A KafkaProducer configured for batched, compressed sends."""
+    options = options or kafka_settings()
+    return kafka.KafkaProducer(
+        bootstrap_servers=options['BOOTSTRAP_SERVERS'],
+        value_serializer=serialize,
+        linger_ms=options['LINGER_MS'],
+        batch_size=options['BATCH_SIZE'],
+        compression_type=options['COMPRESSION'],
+        acks=options['ACKS'],
+        buffer_memory=options['BUFFER_MEMORY'],
+        max_block_ms=int(options['BLOCK_SECONDS'] * 1000),
+    )
+
+
+class ProducerBufferFull(Exception):
+    """MAX_PENDING messages are still undelivered after waiting BLOCK_SECONDS."""
+
 
 class NotificationProducer:
-    def __init__(self):
-        self.producer = KafkaProducer(
-            bootstrap_servers=['localhost:9092'],
-            value_serializer=lambda v: json.dumps(v).encode('utf-8')
-        )
-
-    def send_notification(self, notification_data):
-        self.producer.send('notifications', notification_data)
-        self.producer.flush()
+    """
+    Sends notifications without waiting for the broker. ``client`` is any
+    object with KafkaProducer's send/flush/close; by default a KafkaProducer
+    built from NOTIFICATION_KAFKA on the first send.
+    """
+
+    def __init__(self, client=None, options=None):
+        self.options = {**kafka_settings(), **(options or {})}
+        self._client = client
+        self._lock = threading.Lock()
+        self._pending = threading.BoundedSemaphore(self.options['MAX_PENDING'])
+        self._closed = False
+        self.sent = self.delivered = self.failed = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = create_client(self.options)
+        return self._client
+
+    def send_notification(self, notification_data, topic=None):
+        """Queue a message for the broker. Returns the send future."""
+        if self._closed:
+            raise RuntimeError('Notification producer is closed')
+        if not self._pending.acquire(timeout=self.options['BLOCK_SECONDS']):
+            raise ProducerBufferFull(f"{self.options['MAX_PENDING']} notifications awaiting delivery")
+        try:
+            future = self.client.send(topic or self.options['TOPIC'], notification_data)
+        except Exception:
+            self._pending.release()
+            raise
+        with self._lock:
+            self.sent += 1
+        future.add_callback(self._delivered)
+        future.add_errback(self._failed, notification_data)
+        return future
+
+    def _delivered(self, metadata):
+        with self._lock:
+            self.delivered += 1
+        self._pending.release()
+
+    def _failed(self, notification_data, exc):
+        with self._lock:
+            self.failed += 1
+        self._pending.release()
+        logger.error('Could not deliver notification %s to Kafka: %s',
+                     notification_data.get('id') if isinstance(notification_data, dict) else None, exc)
+
+    def flush(self, timeout=None):
+        if self._client is not None:
+            self._client.flush(timeout=timeout)
+
+    def close(self, timeout=None):
+        """Deliver what is buffered, waiting up to CLOSE_TIMEOUT seconds, and disconnect."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._client is not None:
+            try:
+                self._client.close(timeout=self.options['CLOSE_TIMEOUT'] if timeout is None else timeout)
+            except Exception:
+                logger.exception('Could not flush the notification producer')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sent': self.sent,
+                'delivered': self.delivered,
+                'failed': self.failed,
+                'pending': self.sent - self.delivered - self.failed,
+            }
+
+
+_producer = None
+_producer_lock = threading.Lock()
+
+
+def notification_producer():
+    """The process's producer, created on first use and closed at exit."""
+    global _producer
+    if _producer is None:
+        with _producer_lock:
+            if _producer is None:
+                _producer = NotificationProducer()
+                atexit.register(_producer.close)
+    return _producer
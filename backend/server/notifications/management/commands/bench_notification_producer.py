@@ -0,0 +1,79 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from notifications.fake_broker import FakeBroker, FakeKafkaProducer
+from notifications.kafka_producer import NotificationProducer, create_client, kafka_settings, serialize
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks notification throughput in messages per second: flushing after every '
+        'send against the batched, non-blocking producer. Runs against an in-process fake '
+        'broker with a simulated round trip unless --bootstrap-servers is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000, help='Notifications sent per run')
+        parser.add_argument('--latency-ms', type=float, default=2.0,
+                            help='Round trip of one produce request to the fake broker')
+        parser.add_argument('--bootstrap-servers',
+                            help='Comma separated Kafka brokers to benchmark instead of the fake broker')
+        parser.add_argument('--topic', default='notifications-bench')
+
+    def handle(self, *args, **options):
+        self.options = options
+        messages = [self._message(i) for i in range(options['messages'])]
+
+        self.stdout.write(f"{'producer':>14} {'msgs/sec':>10} {'requests':>9}")
+        baseline = self._run('flush-per-send', messages, batched=False)
+        batched = self._run('batched', messages, batched=True)
+        self.stdout.write(f'batched producer: {batched / baseline:.1f}x the flush-per-send throughput')
+
+    def _message(self, i):
+        return {
+            'id': str(uuid.uuid4()),
+            'message': f'New order received from Client {i} for Plumbing',
+            'notification_type': 'new_order',
+            'order_id': str(uuid.uuid4()),
+            'created_at': timezone.now().isoformat(),
+        }
+
+    def _client(self, batched):
+        settings = kafka_settings()
+        if not batched:
+            # The previous producer: default batching, flushed after every message
+            settings = {**settings, 'LINGER_MS': 0, 'COMPRESSION': None}
+        if self.options['bootstrap_servers']:
+            return None, create_client({**settings, 'BOOTSTRAP_SERVERS': self.options['bootstrap_servers'].split(',')})
+        broker = FakeBroker(latency=self.options['latency_ms'] / 1000)
+        return broker, FakeKafkaProducer(
+            broker, value_serializer=serialize,
+            linger_ms=settings['LINGER_MS'], batch_size=settings['BATCH_SIZE'],
+        )
+
+    def _run(self, name, messages, batched):
+        broker, client = self._client(batched)
+        topic = self.options['topic']
+        start = time.perf_counter()
+        if batched:
+            producer = NotificationProducer(client)
+            for message in messages:
+                producer.send_notification(message, topic)
+            producer.close()
+            failed = producer.stats()['failed']
+        else:
+            for message in messages:
+                client.send(topic, message)
+                client.flush()
+            client.close()
+            failed = 0
+        rate = len(messages) / (time.perf_counter() - start)
+
+        requests = broker.requests if broker else '-'
+        self.stdout.write(f'{name:>14} {rate:>10.0f} {requests:>9}')
+        if failed:
+            self.stderr.write(f'{name}: {failed} messages failed')
+        return rate
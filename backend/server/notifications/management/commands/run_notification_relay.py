@@ -0,0 +1,37 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from notifications.outbox import relay, relay_batch
+
+
+class Command(BaseCommand):
+    help = 'Delivers queued notifications from the outbox to the WebSocket channel layer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            help='Outbox entries sent per batch (default: NOTIFICATION_OUTBOX BATCH_SIZE)')
+        parser.add_argument('--once', action='store_true',
+                            help='Deliver what is due now and exit')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['once']:
+            total_delivered = total_failed = 0
+            while True:
+                delivered, failed = relay_batch(batch_size)
+                total_delivered += delivered
+                total_failed += failed
+                if not delivered + failed:
+                    break
+            self.stdout.write(f'Delivered {total_delivered} notifications, {total_failed} failed')
+            return
+
+        stop = threading.Event()
+        self.stdout.write(self.style.SUCCESS('Notification relay running'))
+        try:
+            relay(stop, batch_size)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
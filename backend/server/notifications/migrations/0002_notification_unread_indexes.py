@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-19 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient_provider', 'is_read', 'created_at'], name='notif_provider_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient_client', 'is_read', 'created_at'], name='notif_client_unread_idx'),
+        ),
+    ]
@@ -40,4 +40,49 @@ class Notification(models.Model):
     order_id = models.UUIDField()
 
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # Latest unread notifications of a recipient, newest first
+            models.Index(fields=['recipient_provider', 'is_read', 'created_at'], name='notif_provider_unread_idx'),
+            models.Index(fields=['recipient_client', 'is_read', 'created_at'], name='notif_client_unread_idx'),
+        ]
+
+class OutboxStatus(models.TextChoices):
+    PENDING = 'pending', _('Pending')
+    FAILED = 'failed', _('Failed')
+
+
+class NotificationOutbox(models.Model):
+    """
+    A notification waiting to be pushed to its recipient's WebSocket group.
+    Written in the same transaction as the notification and drained by the
+    relay (manage.py run_notification_relay). Rows are deleted once delivered;
+    the id orders the deliveries to one group.
+    """
+    notification = models.OneToOneField(
+        Notification,
+        on_delete=models.CASCADE,
+        related_name='outbox'
+    )
+    group = models.CharField(max_length=64)
+    payload = models.JSONField()
+    status = models.CharField(
+        max_length=10,
+        choices=OutboxStatus.choices,
+        default=OutboxStatus.PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # Due entries, oldest first
+            models.Index(fields=['status', 'next_attempt_at', 'id'], name='outbox_due_idx'),
+            # Earliest undelivered entry of a group
+            models.Index(fields=['group', 'status', 'id'], name='outbox_group_idx'),
+        ]
+        verbose_name = _("Notification Outbox Entry")
+        verbose_name_plural = _("Notification Outbox")
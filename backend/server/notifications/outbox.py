@@ -0,0 +1,162 @@
+"""
+Transactional outbox for real-time notifications.
+
+create_notification() writes the Notification and a NotificationOutbox row
+in the caller's transaction, so a notification is queued for delivery if and
+only if the order change that caused it commits. No request talks to Redis.
+
+The relay (manage.py run_notification_relay) claims due rows with
+SELECT ... FOR UPDATE SKIP LOCKED, sends a batch to the channel layer in one
+event loop round and deletes what was delivered. A failed send is retried
+with exponential backoff; later entries of the same group wait behind it, so
+each recipient receives its notifications in the order they were written.
+After MAX_ATTEMPTS the entry is marked failed and stops blocking its group;
+the notification itself is still listed by the notifications API.
+Delivery is at least once: a relay that dies between sending and committing
+sends the batch again.
+"""
+import logging
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, Min, OuterRef
+from django.utils import timezone
+
+from .models import Notification, NotificationOutbox, OutboxStatus
+from .utils import notification_group, notification_payload
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'BATCH_SIZE': 100,
+    'POLL_SECONDS': 0.5,
+    'MAX_ATTEMPTS': 10,
+    'RETRY_BASE_SECONDS': 1.0,
+    'RETRY_MAX_SECONDS': 300,
+}
+
+
+def outbox_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'NOTIFICATION_OUTBOX', {})}
+
+
+def enqueue(notification):
+    """Queue an existing notification for delivery. Returns None if it has no recipient."""
+    group = notification_group(notification)
+    if group is None:
+        logger.warning('Notification %s has no recipient', notification.id)
+        return None
+    return NotificationOutbox.objects.create(
+        notification=notification,
+        group=group,
+        payload=notification_payload(notification),
+        next_attempt_at=timezone.now(),
+    )
+
+
+def create_notification(**fields):
+    """Create a notification and its outbox entry atomically, inside any surrounding transaction."""
+    with transaction.atomic():
+        notification = Notification.objects.create(**fields)
+        enqueue(notification)
+    return notification
+
+
+def retry_delay(attempts):
+    options = outbox_settings()
+    return min(options['RETRY_BASE_SECONDS'] * 2 ** (attempts - 1), options['RETRY_MAX_SECONDS'])
+
+
+def _deliverable(entries):
+    """
+    Keep the entries whose group has no earlier undelivered entry outside the
+    batch, e.g. one claimed by another relay.
+    """
+    if not entries:
+        return []
+    claimed = [entry.id for entry in entries]
+    blocked = dict(
+        NotificationOutbox.objects
+        .filter(status=OutboxStatus.PENDING, group__in={entry.group for entry in entries}, id__lt=max(claimed))
+        .exclude(id__in=claimed)
+        .values('group')
+        .annotate(first=Min('id'))
+        .values_list('group', 'first')
+    )
+    return [entry for entry in entries if entry.id < blocked.get(entry.group, entry.id + 1)]
+
+
+async def _send(channel_layer, entries):
+    """Send entries in order; after a failure the rest of that group is held back."""
+    delivered, failures = [], {}
+    for entry in entries:
+        if entry.group in failures:
+            continue
+        try:
+            await channel_layer.group_send(
+                entry.group,
+                {'type': 'notification_message', 'message': entry.payload}
+            )
+        except Exception as exc:
+            failures[entry.group] = (entry, exc)
+        else:
+            delivered.append(entry.id)
+    return delivered, list(failures.values())
+
+
+def relay_batch(batch_size=None, channel_layer=None):
+    """Deliver up to batch_size due outbox entries. Returns (delivered, failed)."""
+    batch_size = batch_size or outbox_settings()['BATCH_SIZE']
+    channel_layer = channel_layer or get_channel_layer()
+    now = timezone.now()
+    # Earlier entries of a group that are backing off hold the group back
+    waiting = NotificationOutbox.objects.filter(status=OutboxStatus.PENDING, next_attempt_at__gt=now)
+    with transaction.atomic():
+        entries = _deliverable(list(
+            NotificationOutbox.objects
+            .filter(status=OutboxStatus.PENDING, next_attempt_at__lte=now)
+            .filter(~Exists(waiting.filter(group=OuterRef('group'), id__lt=OuterRef('id'))))
+            .select_for_update(skip_locked=True)
+            .order_by('id')[:batch_size]
+        ))
+        if not entries:
+            return 0, 0
+
+        delivered, failures = async_to_sync(_send)(channel_layer, entries)
+        NotificationOutbox.objects.filter(id__in=delivered).delete()
+
+        max_attempts = outbox_settings()['MAX_ATTEMPTS']
+        for entry, exc in failures:
+            entry.attempts += 1
+            entry.last_error = str(exc)
+            entry.next_attempt_at = now + timedelta(seconds=retry_delay(entry.attempts))
+            if entry.attempts >= max_attempts:
+                entry.status = OutboxStatus.FAILED
+                logger.error('Giving up on notification %s after %s attempts: %s',
+                             entry.notification_id, entry.attempts, exc)
+            else:
+                logger.warning('Could not deliver notification %s (attempt %s): %s',
+                               entry.notification_id, entry.attempts, exc)
+            entry.save(update_fields=['attempts', 'last_error', 'next_attempt_at', 'status'])
+    return len(delivered), len(failures)
+
+
+def relay(stop, batch_size=None, poll_interval=None):
+    """Drain the outbox until ``stop`` is set, sleeping poll_interval when nothing is due."""
+    options = outbox_settings()
+    batch_size = batch_size or options['BATCH_SIZE']
+    poll_interval = poll_interval or options['POLL_SECONDS']
+    channel_layer = get_channel_layer()
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            delivered, failed = relay_batch(batch_size, channel_layer)
+            # A full batch means more may be waiting
+            if delivered + failed < batch_size:
+                stop.wait(poll_interval)
+        except Exception:
+            logger.exception('Notification relay failed')
+            stop.wait(poll_interval)
@@ -1,3 +1,212 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from expects import expect, equal, be, be_above, be_below, have_len, raise_error
+from rest_framework.test import APITestCase, APIClient
+
+from client.factory import ClientFactory
+from server.explain import analyze_tables, query_plan
+from orders.factory import OrderFactory
+from orders.models import Orders, OrderStatus
+from service_provider.factory import ServiceProviderFactory
+from .fake_broker import FakeBroker, FakeKafkaProducer
+from .kafka_producer import NotificationProducer, ProducerBufferFull, serialize
+from .models import Notification, NotificationOutbox, NotificationType, OutboxStatus
+from .outbox import create_notification, relay_batch
+
+
+@skipUnless(connection.vendor == 'mysql', 'EXPLAIN output is MySQL specific')
+class TestNotificationQueryPlans(TransactionTestCase):
+    """Unread notifications are read newest first straight from their index."""
+
+    def setUp(self):
+        self.provider = ServiceProviderFactory()
+        self.client_user = ClientFactory()
+        Notification.objects.bulk_create([
+            Notification(
+                recipient_provider=self.provider if i % 2 else None,
+                recipient_client=None if i % 2 else self.client_user,
+                notification_type=NotificationType.NEW_ORDER,
+                message=f'Notification {i}',
+                is_read=i % 3 == 0,
+                order_id='00000000-0000-0000-0000-%012d' % i,
+            )
+            for i in range(300)
+        ])
+        analyze_tables(Notification)
+
+    def test_unread_notifications_use_recipient_index(self):
+        for field, recipient, index in (
+            ('recipient_provider', self.provider, 'notif_provider_unread_idx'),
+            ('recipient_client', self.client_user, 'notif_client_unread_idx'),
+        ):
+            queryset = Notification.objects.filter(**{field: recipient, 'is_read': False}).order_by('-created_at')[:5]
+            tables, filesort = query_plan(queryset)
+            expect(tables[0]['key']).to(equal(index))
+            expect(filesort).to(be(False))
+
+
+class FakeChannelLayer:
+    """Records group sends; sends to a group in ``failing`` raise."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+
+    async def group_send(self, group, message):
+        if group in self.failing:
+            raise ConnectionError('Redis is down')
+        self.sent.append((group, message['message']['message']))
+
+
+class TestOrderNotificationOutbox(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.order = OrderFactory()
+
+    def update_status(self, new_status):
+        url = reverse('order-status-update', args=[self.order.id])
+        return self.client.patch(url, {'status': new_status}, format='json')
+
+    def test_status_change_queues_notification_without_sending(self):
+        with mock.patch('notifications.outbox.get_channel_layer') as get_channel_layer:
+            expect(self.update_status(OrderStatus.ACCEPTED).status_code).to(equal(200))
+        expect(get_channel_layer.called).to(be(False))
+
+        entry = NotificationOutbox.objects.get()
+        expect(entry.notification.notification_type).to(equal(NotificationType.ORDER_ACCEPTED))
+        expect(entry.group).to(equal(f'notifications_{self.order.user_id}'))
+        expect(entry.payload['order_id']).to(equal(str(self.order.id)))
+
+    def test_notification_is_rolled_back_with_the_order_change(self):
+        with mock.patch('orders.views.create_notification', side_effect=RuntimeError('db error')):
+            expect(lambda: self.update_status(OrderStatus.ACCEPTED)).to(raise_error(RuntimeError))
+
+        expect(Orders.objects.get(id=self.order.id).status).to(equal(OrderStatus.PENDING))
+        expect(self.order.status_history.count()).to(equal(0))
+
+
+class TestNotificationRelay(TestCase):
+    def setUp(self):
+        self.providers = ServiceProviderFactory.create_batch(2)
+
+    def notify(self, provider, message):
+        return create_notification(
+            recipient_provider=provider,
+            notification_type=NotificationType.NEW_ORDER,
+            message=message,
+            order_id='00000000-0000-0000-0000-000000000000',
+        )
+
+    def group(self, provider):
+        return f'notifications_{provider.id}'
+
+    def test_delivers_in_order_and_empties_outbox(self):
+        first, second = self.providers
+        for message, provider in (('a1', first), ('b1', second), ('a2', first), ('a3', first)):
+            self.notify(provider, message)
+        channel_layer = FakeChannelLayer()
+
+        expect(relay_batch(2, channel_layer)).to(equal((2, 0)))
+        expect(relay_batch(10, channel_layer)).to(equal((2, 0)))
+        expect(relay_batch(10, channel_layer)).to(equal((0, 0)))
+
+        expect(channel_layer.sent).to(equal([
+            (self.group(first), 'a1'), (self.group(second), 'b1'),
+            (self.group(first), 'a2'), (self.group(first), 'a3'),
+        ]))
+        expect(NotificationOutbox.objects.count()).to(equal(0))
+        expect(Notification.objects.count()).to(equal(4))
+
+    def test_failed_group_waits_while_others_are_delivered(self):
+        first, second = self.providers
+        for message, provider in (('a1', first), ('a2', first), ('b1', second)):
+            self.notify(provider, message)
+        channel_layer = FakeChannelLayer(failing={self.group(first)})
+
+        expect(relay_batch(10, channel_layer)).to(equal((1, 1)))
+        expect(channel_layer.sent).to(equal([(self.group(second), 'b1')]))
+        failed = NotificationOutbox.objects.get(notification__message='a1')
+        expect(failed.attempts).to(equal(1))
+        expect(failed.next_attempt_at).to(be_above(timezone.now()))
+
+        # a2 is due, but must not overtake a1 while a1 backs off
+        self.notify(first, 'a3')
+        channel_layer.failing.clear()
+        expect(relay_batch(10, channel_layer)).to(equal((0, 0)))
+
+        NotificationOutbox.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        expect(relay_batch(10, channel_layer)).to(equal((3, 0)))
+        expect(channel_layer.sent[1:]).to(equal([
+            (self.group(first), 'a1'), (self.group(first), 'a2'), (self.group(first), 'a3'),
+        ]))
+
+    def test_gives_up_after_max_attempts(self):
+        first, _ = self.providers
+        self.notify(first, 'a1')
+        self.notify(first, 'a2')
+        channel_layer = FakeChannelLayer(failing={self.group(first)})
+
+        with self.settings(NOTIFICATION_OUTBOX={'MAX_ATTEMPTS': 2}):
+            for _ in range(2):
+                NotificationOutbox.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+                expect(relay_batch(10, channel_layer)).to(equal((0, 1)))
+
+            entry = NotificationOutbox.objects.get(notification__message='a1')
+            expect(entry.status).to(equal(OutboxStatus.FAILED))
+
+            # The failed entry no longer holds back the rest of its group
+            channel_layer.failing.clear()
+            expect(relay_batch(10, channel_layer)).to(equal((1, 0)))
+            expect(channel_layer.sent).to(equal([(self.group(first), 'a2')]))
+
+
+class TestNotificationProducer(SimpleTestCase):
+    def producer(self, linger_ms=20, **options):
+        self.broker = FakeBroker()
+        client = FakeKafkaProducer(self.broker, value_serializer=serialize, linger_ms=linger_ms, batch_size=64 * 1024)
+        producer = NotificationProducer(client, options)
+        self.addCleanup(producer.close)
+        return producer
+
+    def test_sends_are_batched_without_waiting_for_the_broker(self):
+        producer = self.producer()
+        for i in range(200):
+            producer.send_notification({'id': i})
+        producer.flush()
+
+        expect(self.broker.topics['notifications']).to(equal([serialize({'id': i}) for i in range(200)]))
+        expect(self.broker.requests).to(be_below(5))
+        expect(producer.stats()).to(equal({'sent': 200, 'delivered': 200, 'failed': 0, 'pending': 0}))
+
+    def test_failed_deliveries_are_counted(self):
+        producer = self.producer()
+        self.broker.available = False
+        future = producer.send_notification({'id': 1})
+        producer.flush()
+
+        expect(lambda: future.get(1)).to(raise_error(ConnectionError))
+        expect(producer.stats()['failed']).to(equal(1))
+        expect(producer.stats()['pending']).to(equal(0))
+
+    def test_full_buffer_pushes_back(self):
+        producer = self.producer(linger_ms=10000, MAX_PENDING=2, BLOCK_SECONDS=0.05)
+        producer.send_notification({'id': 1})
+        producer.send_notification({'id': 2})
+
+        expect(lambda: producer.send_notification({'id': 3})).to(raise_error(ProducerBufferFull))
+        producer.flush()
+        producer.send_notification({'id': 3})
+
+    def test_close_flushes_buffered_messages(self):
+        producer = self.producer(linger_ms=10000)
+        for i in range(3):
+            producer.send_notification({'id': i})
+        producer.close()
+
+        expect(self.broker.topics['notifications']).to(have_len(3))
+        expect(lambda: producer.send_notification({'id': 4})).to(raise_error(RuntimeError))
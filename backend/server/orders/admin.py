@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 from django.utils.html import format_html
-from .models import Orders, OrderItems, OrderStatusHistory
+from .models import Orders, OrderItems, OrderStatusHistory, ProviderRatingSummary
 
 class OrderItemsInline(admin.TabularInline):
     model = OrderItems
@@ -155,4 +155,17 @@ class OrderStatusHistoryAdmin(admin.ModelAdmin):
         return False
     
     def has_delete_permission(self, request, obj=None):
-        return False
\ No newline at end of file
+        return False
+
+
+@admin.register(ProviderRatingSummary)
+class ProviderRatingSummaryAdmin(admin.ModelAdmin):
+    list_display = ('provider', 'average_rating', 'rating_count', 'updated_at')
+    search_fields = ('provider__first_name', 'provider__last_name')
+    list_select_related = ('provider__main_service',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,36 @@
+import factory
+from django.utils import timezone
+from client.factory import ClientFactory
+from service_provider.factory import ServiceProviderFactory, ProviderServiceFactory
+from .models import Orders, OrderItems, OrderStatusHistory, OrderStatus
+
+
+class OrderFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Orders
+
+    user = factory.SubFactory(ClientFactory)
+    provider = factory.SubFactory(ServiceProviderFactory)
+    service = factory.SelfAttribute('provider.main_service')
+    scheduled_on = factory.LazyFunction(timezone.now)
+    otp = '123456'
+    status = OrderStatus.PENDING
+    total_price = factory.Faker('pydecimal', left_digits=4, right_digits=2, positive=True)
+
+
+class OrderItemFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = OrderItems
+
+    order = factory.SubFactory(OrderFactory)
+    provider_service = factory.SubFactory(
+        ProviderServiceFactory, provider=factory.SelfAttribute('..order.provider')
+    )
+
+
+class OrderStatusHistoryFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = OrderStatusHistory
+
+    order = factory.SubFactory(OrderFactory)
+    status = factory.SelfAttribute('order.status')
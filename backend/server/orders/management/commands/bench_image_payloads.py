@@ -0,0 +1,68 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from orders.models import Orders
+from service_provider.models import ProviderService
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares response size and latency of the order list and provider search '
+        'with inline base64 images versus content-addressed image URLs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client-id', help='Client whose orders are listed (default: busiest client)')
+        parser.add_argument('--sub-service', help='Sub-service to search (default: most offered)')
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per endpoint and mode')
+
+    def handle(self, *args, **options):
+        client_id = options['client_id'] or self._busiest_client()
+        provider_service = self._sample_provider_service(options['sub_service'])
+        if client_id is None or provider_service is None:
+            raise CommandError('Need at least one order and one provider service to benchmark')
+
+        endpoints = [
+            ('order list', reverse('order-create-list'), {'client_id': client_id}),
+            ('provider search', reverse('subservice-providers', args=[provider_service.sub_service_id]), {
+                'latitude': provider_service.provider.latitude,
+                'longitude': provider_service.provider.longitude,
+            }),
+        ]
+
+        http = Client(HTTP_HOST='localhost')
+        self.stdout.write(f"{'endpoint':>16} {'images':>7} {'bytes':>10} {'median ms':>10} {'p95 ms':>10}")
+        for name, url, params in endpoints:
+            for mode in ('inline', 'url'):
+                query = dict(params, image_format='url') if mode == 'url' else params
+                timings = []
+                size = 0
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    response = http.get(url, query)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    size = len(response.content)
+                timings.sort()
+                p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+                self.stdout.write(
+                    f"{name:>16} {mode:>7} {size:>10} "
+                    f"{statistics.median(timings):>10.2f} {p95:>10.2f}"
+                )
+
+    def _busiest_client(self):
+        row = Orders.objects.values('user_id').annotate(orders=Count('id')).order_by('-orders').first()
+        return row and row['user_id']
+
+    def _sample_provider_service(self, sub_service_id):
+        provider_services = ProviderService.objects.select_related('provider')
+        if sub_service_id:
+            return provider_services.filter(sub_service_id=sub_service_id).first()
+        row = ProviderService.objects.values('sub_service_id').annotate(
+            providers=Count('id')
+        ).order_by('-providers').first()
+        return row and provider_services.filter(sub_service_id=row['sub_service_id']).first()
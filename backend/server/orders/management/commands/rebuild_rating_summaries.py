@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.models import ProviderRatingSummary
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds every provider rating summary from completed, rated orders'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = ProviderRatingSummary.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating summaries for {count} providers'))
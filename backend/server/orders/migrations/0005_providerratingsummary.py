@@ -0,0 +1,48 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_summaries(apps, schema_editor):
+    Orders = apps.get_model('orders', 'Orders')
+    ProviderRatingSummary = apps.get_model('orders', 'ProviderRatingSummary')
+    star_fields = {1: 'one_star', 2: 'two_star', 3: 'three_star', 4: 'four_star', 5: 'five_star'}
+    rows = Orders.objects.filter(status='completed', rating__isnull=False).values('provider_id').annotate(
+        rating_count=models.Count('id'),
+        rating_total=models.Sum('rating'),
+        **{field: models.Count('id', filter=models.Q(rating=stars)) for stars, field in star_fields.items()}
+    ).order_by()
+    ProviderRatingSummary.objects.bulk_create(
+        [ProviderRatingSummary(**row) for row in rows], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0006_serviceprovider_grid_cell'),
+        ('orders', '0004_merge_20241214_1957'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderRatingSummary',
+            fields=[
+                ('provider', models.OneToOneField(help_text='Provider these ratings belong to', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='service_provider.serviceprovider')),
+                ('rating_count', models.PositiveIntegerField(default=0, help_text='Number of rated completed orders')),
+                ('rating_total', models.PositiveIntegerField(default=0, help_text='Sum of all ratings')),
+                ('one_star', models.PositiveIntegerField(default=0)),
+                ('two_star', models.PositiveIntegerField(default=0)),
+                ('three_star', models.PositiveIntegerField(default=0)),
+                ('four_star', models.PositiveIntegerField(default=0)),
+                ('five_star', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Provider Rating Summary',
+                'verbose_name_plural': 'Provider Rating Summaries',
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_providerratingsummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orders',
+            index=models.Index(fields=['user', 'ordered_on', 'id'], name='order_user_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orders',
+            index=models.Index(fields=['provider', 'ordered_on', 'id'], name='order_provider_history_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-19 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_order_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orders',
+            index=models.Index(fields=['provider', 'status', 'rating'], name='order_provider_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orders',
+            index=models.Index(fields=['status', 'rating', 'provider'], name='order_status_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderstatushistory',
+            index=models.Index(fields=['order', 'status', 'changed_on'], name='order_history_status_idx'),
+        ),
+    ]
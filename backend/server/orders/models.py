@@ -93,6 +93,17 @@ class Orders(models.Model):
         help_text=_("Rating provided by the client (1 to 5)")
     )
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a client's or provider's order history
+            models.Index(fields=['user', 'ordered_on', 'id'], name='order_user_history_idx'),
+            models.Index(fields=['provider', 'ordered_on', 'id'], name='order_provider_history_idx'),
+            # A provider's orders by status, including the completed, rated ones behind reviews
+            models.Index(fields=['provider', 'status', 'rating'], name='order_provider_status_idx'),
+            # Rating aggregates: completed orders with a rating, grouped by provider, read from the index alone
+            models.Index(fields=['status', 'rating', 'provider'], name='order_status_rating_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.user} - {self.service.name}"
 
@@ -142,5 +153,109 @@ class OrderStatusHistory(models.Model):
     changed_on = models.DateTimeField(auto_now_add=True, help_text=_(
         "Timestamp when the status was changed"))
 
+    class Meta:
+        indexes = [
+            # Completion date of an order: its history entry with status completed
+            models.Index(fields=['order', 'status', 'changed_on'], name='order_history_status_idx'),
+        ]
+
     def __str__(self):
         return f"Status {self.status} for Order {self.order.id} on {self.changed_on}"
+
+
+class ProviderRatingSummary(models.Model):
+    """
+    Per-provider rating aggregates over completed, rated orders.
+
+    Maintained incrementally when a rating is recorded so listings can read
+    one row instead of aggregating Orders. ``rebuild`` recomputes it from
+    scratch (see the rebuild_rating_summaries command).
+    """
+    STAR_FIELDS = {
+        1: 'one_star',
+        2: 'two_star',
+        3: 'three_star',
+        4: 'four_star',
+        5: 'five_star',
+    }
+
+    provider = models.OneToOneField(
+        ServiceProvider,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rating_summary',
+        help_text=_("Provider these ratings belong to")
+    )
+    rating_count = models.PositiveIntegerField(default=0, help_text=_("Number of rated completed orders"))
+    rating_total = models.PositiveIntegerField(default=0, help_text=_("Sum of all ratings"))
+    one_star = models.PositiveIntegerField(default=0)
+    two_star = models.PositiveIntegerField(default=0)
+    three_star = models.PositiveIntegerField(default=0)
+    four_star = models.PositiveIntegerField(default=0)
+    five_star = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("Provider Rating Summary")
+        verbose_name_plural = _("Provider Rating Summaries")
+
+    def __str__(self):
+        return f"{self.provider_id}: {self.average_rating} ({self.rating_count} ratings)"
+
+    @property
+    def average_rating(self):
+        if not self.rating_count:
+            return 0.0
+        return round(self.rating_total / self.rating_count, 2)
+
+    @property
+    def rating_counts(self):
+        return {str(stars): getattr(self, field) for stars, field in self.STAR_FIELDS.items()}
+
+    @classmethod
+    def record_rating(cls, provider_id, rating, previous_rating=None):
+        """
+        Add a rating to the provider's summary, replacing ``previous_rating``
+        if the order had already been rated. Call inside the transaction that
+        saves the order.
+        """
+        deltas = {'rating_count': 1, 'rating_total': rating, cls.STAR_FIELDS[rating]: 1}
+        if previous_rating:
+            previous_field = cls.STAR_FIELDS[previous_rating]
+            deltas['rating_count'] -= 1
+            deltas['rating_total'] -= previous_rating
+            deltas[previous_field] = deltas.get(previous_field, 0) - 1
+
+        cls.objects.get_or_create(provider_id=provider_id)
+        updates = {field: models.F(field) + delta for field, delta in deltas.items() if delta}
+        if updates:
+            cls.objects.filter(provider_id=provider_id).update(**updates)
+
+    @classmethod
+    def aggregate(cls, provider_ids=None):
+        """
+        Compute summary rows from Orders in one GROUP BY provider_id query.
+        Returns unsaved ProviderRatingSummary instances.
+        """
+        orders = Orders.objects.filter(status=OrderStatus.COMPLETED, rating__isnull=False)
+        if provider_ids is not None:
+            orders = orders.filter(provider_id__in=provider_ids)
+
+        aggregates = {
+            field: models.Count('id', filter=models.Q(rating=stars))
+            for stars, field in cls.STAR_FIELDS.items()
+        }
+        rows = orders.values('provider_id').annotate(
+            rating_count=models.Count('id'),
+            rating_total=models.Sum('rating'),
+            **aggregates
+        ).order_by()
+        return [cls(**row) for row in rows]
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every summary from completed, rated orders."""
+        summaries = cls.aggregate()
+        cls.objects.all().delete()
+        cls.objects.bulk_create(summaries, batch_size=1000)
+        return len(summaries)
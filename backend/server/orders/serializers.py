@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.db.models import Prefetch
 from .models import Orders, OrderItems, OrderStatusHistory,OrderStatus
 import random
 
@@ -8,32 +9,8 @@ import random
 #         fields = ['id', 'provider_service']
 
 
-from django.core.files.base import ContentFile
 
-import base64
-
-class Base64ImageField(serializers.ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            # Get the base64 data after the comma
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            
-            # Convert base64 to file
-            data = ContentFile(base64.b64decode(imgstr), name=f'temp.{ext}')
-        
-        return super().to_internal_value(data)
-    
-    def to_representation(self, value):
-        if not value:
-            return None
-        
-        try:
-            with value.open('rb') as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode()
-                return f'data:image/{value.name.split(".")[-1]};base64,{encoded_string}'
-        except Exception:
-            return None
+from server.images import image_representation
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -67,14 +44,7 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['ordered_on', 'otp']
 
     def get_service_image(self, obj):
-        if obj.service.image:
-            try:
-                with obj.service.image.open('rb') as image_file:
-                    encoded_image = base64.b64encode(image_file.read()).decode('utf-8')
-                    return f"data:image/{obj.service.image.name.split('.')[-1]};base64,{encoded_image}"
-            except Exception:
-                return None
-        return None
+        return image_representation(obj.service.image, self.context.get('request'))
     
     def create(self, validated_data):
         items_data = validated_data.pop('items')
@@ -93,4 +63,18 @@ class OrderSerializer(serializers.ModelSerializer):
             status=OrderStatus.PENDING
         )
         
-        return order
\ No newline at end of file
+        return order
+
+
+def order_listing_queryset(queryset=None):
+    """
+    Orders with everything OrderSerializer reads loaded up front: the
+    provider and service are joined, and the items (with their sub-service)
+    and status history are prefetched, so a list of any length serializes in
+    three queries.
+    """
+    queryset = Orders.objects.all() if queryset is None else queryset
+    return queryset.select_related('provider', 'service').prefetch_related(
+        Prefetch('items', queryset=OrderItems.objects.select_related('provider_service__sub_service')),
+        'status_history',
+    )
\ No newline at end of file
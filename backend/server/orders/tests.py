@@ -1,3 +1,378 @@
-from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase, APIClient
+from expects import expect, equal, be, be_none, contain, start_with, have_len
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import timedelta
+from unittest import skipUnless
+from django.db.models import Count, Sum
+from django.test import TransactionTestCase
+from server.explain import analyze_tables, query_plan, used_indexes
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from server.images import DataURICache, data_uri_cache, encode_data_uri
+from service_provider.factory import ServiceProviderFactory, ProviderServiceFactory
+from client.factory import ClientFactory
+from .factory import OrderFactory, OrderItemFactory, OrderStatusHistoryFactory
+from .models import Orders, OrderStatus, OrderStatusHistory, ProviderRatingSummary
+from .serializers import OrderSerializer
+
+
+class TestProviderRatingSummary(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.provider = ServiceProviderFactory()
+
+    def review(self, order, rating, review='Good work'):
+        url = reverse('order-review-update', args=[order.id])
+        return self.client.patch(url, {'rating': rating, 'review': review}, format='json')
+
+    def summary(self):
+        return ProviderRatingSummary.objects.get(provider=self.provider)
+
+    def test_review_updates_summary(self):
+        for rating in (5, 4, 4):
+            order = OrderFactory(provider=self.provider, status=OrderStatus.COMPLETED)
+            expect(self.review(order, rating).status_code).to(equal(200))
+
+        summary = self.summary()
+        expect(summary.rating_count).to(equal(3))
+        expect(summary.average_rating).to(equal(4.33))
+        expect(summary.rating_counts).to(equal({'1': 0, '2': 0, '3': 0, '4': 2, '5': 1}))
+
+    def test_rerating_replaces_previous_rating(self):
+        order = OrderFactory(provider=self.provider, status=OrderStatus.COMPLETED, rating=2)
+        ProviderRatingSummary.record_rating(self.provider.id, 2)
+
+        expect(self.review(order, 5).status_code).to(equal(200))
+        summary = self.summary()
+        expect(summary.rating_count).to(equal(1))
+        expect(summary.rating_counts).to(equal({'1': 0, '2': 0, '3': 0, '4': 0, '5': 1}))
+
+    def test_invalid_rating_is_rejected(self):
+        order = OrderFactory(provider=self.provider, status=OrderStatus.COMPLETED)
+        expect(self.review(order, 9).status_code).to(equal(400))
+        expect(ProviderRatingSummary.objects.filter(provider=self.provider).first()).to(be_none)
+
+    def test_review_is_counted_once(self):
+        order = OrderFactory(provider=self.provider, status=OrderStatus.COMPLETED)
+        with CaptureQueriesContext(connection) as queries:
+            expect(self.review(order, 4).status_code).to(equal(200))
+        expect(self.review(order, 5).status_code).to(equal(400))
+
+        expect(self.summary().rating_count).to(equal(1))
+        if connection.features.has_select_for_update:
+            # The checks read the order under a row lock, so concurrent reviews queue up
+            expect([query['sql'] for query in queries if 'FOR UPDATE' in query['sql']]).to(have_len(1))
+
+    def test_completing_a_rated_order_counts_it(self):
+        order = OrderFactory(provider=self.provider, status=OrderStatus.ACCEPTED, rating=3)
+        url = reverse('order-status-update', args=[order.id])
+        expect(self.client.patch(url, {'status': OrderStatus.COMPLETED}, format='json').status_code).to(equal(200))
+        expect(self.summary().rating_counts['3']).to(equal(1))
+
+    def test_rebuild_matches_incremental(self):
+        for rating in (1, 5, 5):
+            order = OrderFactory(provider=self.provider, status=OrderStatus.COMPLETED)
+            self.review(order, rating)
+        OrderFactory(provider=self.provider, status=OrderStatus.CANCELLED, rating=1)
+        incremental = self.summary()
+
+        ProviderRatingSummary.rebuild()
+        rebuilt = self.summary()
+        expect(rebuilt.rating_counts).to(equal(incremental.rating_counts))
+        expect(rebuilt.average_rating).to(equal(incremental.average_rating))
+
+    def test_serializer_reads_summary(self):
+        provider_service = ProviderServiceFactory(provider=self.provider)
+        order = OrderFactory(provider=self.provider, status=OrderStatus.COMPLETED)
+        self.review(order, 4)
+
+        url = reverse('subservice-providers', args=[provider_service.sub_service_id])
+        response = self.client.get(url, {
+            'latitude': self.provider.latitude, 'longitude': self.provider.longitude
+        })
+        expect(response.data[0]['provider_rating']).to(equal(4.0))
+        expect(response.data[0]['rating_counts']['4']).to(equal(1))
+
+
+class TestImageDelivery(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.order = OrderFactory()
+        self.order.service.image.save('service.jpg', ContentFile(b'\xff\xd8' + bytes(range(256)) * 4))
+
+    def list_orders(self, **params):
+        url = reverse('order-create-list')
+        return self.client.get(url, {'client_id': self.order.user_id, **params})
+
+    def image_url(self):
+        return self.list_orders(image_format='url').data[0]['service_image']
+
+    def test_images_are_inlined_by_default(self):
+        expect(self.list_orders().data[0]['service_image']).to(start_with('data:image/jpg;base64,'))
+
+    def test_clients_can_opt_in_to_urls(self):
+        expect(self.image_url()).to(contain('/media/v/'))
+        url = reverse('order-create-list')
+        response = self.client.get(url, {'client_id': self.order.user_id}, HTTP_X_IMAGE_FORMAT='url')
+        expect(response.data[0]['service_image']).to(equal(self.image_url()))
+
+    def test_image_is_served_with_cache_headers(self):
+        response = self.client.get(self.image_url())
+        expect(response.status_code).to(equal(200))
+        expect(response['Cache-Control']).to(contain('immutable'))
+        expect(response['Accept-Ranges']).to(equal('bytes'))
+        expect(response.content).to(equal(self.order.service.image.open('rb').read()))
+
+        cached = self.client.get(self.image_url(), HTTP_IF_NONE_MATCH=response['ETag'])
+        expect(cached.status_code).to(equal(304))
+
+    def test_range_requests(self):
+        response = self.client.get(self.image_url(), HTTP_RANGE='bytes=0-9')
+        expect(response.status_code).to(equal(206))
+        expect(len(response.content)).to(equal(10))
+        expect(response['Content-Range']).to(equal('bytes 0-9/1026'))
+
+        expect(self.client.get(self.image_url(), HTTP_RANGE='bytes=5000-').status_code).to(equal(416))
+
+    def test_replaced_image_gets_a_new_url(self):
+        old_url = self.image_url()
+        name = self.order.service.image.name
+        default_storage.delete(name)
+        default_storage.save(name, ContentFile(b'\xff\xd8replaced'))
+
+        expect(self.image_url()).not_to(equal(old_url))
+        expect(self.client.get(old_url).status_code).to(equal(404))
+
+
+class TestDataURICache(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        data_uri_cache.clear()
+        self.names = [
+            default_storage.save(f'services/cache_{i}.jpg', ContentFile(bytes([i]) * 300))
+            for i in range(3)
+        ]
+
+    def test_order_list_reuses_encoded_images(self):
+        order = OrderFactory()
+        order.service.image.save('icon.jpg', ContentFile(b'\xff\xd8icon'))
+        OrderFactory.create_batch(4, user=order.user, provider=order.provider)
+
+        url = reverse('order-create-list')
+        response = self.client.get(url, {'client_id': order.user_id})
+        expect(len({item['service_image'] for item in response.data})).to(equal(1))
+
+        stats = data_uri_cache.stats()
+        expect(stats['misses']).to(equal(1))
+        expect(stats['hits']).to(equal(4))
+
+    def test_replaced_file_is_a_miss(self):
+        cache = DataURICache(max_bytes=10000)
+        first = cache.get(self.names[0])
+        default_storage.delete(self.names[0])
+        default_storage.save(self.names[0], ContentFile(b'changed'))
+
+        expect(cache.get(self.names[0])).not_to(equal(first))
+        expect(cache.stats()['misses']).to(equal(2))
+        expect(cache.stats()['entries']).to(equal(1))
+
+    def test_evicts_least_recently_used_within_byte_cap(self):
+        entry_size = len(encode_data_uri(self.names[0]))
+        cache = DataURICache(max_bytes=entry_size * 2)
+        cache.get(self.names[0])
+        cache.get(self.names[1])
+        cache.get(self.names[0])
+        cache.get(self.names[2])
+
+        stats = cache.stats()
+        expect(stats['evictions']).to(equal(1))
+        expect(stats['bytes']).to(equal(entry_size * 2))
+        cache.get(self.names[0])
+        expect(cache.stats()['hits']).to(equal(2))
+        cache.get(self.names[1])
+        expect(cache.stats()['misses']).to(equal(4))
+
+
+class TestOrderListingQueryCount(APITestCase):
+    # Orders, their items with sub-services, and their status history
+    LISTING_QUERIES = 3
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('order-create-list')
+        self.user = ClientFactory()
+        self.provider = ServiceProviderFactory()
+        self.provider_services = ProviderServiceFactory.create_batch(2, provider=self.provider)
+
+    def add_orders(self, count):
+        for _ in range(count):
+            order = OrderFactory(user=self.user, provider=self.provider)
+            for provider_service in self.provider_services:
+                OrderItemFactory(order=order, provider_service=provider_service)
+            OrderStatusHistoryFactory(order=order, status=OrderStatus.PENDING)
+            OrderStatusHistoryFactory(order=order, status=OrderStatus.ACCEPTED)
+
+    def count_queries(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        expect(response.status_code).to(equal(200))
+        return len(queries), response.data
+
+    def test_query_count_is_fixed(self):
+        added = 0
+        for count in (1, 50, 500):
+            self.add_orders(count - added)
+            added = count
+            for params in ({'client_id': self.user.id}, {'provider_id': self.provider.id}):
+                queries, data = self.count_queries(params)
+                expect(len(data)).to(equal(count))
+                expect(queries).to(equal(self.LISTING_QUERIES))
+
+    def test_listing_matches_per_order_serialization(self):
+        self.add_orders(3)
+        _, data = self.count_queries({'client_id': self.user.id})
+        expected = OrderSerializer(Orders.objects.filter(user=self.user), many=True).data
+
+        def normalized(rows):
+            return sorted(
+                ({**row, 'status_history': sorted(row['status_history'], key=lambda entry: str(entry['id'])),
+                  'items': sorted(row['items'], key=lambda item: str(item['id']))} for row in rows),
+                key=lambda row: str(row['id'])
+            )
+
+        expect(normalized(data)).to(equal(normalized(expected)))
+        names = {provider_service.id: provider_service.sub_service.name for provider_service in self.provider_services}
+        for item in data[0]['items']:
+            expect(item['sub_service_name']).to(equal(names[item['provider_service']]))
+
+
+class TestOrderHistoryPagination(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('order-create-list')
+        self.user = ClientFactory()
+        self.provider = ServiceProviderFactory()
+        self.now = timezone.now().replace(microsecond=0)
+        self.orders = []
+        for day in range(25):
+            status = OrderStatus.COMPLETED if day % 3 == 0 else OrderStatus.PENDING
+            self.orders.append(self.add_order(self.now - timedelta(days=day), status))
+        # Same timestamp as another order: the id breaks the tie
+        self.orders.append(self.add_order(self.now - timedelta(days=4), OrderStatus.PENDING))
+        self.orders.sort(key=lambda order: (order.ordered_on, order.id), reverse=True)
+
+    def add_order(self, ordered_on, status):
+        order = OrderFactory(user=self.user, provider=self.provider, status=status)
+        Orders.objects.filter(id=order.id).update(ordered_on=ordered_on)
+        order.ordered_on = ordered_on
+        return order
+
+    def walk(self, **params):
+        ids, pages = [], 0
+        response = self.client.get(self.url, {'provider_id': self.provider.id, 'limit': 10, **params})
+        while True:
+            expect(response.status_code).to(equal(200))
+            pages += 1
+            ids += [row['id'] for row in response.data['data']['results']]
+            if not response.data['data']['next']:
+                return ids, pages
+            response = self.client.get(response.data['data']['next'])
+
+    def test_pages_walk_history_newest_first(self):
+        ids, pages = self.walk()
+        expect(ids).to(equal([str(order.id) for order in self.orders]))
+        expect(pages).to(equal(3))
+
+    def test_deep_pages_cost_the_same_and_skip_count(self):
+        first = self.client.get(self.url, {'client_id': self.user.id, 'limit': 5})
+        cursor = first.data['data']['next']
+        for _ in range(3):
+            cursor = self.client.get(cursor).data['data']['next']
+
+        with CaptureQueriesContext(connection) as first_page:
+            self.client.get(self.url, {'client_id': self.user.id, 'limit': 5})
+        with CaptureQueriesContext(connection) as deep_page:
+            response = self.client.get(cursor)
+        expect(len(response.data['data']['results'])).to(equal(5))
+        expect(len(deep_page)).to(equal(len(first_page)))
+        expect([query['sql'] for query in deep_page if 'COUNT(' in query['sql'].upper()]).to(equal([]))
+
+    def test_status_and_date_filters(self):
+        ids, _ = self.walk(status=OrderStatus.COMPLETED)
+        expect(ids).to(equal([str(order.id) for order in self.orders if order.status == OrderStatus.COMPLETED]))
+
+        start = (self.now - timedelta(days=6)).date().isoformat()
+        end = (self.now - timedelta(days=2)).date().isoformat()
+        ids, _ = self.walk(ordered_from=start, ordered_to=end)
+        expected = [
+            str(order.id) for order in self.orders
+            if start <= order.ordered_on.date().isoformat() <= end
+        ]
+        expect(ids).to(equal(expected))
+        expect(ids).to(have_len(6))
+
+    def test_invalid_parameters(self):
+        params = {'provider_id': self.provider.id}
+        expect(self.client.get(self.url, {**params, 'status': 'lost'}).status_code).to(equal(400))
+        expect(self.client.get(self.url, {**params, 'ordered_from': 'yesterday'}).status_code).to(equal(400))
+        expect(self.client.get(self.url, {**params, 'cursor': 'not-a-cursor'}).status_code).to(equal(404))
+
+    def test_unpaged_listing_is_unchanged(self):
+        response = self.client.get(self.url, {'provider_id': self.provider.id})
+        expect(response.data).to(have_len(26))
+
+
+@skipUnless(connection.vendor == 'mysql', 'EXPLAIN output is MySQL specific')
+class TestOrderQueryPlans(TransactionTestCase):
+    """The hot order queries are served by their indexes."""
+
+    def setUp(self):
+        clients = ClientFactory.create_batch(10)
+        self.user = clients[0]
+        self.providers = ServiceProviderFactory.create_batch(2)
+        statuses = list(OrderStatus.values)
+        orders = []
+        for provider in self.providers:
+            for i in range(150):
+                status = statuses[i % len(statuses)]
+                orders.append(Orders(
+                    user=clients[i % len(clients)], provider=provider, service=provider.main_service,
+                    scheduled_on=timezone.now(), otp='123456', status=status, total_price=100,
+                    rating=i % 5 + 1 if status == OrderStatus.COMPLETED and i % 2 else None,
+                ))
+        Orders.objects.bulk_create(orders)
+        OrderStatusHistory.objects.bulk_create([
+            OrderStatusHistory(order=order, status=status)
+            for order in orders for status in (OrderStatus.PENDING, order.status)
+        ])
+        analyze_tables(Orders, OrderStatusHistory)
+
+    def test_provider_orders_by_status(self):
+        queryset = Orders.objects.filter(provider=self.providers[0], status=OrderStatus.COMPLETED)
+        expect(used_indexes(queryset)).to(equal({'order_provider_status_idx'}))
+
+    def test_order_history_pages(self):
+        for field, value in (('user', self.user), ('provider', self.providers[0])):
+            queryset = Orders.objects.filter(**{field: value}).order_by('-ordered_on', '-id')[:20]
+            tables, filesort = query_plan(queryset)
+            expect(tables[0]['key']).to(equal(f'order_{field}_history_idx'))
+            expect(filesort).to(be(False))
+
+    def test_rating_aggregate_reads_only_the_index(self):
+        queryset = Orders.objects.filter(status=OrderStatus.COMPLETED, rating__isnull=False).values(
+            'provider_id'
+        ).annotate(rating_count=Count('id'), rating_total=Sum('rating')).order_by()
+        tables, _ = query_plan(queryset)
+        expect({'order_status_rating_idx', 'order_provider_status_idx'}).to(contain(tables[0]['key']))
+        expect(tables[0]['using_index']).to(be(True))
+
+    def test_completion_date_lookup(self):
+        order = Orders.objects.filter(status=OrderStatus.COMPLETED).first()
+        queryset = OrderStatusHistory.objects.filter(order=order, status=OrderStatus.COMPLETED).values('changed_on')
+        tables, _ = query_plan(queryset)
+        expect(tables[0]['key']).to(equal('order_history_status_idx'))
+        expect(tables[0]['using_index']).to(be(True))
 
-# Create your tests here.
@@ -3,11 +3,66 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django.shortcuts import get_object_or_404
-from .models import Orders, OrderStatus
-from .serializers import OrderSerializer
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
+from server.pagination import KeysetPagination
+from .models import Orders, OrderStatus, ProviderRatingSummary
+from .serializers import OrderSerializer, order_listing_queryset
 from notifications.kafka_producer import NotificationProducer
-from notifications.models import NotificationType,Notification
-from notifications.utils import send_notification
+from notifications.models import NotificationType
+from notifications.outbox import create_notification
+
+class OrderHistoryPagination(KeysetPagination):
+    """Newest orders first; ``limit`` per page, ``cursor`` for the next one."""
+    ordering = ('-ordered_on', '-id')
+
+
+def _order_date_bound(value, upper):
+    """
+    (lookup, datetime) bounding ordered_on by an ISO datetime, or by an ISO
+    date, which covers that whole day. Both bounds are inclusive.
+    """
+    # parse_datetime() also reads a bare date, as midnight, so dates go first
+    day = parse_date(value)
+    if day is not None:
+        if upper:
+            day += timedelta(days=1)
+        moment = datetime.combine(day, time.min)
+        lookup = 'ordered_on__lt' if upper else 'ordered_on__gte'
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError
+        lookup = 'ordered_on__lte' if upper else 'ordered_on__gte'
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return lookup, moment
+
+
+def filter_orders(orders, params):
+    """
+    Apply the order history filters: ``status`` (comma separated) and the
+    ``ordered_from`` / ``ordered_to`` range. Raises ValueError with a
+    message for invalid values.
+    """
+    statuses = [value for value in params.get('status', '').split(',') if value]
+    if statuses:
+        invalid = set(statuses) - set(OrderStatus.values)
+        if invalid:
+            raise ValueError(f"Invalid status: {', '.join(sorted(invalid))}")
+        orders = orders.filter(status__in=statuses)
+
+    for param, upper in (('ordered_from', False), ('ordered_to', True)):
+        if params.get(param):
+            try:
+                lookup, bound = _order_date_bound(params[param], upper)
+            except ValueError:
+                raise ValueError(f'{param} must be an ISO 8601 date or datetime')
+            orders = orders.filter(**{lookup: bound})
+    return orders
+
 
 class OrderCreateListView(APIView):
     permission_classes = [AllowAny]  
@@ -17,41 +72,49 @@ class OrderCreateListView(APIView):
         client_id = request.query_params.get('client_id')
         print(client_id)
         if client_id:
-            orders = Orders.objects.filter(user_id=client_id)
-            serializer = OrderSerializer(orders, many=True)
-            return Response(serializer.data)
+            return self.list_orders(request, Orders.objects.filter(user_id=client_id))
             
         # Filter by provider_id
         provider_id = request.query_params.get('provider_id')
         print(provider_id)
         if provider_id:
-            orders = Orders.objects.filter(provider_id=provider_id)
-            serializer = OrderSerializer(orders, many=True)
-            return Response(serializer.data)
+            return self.list_orders(request, Orders.objects.filter(provider_id=provider_id))
         
         return Response(
             {'error': 'Either client_id or provider_id query parameter is required'},
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    def list_orders(self, request, orders):
+        try:
+            orders = order_listing_queryset(filter_orders(orders, request.query_params))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Paged when the client asks for it; existing clients still get the full list
+        paginator = OrderHistoryPagination()
+        if paginator.page_size_query_param in request.query_params or paginator.cursor_query_param in request.query_params:
+            page = paginator.paginate_queryset(orders, request, view=self)
+            serializer = OrderSerializer(page, many=True, context={'request': request})
+            return paginator.get_paginated_response(serializer.data)
+
+        serializer = OrderSerializer(orders, many=True, context={'request': request})
+        return Response(serializer.data)
     
     def post(self, request):
         serializer = OrderSerializer(data=request.data)
         if serializer.is_valid():
-            order = serializer.save()
-            
-            provider_id = order.provider.id
-            try:
-                notification = Notification.objects.create(
+            # The notification is queued with the order; the relay delivers it
+            with transaction.atomic():
+                order = serializer.save()
+                create_notification(
                     recipient_client_id=order.user.id,
-                    recipient_provider_id=provider_id,
+                    recipient_provider_id=order.provider.id,
                     notification_type=NotificationType.NEW_ORDER,
                     message=f"New order received from {order.user.name} for {order.service.name}",
                     order_id=order.id
                 )
-                send_notification(notification)
-            except Exception as e:
-                print(f"Error creating notification: {str(e)}")
-            
+
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -59,7 +122,6 @@ class OrderStatusUpdateView(APIView):
     permission_classes = [AllowAny]
     
     def patch(self, request, order_id):
-        order = get_object_or_404(Orders, id=order_id)
         new_status = request.data.get('status')
         
         # Validate status transition
@@ -70,69 +132,58 @@ class OrderStatusUpdateView(APIView):
             OrderStatus.CANCELLED: [], # No further transitions allowed
             OrderStatus.REJECTED: [] # No further transitions allowed
         }
-        
-        if new_status not in valid_transitions.get(order.status, []):
-            return Response(
-                {'error': 'Invalid status transition'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Update order status and create history entry
-        old_status = order.status
-        order.status = new_status
-        order.save()
-        
-        # Create status history entry
-        order.status_history.create(status=new_status)
-        
-        # Send notification to client based on the status change
-        notification_type = None
-        message = ""
-        
-        if new_status == OrderStatus.ACCEPTED:
+
+        with transaction.atomic():
+            # Locked so concurrent updates validate against each other's result
+            order = get_object_or_404(Orders.objects.select_for_update(), id=order_id)
+
+            if new_status not in valid_transitions.get(order.status, []):
+                return Response(
+                    {'error': 'Invalid status transition'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # Notify the client of the status change
+            notification_type = None
+            message = ""
+
+            if new_status == OrderStatus.ACCEPTED:
                 notification_type = NotificationType.ORDER_ACCEPTED
                 message = f"Your {order.service.name} order has been accepted by {order.provider.full_name}."
-        elif new_status == OrderStatus.REJECTED:
-            notification_type = NotificationType.ORDER_REJECTED
-            message = f"Your {order.service.name} order has been rejected by {order.provider.full_name}."
-        elif new_status == OrderStatus.COMPLETED:
-            notification_type = NotificationType.ORDER_COMPLETED
-            message = f"Your {order.service.name} order with {order.provider.full_name} has been marked as completed."
-        
-        if notification_type and order.user:
-            # Create notification for the client
-            notification = Notification.objects.create(
-                recipient_client=order.user,
-                notification_type=notification_type,
-                message=message,
-                order_id=order.id
-            )
-            # Send real-time notification via WebSocket
-            send_notification(notification)
-        
-        serializer = OrderSerializer(order)
+            elif new_status == OrderStatus.REJECTED:
+                notification_type = NotificationType.ORDER_REJECTED
+                message = f"Your {order.service.name} order has been rejected by {order.provider.full_name}."
+            elif new_status == OrderStatus.COMPLETED:
+                notification_type = NotificationType.ORDER_COMPLETED
+                message = f"Your {order.service.name} order with {order.provider.full_name} has been marked as completed."
+
+            # Update order status and create history entry
+            order.status = new_status
+            order.save()
+
+            # Create status history entry
+            order.status_history.create(status=new_status)
+
+            # A rating only counts towards the provider once the order is completed
+            if new_status == OrderStatus.COMPLETED and order.rating:
+                ProviderRatingSummary.record_rating(order.provider_id, order.rating)
+
+            # Queued with the status change; the relay sends it over the WebSocket
+            if notification_type and order.user:
+                create_notification(
+                    recipient_client=order.user,
+                    notification_type=notification_type,
+                    message=message,
+                    order_id=order.id
+                )
+
+        serializer = OrderSerializer(order, context={'request': request})
         return Response(serializer.data)
     
 class OrderReviewUpdateView(APIView):
     permission_classes = [AllowAny]
     
     def patch(self, request, order_id):
-        order = get_object_or_404(Orders, id=order_id)
-        
-        # Check if order is completed
-        if order.status != OrderStatus.COMPLETED:
-            return Response(
-                {'error': 'Only completed orders can be reviewed'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Check if review already exists
-        if order.rating and order.review:
-            return Response(
-                {'error': 'Review already submitted for this order'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
         # Validate rating
         rating = request.data.get('rating')
         review = request.data.get('review')
@@ -142,11 +193,41 @@ class OrderReviewUpdateView(APIView):
                 {'error': 'Both rating and review are required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+        try:
+            rating = int(rating)
+        except (TypeError, ValueError):
+            rating = None
+        if rating not in ProviderRatingSummary.STAR_FIELDS:
+            return Response(
+                {'error': 'Rating must be between 1 and 5'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with transaction.atomic():
+            # Locked so two reviews of one order cannot both be counted
+            order = get_object_or_404(Orders.objects.select_for_update(), id=order_id)
+
+            # Check if order is completed
+            if order.status != OrderStatus.COMPLETED:
+                return Response(
+                    {'error': 'Only completed orders can be reviewed'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # Check if review already exists
+            if order.rating and order.review:
+                return Response(
+                    {'error': 'Review already submitted for this order'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # Update order with review and rating
+            previous_rating = order.rating
+            order.rating = rating
+            order.review = review
+            order.save()
+            ProviderRatingSummary.record_rating(order.provider_id, rating, previous_rating)
         
-        # Update order with review and rating
-        order.rating = rating
-        order.review = review
-        order.save()
-        
-        serializer = OrderSerializer(order)
+        serializer = OrderSerializer(order, context={'request': request})
         return Response(serializer.data)
\ No newline at end of file
@@ -16,4 +16,9 @@ application = ProtocolTypeRouter({
     "websocket": AuthMiddlewareStack(
         URLRouter(combined_patterns)
     ),
-})
\ No newline at end of file
+})
+
+# Load the face verification models while the worker starts, not on the first request
+from service_provider.face_models import face_models  # noqa: E402
+
+face_models.start()
@@ -0,0 +1,51 @@
+"""
+Summaries of MySQL query plans, for checking that the hot queries are
+served by the indexes meant for them.
+"""
+import json
+
+from django.db import connection
+
+
+def query_plan(queryset):
+    """
+    Summarise the queryset's EXPLAIN FORMAT=JSON plan. Returns (tables,
+    using_filesort): one dict per table access with its access type, the
+    index used and whether the index alone covers the query, and whether
+    any step sorts rows with a filesort.
+    """
+    plan = json.loads(queryset.explain(format='json'))
+    tables = []
+    filesort = False
+
+    def walk(node):
+        nonlocal filesort
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+        elif isinstance(node, dict):
+            filesort = filesort or bool(node.get('using_filesort'))
+            if 'table_name' in node:
+                tables.append({
+                    'table': node['table_name'],
+                    'access_type': node.get('access_type'),
+                    'key': node.get('key'),
+                    'using_index': bool(node.get('using_index')),
+                })
+            for value in node.values():
+                walk(value)
+
+    walk(plan)
+    return tables, filesort
+
+
+def used_indexes(queryset):
+    return {table['key'] for table in query_plan(queryset)[0] if table['key']}
+
+
+def analyze_tables(*models):
+    """Refresh the optimizer statistics of the models' tables. Commits the current transaction."""
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(f'ANALYZE TABLE {connection.ops.quote_name(model._meta.db_table)}')
+            cursor.fetchall()
@@ -0,0 +1,278 @@
+"""
+Shared image serialization and delivery.
+
+Images are inlined in API responses as base64 data URIs by default. Clients
+can opt in to URLs instead with ``?image_format=url`` or an
+``X-Image-Format: url`` header. Those URLs are content-addressed
+(/media/v/<sha256>/<name>), so they can be cached forever and are served
+with ETag, immutable Cache-Control and byte Range support.
+
+Encoded data URIs are kept in a per-process LRU cache (data_uri_cache) so
+the same images are not re-read and re-encoded on every list request.
+
+Images are served as uploaded unless the client asks for a fixed rendition
+(see server.renditions) with ``?image_rendition=thumb|card|full``.
+"""
+import base64
+import hashlib
+import mimetypes
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.urls import reverse
+from django.views.decorators.http import require_safe
+from rest_framework import serializers
+
+from .renditions import RENDITIONS, preferred_format, rendition_for
+
+IMAGE_FORMAT_PARAM = 'image_format'
+IMAGE_FORMAT_HEADER = 'HTTP_X_IMAGE_FORMAT'
+IMAGE_RENDITION_PARAM = 'image_rendition'
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+DEFAULT_DATA_URI_CACHE_BYTES = 32 * 1024 * 1024
+
+
+def wants_image_urls(request):
+    """True when the client asked for image URLs instead of inline data URIs."""
+    if request is None:
+        return False
+    value = request.GET.get(IMAGE_FORMAT_PARAM) or request.META.get(IMAGE_FORMAT_HEADER)
+    return value == 'url'
+
+
+@lru_cache(maxsize=4096)
+def _content_hash(name, size, modified):
+    digest = hashlib.sha256()
+    with default_storage.open(name, 'rb') as image_file:
+        for chunk in image_file.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+def image_version(name, storage=default_storage):
+    """
+    Content hash of a stored image. Hashes are memoized per (name, size,
+    mtime) so the file is only read again after it changes.
+    """
+    return _content_hash(name, storage.size(name), storage.get_modified_time(name))
+
+
+def encode_data_uri(name, storage=default_storage):
+    """Read a stored image and encode it as a data URI."""
+    with storage.open(name, 'rb') as image_file:
+        encoded_string = base64.b64encode(image_file.read()).decode()
+    return f'data:image/{name.split(".")[-1]};base64,{encoded_string}'
+
+
+class DataURICache:
+    """
+    LRU cache of encoded data URIs keyed by storage name. Each entry
+    remembers the (size, mtime) it was encoded from, so a replaced file is
+    a miss and its stale entry is overwritten rather than kept alongside.
+    The total size of cached strings is capped at max_bytes.
+    """
+
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'IMAGE_DATA_URI_CACHE_BYTES', DEFAULT_DATA_URI_CACHE_BYTES)
+
+    def get(self, name, storage=default_storage):
+        version = (storage.size(name), storage.get_modified_time(name))
+        key = (id(storage), name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Encode outside the lock so slow reads do not serialize requests
+        value = encode_data_uri(name, storage)
+        self._store(key, version, value)
+        return value
+
+    def _store(self, key, version, value):
+        max_bytes = self.max_bytes
+        if len(value) > max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous[1])
+            self._entries[key] = (version, value)
+            self.bytes += len(value)
+            while self.bytes > max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+data_uri_cache = DataURICache()
+
+
+def image_data_uri(name, storage=default_storage):
+    """Data URI for a stored image, served from data_uri_cache when unchanged."""
+    return data_uri_cache.get(name, storage)
+
+
+def versioned_image_url(name, request=None, storage=default_storage):
+    """Content-addressed URL for a stored image."""
+    url = reverse('versioned-image', kwargs={
+        'version': image_version(name, storage),
+        'name': name,
+    })
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def requested_rendition(request, default=None):
+    """The rendition asked for by the client, or the field's default."""
+    if request is not None:
+        rendition = request.GET.get(IMAGE_RENDITION_PARAM)
+        if rendition == 'original':
+            return None
+        if rendition in RENDITIONS:
+            return rendition
+    return default
+
+
+def image_representation(value, request=None, rendition=None):
+    """
+    Serialize an image field as a data URI, or a URL if the client opted in.
+    ``rendition`` picks a resized copy (WebP when the client accepts it).
+    """
+    if not value:
+        return None
+    try:
+        name = value.name
+        rendition = requested_rendition(request, rendition)
+        if rendition:
+            name = rendition_for(name, rendition, preferred_format(request), value.storage)
+        if wants_image_urls(request):
+            return versioned_image_url(name, request, value.storage)
+        return image_data_uri(name, value.storage)
+    except Exception:
+        return None
+
+
+class Base64ImageField(serializers.ImageField):
+    def __init__(self, *args, rendition=None, **kwargs):
+        self.rendition = rendition
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('data:image'):
+            # Get the base64 data after the comma
+            format, imgstr = data.split(';base64,')
+            ext = format.split('/')[-1]
+
+            # Convert base64 to file
+            data = ContentFile(base64.b64decode(imgstr), name=f'temp.{ext}')
+
+        return super().to_internal_value(data)
+
+    def to_representation(self, value):
+        return image_representation(value, self.context.get('request'), self.rendition)
+
+
+def _parse_range(header, size):
+    """Return (start, end) for a single 'bytes=' range, None if absent, or raise ValueError."""
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        raise ValueError(header)
+    start, end = match.groups()
+    if start == '':
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+@require_safe
+def serve_versioned_image(request, version, name):
+    """Serve a content-addressed image with long-lived caching headers."""
+    try:
+        if not default_storage.exists(name):
+            raise Http404('Image not found')
+        current_version = image_version(name)
+    except SuspiciousFileOperation:
+        raise Http404('Image not found')
+    if current_version != version:
+        # The image was replaced; old URLs are not served stale content
+        raise Http404('Image version not found')
+
+    etag = f'"{version}"'
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Cache-Control'] = CACHE_CONTROL
+        return response
+
+    with default_storage.open(name, 'rb') as image_file:
+        content = image_file.read()
+    size = len(content)
+
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    try:
+        byte_range = _parse_range(request.META.get('HTTP_RANGE'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = HttpResponse(content, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = HttpResponse(content[start:end + 1], content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['ETag'] = etag
+    response['Cache-Control'] = CACHE_CONTROL
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,43 @@
+"""
+Deferred imports for heavy libraries.
+
+``cv2 = lazy_module('cv2')`` binds a stand-in that imports the real module
+the first time one of its attributes is used. Modules on the URL-conf
+import path can then refer to OpenCV, DeepFace or TensorFlow without every
+API, ASGI and management-command process loading them at startup.
+"""
+import importlib
+import threading
+
+
+class LazyModule:
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            with self.__dict__['_lock']:
+                module = self.__dict__['_module']
+                if module is None:
+                    module = self.__dict__['_module'] = importlib.import_module(self.__dict__['_name'])
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def __delattr__(self, attribute):
+        delattr(self._load(), attribute)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
@@ -1,5 +1,31 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(position):
+    """Encode a keyset position (a list of JSON values) as an opaque cursor."""
+    payload = json.dumps(position, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, raising NotFound if it is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError):
+        raise NotFound('Invalid cursor')
+    if not isinstance(position, list):
+        raise NotFound('Invalid cursor')
+    return position
+
 
 class CustomPagination(PageNumberPagination):
     page_size = 10 
@@ -17,3 +43,99 @@ class CustomPagination(PageNumberPagination):
                 'results': data
             }
         })
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a unique ordering of model fields.
+
+    The cursor holds the ordering values of the last row served, and the
+    next page is the range that follows it (WHERE ordered_on <= x AND
+    (ordered_on < x OR id < y) ... LIMIT n + 1). With an index on the
+    ordering, page N costs the same as page 1, and no COUNT query is run.
+    Subclasses set ``ordering``, whose last field must be unique.
+    """
+    ordering = ('-id',)
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    @staticmethod
+    def _field(ordering_field):
+        return ordering_field.lstrip('-'), ordering_field.startswith('-')
+
+    def decode_position(self, queryset, cursor):
+        position = decode_cursor(cursor)
+        if len(position) != len(self.ordering):
+            raise NotFound('Invalid cursor')
+        values = []
+        for ordering_field, value in zip(self.ordering, position):
+            name, _ = self._field(ordering_field)
+            try:
+                values.append(queryset.model._meta.get_field(name).to_python(value))
+            except ValidationError:
+                raise NotFound('Invalid cursor')
+        return values
+
+    def encode_position(self, row):
+        position = []
+        for ordering_field in self.ordering:
+            value = getattr(row, self._field(ordering_field)[0])
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            elif not isinstance(value, (int, float, str)):
+                value = str(value)
+            position.append(value)
+        return encode_cursor(position)
+
+    def after(self, position):
+        """Q for the rows that come after ``position`` in the ordering."""
+        fields = [self._field(ordering_field) for ordering_field in self.ordering]
+        after = Q()
+        # Row-value comparison spelled out: (a > x) OR (a = x AND b > y) ...
+        for depth in range(len(fields) - 1, -1, -1):
+            name, descending = fields[depth]
+            step = Q(**{f"{name}__{'lt' if descending else 'gt'}": position[depth]})
+            after = step if depth == len(fields) - 1 else step | (Q(**{name: position[depth]}) & after)
+        # Bound the leading field on its own so the database can range-scan the index
+        name, descending = fields[0]
+        return Q(**{f"{name}__{'lte' if descending else 'gte'}": position[0]}) & after
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_position(queryset, cursor)))
+
+        page_size = self.get_page_size(request)
+        # One extra row says whether there is a next page
+        rows = list(queryset[:page_size + 1])
+        self.next_link = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_link = replace_query_param(
+                request.build_absolute_uri(), self.cursor_query_param, self.encode_position(rows[-1])
+            )
+        return rows
+
+    def get_next_link(self):
+        return self.next_link
+
+    def get_paginated_response(self, data):
+        return Response({
+            'status': True,
+            'message': 'Data retrieved successfully',
+            'data': {
+                'next': self.next_link,
+                'results': data
+            }
+        })
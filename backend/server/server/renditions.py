@@ -0,0 +1,228 @@
+"""
+Fixed-size image renditions generated at upload time.
+
+Every uploaded image gets a thumb, card and full rendition, each stored as
+WebP and as a JPEG fallback next to the original:
+
+    providers/alice.png -> providers/renditions/alice.png.thumb.webp
+                           providers/renditions/alice.png.thumb.jpg
+                           ...
+
+The original's extension is kept in the name so alice.png and alice.jpg do
+not share renditions.
+
+Renditions never upscale. Each one is written to a temporary file and
+renamed over the previous version, so readers never see a missing or half
+written rendition and concurrent writers cannot leave suffixed copies.
+Readers fall back to the original file when a
+rendition has not been generated yet.
+
+Saving a model only renders the image fields whose file changed, and the
+rendering runs on a small background thread pool once the transaction
+commits, never in the request that uploaded the image.
+"""
+import io
+import logging
+import os
+import posixpath
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_init, post_save
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = 'renditions'
+
+# Bounding boxes in pixels; the aspect ratio is preserved
+RENDITIONS = {
+    'thumb': (96, 96),
+    'card': (400, 400),
+    'full': (1280, 1280),
+}
+
+# Background threads rendering uploads in each process
+RENDITION_THREADS = 2
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def rendition_name(name, rendition, ext):
+    """Storage name of one rendition of the image stored at ``name``."""
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, RENDITION_DIR, f'{filename}.{rendition}.{ext}')
+
+
+def is_rendition(name):
+    return posixpath.basename(posixpath.dirname(name)) == RENDITION_DIR
+
+
+def render(data):
+    """Render every rendition of an encoded image. Returns {(rendition, ext): bytes}."""
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    outputs = {}
+    for rendition, size in RENDITIONS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        for ext, (image_format, options) in FORMATS.items():
+            if image_format == 'JPEG' and resized.mode == 'RGBA':
+                # JPEG has no alpha channel; flatten onto white
+                flattened = Image.new('RGB', resized.size, (255, 255, 255))
+                flattened.paste(resized, mask=resized.getchannel('A'))
+                frame = flattened
+            else:
+                frame = resized
+            buffer = io.BytesIO()
+            frame.save(buffer, image_format, **options)
+            outputs[rendition, ext] = buffer.getvalue()
+    return outputs
+
+
+def renditions_current(name, storage=default_storage):
+    """True when every rendition exists and is not older than the original."""
+    modified = storage.get_modified_time(name)
+    for rendition in RENDITIONS:
+        for ext in FORMATS:
+            target = rendition_name(name, rendition, ext)
+            if not storage.exists(target) or storage.get_modified_time(target) < modified:
+                return False
+    return True
+
+
+def write_atomically(path, content, mode=0o644):
+    """Replace the file at ``path`` with ``content`` in one rename."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            output.write(content)
+        os.chmod(temp, mode)
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.unlink(temp)
+        raise
+
+
+def _write(storage, target, content):
+    try:
+        path = storage.path(target)
+    except NotImplementedError:
+        # Remote storages have no rename; they must be configured to overwrite on save
+        return storage.save(target, ContentFile(content))
+    write_atomically(path, content, getattr(storage, 'file_permissions_mode', None) or 0o644)
+    return target
+
+
+def generate_renditions(name, storage=default_storage, force=False):
+    """Generate the renditions of a stored image. Returns the names written."""
+    if not force and renditions_current(name, storage):
+        return []
+
+    with storage.open(name, 'rb') as image_file:
+        outputs = render(image_file.read())
+
+    return [
+        _write(storage, rendition_name(name, rendition, ext), content)
+        for (rendition, ext), content in outputs.items()
+    ]
+
+
+def preferred_format(request):
+    """WebP for clients that advertise it, JPEG otherwise."""
+    if request is not None and 'image/webp' in request.META.get('HTTP_ACCEPT', ''):
+        return 'webp'
+    return 'jpg'
+
+
+def rendition_for(name, rendition, ext='jpg', storage=default_storage):
+    """Storage name of a rendition, or the original name if it is missing."""
+    target = rendition_name(name, rendition, ext)
+    return target if storage.exists(target) else name
+
+
+def rendition_url(value, rendition, ext='webp'):
+    """Public URL of a rendition of an image field, falling back to the original."""
+    return value.storage.url(rendition_for(value.name, rendition, ext, value.storage))
+
+
+def read_rendition(value, rendition, ext='jpg'):
+    """Bytes of a rendition of an image field, falling back to the original."""
+    with value.storage.open(rendition_for(value.name, rendition, ext, value.storage), 'rb') as image_file:
+        return image_file.read()
+
+
+def _generate_quietly(name, storage):
+    try:
+        generate_renditions(name, storage)
+    except Exception:
+        # A bad rendition must not fail the upload; readers use the original
+        logger.exception('Could not generate renditions for %s', name)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def _submit(name, storage):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(RENDITION_THREADS, thread_name_prefix='renditions')
+        future = _executor.submit(_generate_quietly, name, storage)
+        _pending.add(future)
+    future.add_done_callback(_pending.discard)
+
+
+def wait_for_renditions(timeout=None):
+    """Block until the renditions queued so far are written."""
+    wait(list(_pending), timeout)
+
+
+# Image names as loaded from the database, per field
+_LOADED_NAMES = '_rendition_loaded_names'
+
+
+def _stored_name(instance, field):
+    # Read the raw attribute; going through the descriptor would build a FieldFile
+    value = instance.__dict__.get(field.attname)
+    return getattr(value, 'name', value) or None
+
+
+def register_renditions(model, *field_names):
+    """Generate renditions whenever one of the model's image files changes."""
+    fields = [model._meta.get_field(field_name) for field_name in field_names]
+
+    def remember(sender, instance, **kwargs):
+        instance.__dict__[_LOADED_NAMES] = {field.name: _stored_name(instance, field) for field in fields}
+
+    def handler(sender, instance, created, update_fields=None, raw=False, **kwargs):
+        if raw:
+            return
+        loaded = instance.__dict__.setdefault(_LOADED_NAMES, {})
+        for field in fields:
+            if update_fields is not None and field.name not in update_fields:
+                continue
+            value = getattr(instance, field.name)
+            name = value.name if value else None
+            if name and (created or name != loaded.get(field.name)):
+                storage = value.storage
+                transaction.on_commit(lambda name=name, storage=storage: _submit(name, storage))
+            loaded[field.name] = name
+
+    dispatch_uid = f'renditions:{model._meta.label}'
+    post_init.connect(remember, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    post_save.connect(handler, sender=model, weak=False, dispatch_uid=dispatch_uid)
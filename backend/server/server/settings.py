@@ -175,6 +175,98 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'images')
 # Ensure uploaded files have correct permissions
 FILE_UPLOAD_PERMISSIONS = 0o644
 
+# Resident provider location index used by the sub-service radius search.
+# Indexes are rebuilt after PROVIDER_INDEX_TTL seconds to pick up writes
+# made by other worker processes.
+PROVIDER_INDEX_ENABLED = True
+PROVIDER_INDEX_TTL = 300
+
+# Per-process LRU cache of encoded base64 image data URIs, capped in bytes
+IMAGE_DATA_URI_CACHE_BYTES = 32 * 1024 * 1024
+
+# Face verification (service_provider.face_models). The ML stack is imported
+# on first use. Models are loaded and warmed at worker start when PRELOAD is
+# on (FACE_VERIFICATION_PRELOAD=1, meant for the workers that serve
+# /service_providers/verify/), otherwise on the first verification. Faces are detected once
+# per image on a copy downscaled to DETECTION_MAX_SIDE. EXECUTION 'parallel'
+# sends the models to one shared pool service per host (manage.py
+# run_face_pool) with POOL_SIZE processes in total, waiting at most
+# MODEL_TIMEOUT seconds for each model; 'server' gets embeddings from the
+# batching inference server (manage.py run_inference_server) at
+# INFERENCE_SERVER. BACKEND 'tflite' runs the embedding networks from
+# converted, optionally quantized graphs (manage.py convert_face_models).
+# PRECOMPUTE_EMBEDDINGS stores the
+# embeddings of a provider's photo when it is uploaded. POLICY 'cascade'
+# stops after the first model whose answer is clear. JOB_* tune the
+# asynchronous verification queue (manage.py run_face_verification_worker); a job
+# whose worker dies JOB_MAX_ATTEMPTS times is failed instead of requeued.
+# DUPLICATE_* configure the face similarity index that flags signups
+# resembling an existing provider (manage.py build_face_index).
+FACE_VERIFICATION = {
+    'MODELS': ['VGG-Face', 'Facenet', 'ArcFace', 'Dlib'],
+    'PRELOAD': os.getenv('FACE_VERIFICATION_PRELOAD', '').lower() in ('1', 'true', 'yes'),
+    'THRESHOLD_MULTIPLIER': 1.0,
+    'DETECTION_MAX_SIDE': 640,
+    'EXECUTION': os.getenv('FACE_VERIFICATION_EXECUTION', 'serial'),
+    'POOL_SIZE': int(os.getenv('FACE_VERIFICATION_POOL_SIZE', 2)),
+    'POOL_ADDRESS': (os.getenv('FACE_POOL_HOST', '127.0.0.1'), int(os.getenv('FACE_POOL_PORT', 8765))),
+    'POOL_AUTHKEY': os.getenv('FACE_POOL_AUTHKEY'),
+    'MODEL_TIMEOUT': 30,
+    'PRECOMPUTE_EMBEDDINGS': True,
+    'INFERENCE_SERVER': os.getenv('FACE_INFERENCE_SERVER', '127.0.0.1:50051'),
+    'BATCH_MAX_SIZE': 16,
+    'BATCH_MAX_WAIT_MS': 10,
+    'INFERENCE_THREADS': 16,
+    'BACKEND': os.getenv('FACE_VERIFICATION_BACKEND', 'keras'),
+    'TFLITE_DIR': os.path.join(BASE_DIR, 'face_models_tflite'),
+    'TFLITE_QUANTIZATION': os.getenv('FACE_TFLITE_QUANTIZATION', 'dynamic'),
+    'TFLITE_THREADS': int(os.getenv('FACE_TFLITE_THREADS', os.cpu_count() or 1)),
+    'POLICY': os.getenv('FACE_VERIFICATION_POLICY', 'all'),
+    'CASCADE_ORDER': ['Facenet', 'ArcFace', 'Dlib', 'VGG-Face'],
+    'CASCADE_MARGIN': 0.25,
+    'JOB_POLL_SECONDS': 1.0,
+    'JOB_STALE_SECONDS': 300,
+    'JOB_MAX_ATTEMPTS': 3,
+    'JOB_METRICS_WINDOW': 3600,
+    'DUPLICATE_CHECK': True,
+    'DUPLICATE_MODEL': 'Facenet',
+    'DUPLICATE_TOP_K': 5,
+    'DUPLICATE_NLIST': int(os.getenv('FACE_DUPLICATE_NLIST', 0)),
+    'DUPLICATE_NPROBE': 8,
+    'DUPLICATE_INDEX_PATH': os.path.join(BASE_DIR, 'face_index', 'providers'),
+    'DUPLICATE_SYNC_SECONDS': 60,
+}
+
+# Real-time notifications are written to an outbox in the same transaction
+# as the order change and pushed to the channel layer by the relay
+# (manage.py run_notification_relay). Failed sends are retried with
+# exponential backoff from RETRY_BASE_SECONDS up to RETRY_MAX_SECONDS, and
+# given up after MAX_ATTEMPTS.
+NOTIFICATION_OUTBOX = {
+    'BATCH_SIZE': 100,
+    'POLL_SECONDS': 0.5,
+    'MAX_ATTEMPTS': 10,
+    'RETRY_BASE_SECONDS': 1.0,
+    'RETRY_MAX_SECONDS': 300,
+}
+
+# One Kafka producer per process (notifications.kafka_producer). Records are
+# batched for LINGER_MS or up to BATCH_SIZE bytes and compressed per batch.
+# Sends block for up to BLOCK_SECONDS once MAX_PENDING messages await
+# delivery, then fail; buffered messages are flushed when the process exits.
+NOTIFICATION_KAFKA = {
+    'BOOTSTRAP_SERVERS': os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'localhost:9092').split(','),
+    'TOPIC': 'notifications',
+    'LINGER_MS': 5,
+    'BATCH_SIZE': 64 * 1024,
+    'COMPRESSION': 'lz4',
+    'ACKS': 1,
+    'BUFFER_MEMORY': 32 * 1024 * 1024,
+    'MAX_PENDING': 10000,
+    'BLOCK_SECONDS': 5,
+    'CLOSE_TIMEOUT': 10,
+}
+
 # Maximum upload file size (2MB)
 MAX_UPLOAD_SIZE = 2 * 1024 * 1024
 # Default primary key field type
@@ -22,6 +22,7 @@ from django.urls import path,include
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from server.images import serve_versioned_image
 
 
 urlpatterns = [
@@ -34,6 +35,7 @@ urlpatterns = [
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('sub_services/', include('sub_service.urls')),
+    path('media/v/<str:version>/<path:name>', serve_versioned_image, name='versioned-image'),
 ]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 
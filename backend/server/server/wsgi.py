@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 
 application = get_wsgi_application()
+
+# Load the face verification models while the worker starts, not on the first request
+from service_provider.face_models import face_models  # noqa: E402
+
+face_models.start()
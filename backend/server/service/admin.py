@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from django.urls import reverse
+from server.renditions import rendition_url
 from django.db.models import Count
 from django.contrib.admin import SimpleListFilter
 from .models import Service
@@ -71,7 +72,7 @@ class ServiceAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html(
                 '<img src="{}" style="width: 50px; height: 50px; object-fit: cover; '
-                'border-radius: 5px;"/>', obj.image.url
+                'border-radius: 5px;"/>', rendition_url(obj.image, 'thumb')
             )
         return format_html(
             '<div style="width: 50px; height: 50px; border: 2px dashed #ccc; '
@@ -104,7 +105,7 @@ class ServiceAdmin(admin.ModelAdmin):
                 '<img src="{}" style="max-width: 300px; max-height: 300px; '
                 'object-fit: contain; border-radius: 8px;"/><br/>'
                 '<small style="color: #666;">Image URL: {}</small>',
-                obj.image.url, obj.image.url
+                rendition_url(obj.image, 'card'), obj.image.url
             )
         return format_html(
             '<div style="width: 300px; height: 200px; border: 2px dashed #ccc; '
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ServiceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'service'
+
+    def ready(self):
+        from server.renditions import register_renditions
+
+        register_renditions(self.get_model('Service'), 'image')
@@ -1,32 +1,8 @@
 from rest_framework import serializers
 from .models import Service
 from sub_service.models import SubService
-from django.core.files.base import ContentFile
 
-import base64
-
-class Base64ImageField(serializers.ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            # Get the base64 data after the comma
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            
-            # Convert base64 to file
-            data = ContentFile(base64.b64decode(imgstr), name=f'temp.{ext}')
-        
-        return super().to_internal_value(data)
-    
-    def to_representation(self, value):
-        if not value:
-            return None
-        
-        try:
-            with value.open('rb') as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode()
-                return f'data:image/{value.name.split(".")[-1]};base64,{encoded_string}'
-        except Exception:
-            return None
+from server.images import Base64ImageField, image_representation
 
 class ServiceSerializer(serializers.ModelSerializer):
     sub_services_count = serializers.SerializerMethodField()
@@ -46,14 +22,7 @@ class ServiceSerializer(serializers.ModelSerializer):
         return obj.get_providers_count()
 
     def get_image_base64(self, obj):
-        if obj.image:
-            try:
-                with obj.image.open('rb') as image_file:
-                    encoded_image = base64.b64encode(image_file.read()).decode('utf-8')
-                    return f"data:image/{obj.image.name.split('.')[-1]};base64,{encoded_image}"
-            except Exception:
-                return None
-        return None
+        return image_representation(obj.image, self.context.get('request'))
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
@@ -130,7 +130,7 @@ class SubServiceViewSet(viewsets.ModelViewSet):
         
         serializer = self.get_serializer(
             data=mutable_data,
-            context={'main_service': main_service}
+            context={**self.get_serializer_context(), 'main_service': main_service}
         )
         
         serializer.is_valid(raise_exception=True)
@@ -159,7 +159,7 @@ class SubServiceViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(
             instance,
             data=mutable_data,
-            context={'main_service': main_service}
+            context={**self.get_serializer_context(), 'main_service': main_service}
         )
         
         serializer.is_valid(raise_exception=True)
@@ -312,7 +312,7 @@ class SubServiceViewSet(viewsets.ModelViewSet):
         
         serializer = self.get_serializer(
             data=mutable_data,
-            context={'main_service': main_service}
+            context={**self.get_serializer_context(), 'main_service': main_service}
         )
         
         serializer.is_valid(raise_exception=True)
@@ -341,7 +341,7 @@ class SubServiceViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(
             instance,
             data=mutable_data,
-            context={'main_service': main_service}
+            context={**self.get_serializer_context(), 'main_service': main_service}
         )
         
         serializer.is_valid(raise_exception=True)
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from django.urls import reverse
+from server.renditions import rendition_url
 from django.db.models import Count, Q
 from .models import ServiceProvider, ProviderService
 
@@ -35,6 +36,7 @@ class ServiceProviderAdmin(admin.ModelAdmin):
         'mobile_number', 'aadhaar'
     )
     list_filter = ('main_service', 'city', 'state', 'gender', 'is_active', 'created_at')
+    ordering = ('first_name', 'last_name', 'id')
     inlines = [ProviderServiceInline]
     readonly_fields = ('id', 'photo_preview_large', 'created_at', 'updated_at')
 
@@ -98,7 +100,7 @@ class ServiceProviderAdmin(admin.ModelAdmin):
         if obj.photo:
             return format_html(
                 '<img src="{}" style="width: 50px; height: 50px; object-fit: cover; '
-                'border-radius: 25px;"/>', obj.photo.url
+                'border-radius: 25px;"/>', rendition_url(obj.photo, 'thumb')
             )
         return format_html(
             '<div style="width: 50px; height: 50px; border: 2px dashed #ccc; '
@@ -113,7 +115,7 @@ class ServiceProviderAdmin(admin.ModelAdmin):
                 '<img src="{}" style="max-width: 300px; max-height: 300px; '
                 'object-fit: contain; border-radius: 8px;"/><br/>'
                 '<small style="color: #666;">Photo URL: {}</small>',
-                obj.photo.url, obj.photo.url
+                rendition_url(obj.photo, 'card'), obj.photo.url
             )
         return format_html(
             '<div style="width: 300px; height: 200px; border: 2px dashed #ccc; '
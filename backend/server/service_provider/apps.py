@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ServiceProviderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'service_provider'
+
+    def ready(self):
+        from server.renditions import register_renditions
+        from . import signals  # noqa: F401
+
+        register_renditions(self.get_model('ServiceProvider'), 'photo')
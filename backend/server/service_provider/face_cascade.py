@@ -0,0 +1,115 @@
+"""
+Early-exit cascade over the face verification models.
+
+With FACE_VERIFICATION['POLICY'] = 'cascade' the models run one at a time
+in CASCADE_ORDER (cheapest first). As soon as a model's distance is at
+least CASCADE_MARGIN * threshold away from its threshold, the decision is
+taken as clear and the remaining models are skipped. Only ambiguous pairs
+pay for the heavier models. When every model runs, the outcome is the same
+as with the default 'all' policy.
+
+``evaluate`` replays the cascade over per-model results measured once per
+image pair. The evaluate_face_cascade command uses it to report the
+latency saved, and how often the cascade disagrees with the all-models
+policy, on a local labelled image set.
+"""
+import itertools
+import os
+import random
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def cascade_order(model_names, order):
+    """``model_names`` sorted by ``order``; models missing from ``order`` run last."""
+    ranked = [model_name for model_name in order if model_name in model_names]
+    return ranked + [model_name for model_name in model_names if model_name not in ranked]
+
+
+def is_clear(result, margin):
+    """True if the result is far enough from its threshold to stop the cascade."""
+    if 'distance' not in result:
+        return False
+    return abs(result['distance'] - result['threshold']) >= margin * result['threshold']
+
+
+def run_cascade(model_names, run_one, margin):
+    """Call ``run_one(model_name)`` in order until a result is clear. Returns the results."""
+    results = []
+    for model_name in model_names:
+        result = run_one(model_name)
+        results.append(result)
+        if is_clear(result, margin):
+            break
+    return results
+
+
+def decide(results):
+    """The verification decision both policies use: every model that ran verified."""
+    return bool(results) and all(result['verified'] for result in results)
+
+
+def evaluate(pairs, model_names, margin):
+    """
+    Compare the cascade with the all-models policy.
+
+    ``pairs`` is a list of (same_person, {model: (result, seconds)}) with
+    every model measured once. Returns decision agreement, accuracy against
+    the labels and the model time each policy spends.
+    """
+    report = {
+        'pairs': len(pairs),
+        'agreement': 0,
+        'all_models': {'correct': 0, 'seconds': 0.0},
+        'cascade': {'correct': 0, 'seconds': 0.0, 'models_run': 0, 'early_exits': 0},
+    }
+    for same_person, measured in pairs:
+        all_results = [measured[model_name][0] for model_name in model_names]
+        cascade_results = run_cascade(model_names, lambda model_name: measured[model_name][0], margin)
+        ran = [result['model'] for result in cascade_results]
+
+        all_decision, cascade_decision = decide(all_results), decide(cascade_results)
+        report['agreement'] += all_decision == cascade_decision
+        report['all_models']['correct'] += all_decision == same_person
+        report['all_models']['seconds'] += sum(measured[model_name][1] for model_name in model_names)
+        report['cascade']['correct'] += cascade_decision == same_person
+        report['cascade']['seconds'] += sum(measured[model_name][1] for model_name in ran)
+        report['cascade']['models_run'] += len(ran)
+        report['cascade']['early_exits'] += len(ran) < len(model_names)
+
+    if pairs:
+        all_seconds, cascade_seconds = report['all_models']['seconds'], report['cascade']['seconds']
+        report['agreement_rate'] = round(report['agreement'] / len(pairs), 4)
+        report['latency_saved'] = round(1 - cascade_seconds / all_seconds, 4) if all_seconds else 0.0
+        report['all_models']['mean_seconds'] = round(all_seconds / len(pairs), 4)
+        report['cascade']['mean_seconds'] = round(cascade_seconds / len(pairs), 4)
+        report['cascade']['mean_models_run'] = round(report['cascade']['models_run'] / len(pairs), 3)
+    return report
+
+
+
+def labelled_pairs(image_dir, max_pairs, seed=0):
+    """
+    Image pairs from a directory with one sub-directory per person. Returns
+    (same_person, path1, path2) with up to max_pairs pairs of each kind.
+    """
+    people = {}
+    for person in sorted(os.listdir(image_dir)):
+        person_dir = os.path.join(image_dir, person)
+        if os.path.isdir(person_dir):
+            images = sorted(
+                os.path.join(person_dir, name) for name in os.listdir(person_dir)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            if images:
+                people[person] = images
+
+    rng = random.Random(seed)
+    same = [pair for images in people.values() for pair in itertools.combinations(images, 2)]
+    different = [
+        (rng.choice(people[first]), rng.choice(people[second]))
+        for first, second in itertools.combinations(people, 2)
+    ]
+    rng.shuffle(same)
+    rng.shuffle(different)
+    return [(True, *pair) for pair in same[:max_pairs]] + [(False, *pair) for pair in different[:max_pairs]]
@@ -0,0 +1,78 @@
+"""
+Single-pass face detection and alignment.
+
+Each image is searched once with the Haar cascade, on a copy downscaled so
+its longer side is at most DETECTION_MAX_SIDE, and the box is mapped back
+to the full-resolution image. The face is cropped from the original,
+levelled using the eyes, and the same crop goes to every model with
+DeepFace detection disabled (detector_backend='skip'). Before, each
+DeepFace call detected and aligned both images again, eight detector
+passes per request on top of the validation pass.
+"""
+import math
+
+from server.lazy_import import lazy_module
+
+cv2 = lazy_module('cv2')
+
+# Fraction of the box added on each side so alignment does not cut off the chin or forehead
+CROP_MARGIN = 0.1
+
+
+def _gray(image):
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def detect_faces(image, cascade, max_side):
+    """Face boxes (x, y, w, h) in ``image`` coordinates, found on a downscaled copy."""
+    height, width = image.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    if scale < 1.0:
+        small = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    else:
+        small = image
+
+    min_face_size = min(small.shape[:2]) // 8
+    faces = cascade.detectMultiScale(
+        _gray(small), scaleFactor=1.1, minNeighbors=5, minSize=(min_face_size, min_face_size)
+    )
+    return [tuple(int(round(value / scale)) for value in face) for face in faces]
+
+
+def align_face(image, box, eye_cascade):
+    """Crop ``box`` (plus a margin) from ``image`` and rotate it so the eyes are level."""
+    x, y, w, h = box
+    margin_x, margin_y = int(w * CROP_MARGIN), int(h * CROP_MARGIN)
+    top, left = max(y - margin_y, 0), max(x - margin_x, 0)
+    crop = image[top:y + h + margin_y, left:x + w + margin_x]
+
+    eyes = eye_cascade.detectMultiScale(_gray(crop), scaleFactor=1.1, minNeighbors=10)
+    if len(eyes) < 2:
+        return crop
+    # The two largest candidates, left to right
+    eyes = sorted(sorted(eyes, key=lambda eye: eye[2] * eye[3], reverse=True)[:2], key=lambda eye: eye[0])
+    (lx, ly, lw, lh), (rx, ry, rw, rh) = eyes
+    angle = math.degrees(math.atan2((ry + rh / 2) - (ly + lh / 2), (rx + rw / 2) - (lx + lw / 2)))
+
+    crop_height, crop_width = crop.shape[:2]
+    rotation = cv2.getRotationMatrix2D((crop_width / 2, crop_height / 2), angle, 1.0)
+    return cv2.warpAffine(crop, rotation, (crop_width, crop_height), borderMode=cv2.BORDER_REPLICATE)
+
+
+def prepare_face(image, cascade, eye_cascade, max_side):
+    """
+    The aligned crop of the single face in ``image``. Returns (crop, None),
+    or (None, error) when there is no image, no face or several faces.
+    """
+    try:
+        if image is None:
+            return None, "Image not found."
+
+        faces = detect_faces(image, cascade, max_side)
+        if len(faces) == 0:
+            return None, "No face detected."
+        if len(faces) > 1:
+            return None, "Multiple faces detected."
+        return align_face(image, faces[0], eye_cascade), None
+    except Exception as e:
+        return None, f"Error in face detection: {str(e)}"
@@ -0,0 +1,114 @@
+"""
+Precomputed face embeddings of provider photos.
+
+A provider's registered photo is embedded once per model when it is
+uploaded or changed, and stored as ProviderFaceEmbedding rows. Verifying a
+new selfie against the provider then only embeds the selfie and compares
+vectors, instead of running DeepFace.verify on both images.
+
+Rows are tagged with MODEL_VERSION and the photo's storage name. Anything
+that does not match the current photo and version is ignored and
+recomputed, so upgrading DeepFace or replacing a photo never compares
+against a stale vector. ``manage.py compute_face_embeddings`` backfills
+existing providers.
+"""
+import logging
+from importlib.metadata import version
+
+import numpy as np
+
+from server.lazy_import import lazy_module
+
+from .face_models import face_models, face_verification_settings, represent_model
+from .models import FaceJobKind, FaceVerificationJob, ProviderFaceEmbedding
+
+logger = logging.getLogger(__name__)
+
+verification = lazy_module('deepface.modules.verification')
+
+# Bump the suffix when the preprocessing in represent_model changes
+# (2: single-pass detection and alignment, see face_detection.py)
+MODEL_VERSION = f"deepface-{version('deepface')}/2"
+
+# DeepFace.verify's default metric, so thresholds stay comparable
+DISTANCE_METRIC = 'cosine'
+
+
+def embed(model_names, image):
+    """Embed one image with each model. Returns {model: float32 vector}."""
+    execution = face_verification_settings()['EXECUTION']
+    if execution == 'parallel':
+        from .face_pool import face_pool_client
+
+        return face_pool_client.represent(model_names, image)
+    if execution == 'server':
+        from .inference_server import inference_client
+
+        return inference_client.represent(model_names, image)
+    return {model_name: represent_model(model_name, image) for model_name in model_names}
+
+
+def compare_embeddings(model_name, reference, embedding, threshold_multiplier):
+    """Same result shape as face_models.run_model, from two precomputed vectors."""
+    distance = float(verification.find_cosine_distance(reference, embedding))
+    adjusted_threshold = verification.find_threshold(model_name, DISTANCE_METRIC) * threshold_multiplier
+    return {
+        'model': model_name,
+        'verified': distance < adjusted_threshold,
+        'distance': distance,
+        'threshold': adjusted_threshold
+    }
+
+
+def provider_embeddings(provider, model_names):
+    """Current embeddings of the provider's photo, {model: vector}; stale rows are left out."""
+    rows = ProviderFaceEmbedding.objects.filter(
+        provider=provider,
+        model_name__in=model_names,
+        model_version=MODEL_VERSION,
+        photo_name=provider.photo.name,
+    )
+    return {row.model_name: row.embedding for row in rows}
+
+
+def compute_provider_embeddings(provider, model_names=None, force=False):
+    """
+    Embed the provider's photo with every model that has no current
+    embedding (every model with ``force``). Returns the models computed.
+    """
+    model_names = model_names or face_models.model_names
+    if not provider.photo:
+        return []
+    current = {} if force else provider_embeddings(provider, model_names)
+    missing = [model_name for model_name in model_names if model_name not in current]
+    if not missing:
+        return []
+
+    with provider.photo.open('rb') as photo:
+        face, error = face_models.prepare_face(photo.read())
+    if face is None:
+        raise ValueError(f'{provider.photo.name}: {error}')
+
+    for model_name, vector in embed(missing, face).items():
+        vector = np.asarray(vector, dtype='<f4')
+        ProviderFaceEmbedding.objects.update_or_create(
+            provider=provider,
+            model_name=model_name,
+            defaults={
+                'model_version': MODEL_VERSION,
+                'photo_name': provider.photo.name,
+                'dimensions': vector.size,
+                'vector': vector.tobytes(),
+            }
+        )
+    return missing
+
+
+def schedule_provider_embeddings(provider):
+    """
+    Queue the provider's photo embeddings for a verification worker. The job
+    is committed with the provider; verification computes missing embeddings
+    itself if it runs first.
+    """
+    if face_verification_settings()['PRECOMPUTE_EMBEDDINGS']:
+        return FaceVerificationJob.objects.create(provider=provider, kind=FaceJobKind.EMBEDDINGS)
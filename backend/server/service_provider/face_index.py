@@ -0,0 +1,507 @@
+"""
+Face-embedding similarity index used to detect duplicate providers.
+
+Someone re-registering under another Aadhaar or mobile number still has the
+same face. The DUPLICATE_MODEL embedding of every provider's photo is kept
+in a resident NumPy index, so a signup is compared against every existing
+provider with one matrix-vector product instead of a DeepFace run per photo.
+
+Vectors are L2-normalised, so the inner product is the cosine similarity
+and ``1 - similarity`` is DeepFace's cosine distance. Search is exact (flat)
+until the index is trained with an IVF coarse quantizer: k-means centroids
+split the vectors into inverted lists stored as contiguous row ranges, and
+a query only scores the ``nprobe`` lists whose centroids are closest.
+
+Vectors added since the last compaction sit in a small unsorted tail that
+is always scanned in full, and removed rows are masked out until
+compact() folds both into the sorted lists. ``manage.py build_face_index``
+builds, trains and saves the index; workers memory-map the saved vectors
+on first use and pick up embeddings written since then from the database
+every DUPLICATE_SYNC_SECONDS. Signups are checked by the verification
+workers (face_jobs.py), never in the API request.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .face_embeddings import DISTANCE_METRIC, MODEL_VERSION, compute_provider_embeddings, provider_embeddings, verification
+from .face_models import face_verification_settings
+from .models import FaceJobKind, FaceVerificationJob, ProviderFaceEmbedding
+from .provider_index import UUID_DTYPE, _uuid_key
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per matrix product when assigning vectors to lists
+ASSIGN_CHUNK = 65536
+
+# k-means sample per list when training the quantizer
+TRAIN_POINTS_PER_LIST = 64
+
+# The tail is compacted once it holds more than this many rows, or more
+# than 1/TAIL_FRACTION of the sorted rows
+MIN_TAIL = 1024
+TAIL_FRACTION = 8
+
+# Embeddings updated this long before the last sync are fetched again, so
+# rows committed out of order by other workers are not missed
+SYNC_SKEW = timedelta(seconds=5)
+
+
+def normalize(vectors):
+    """Rows of ``vectors`` as unit float32 vectors."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def uuid_keys(provider_ids):
+    return np.array([_uuid_key(value) for value in provider_ids], dtype=UUID_DTYPE)
+
+
+def key_uuids(keys):
+    return [uuid.UUID(bytes=bytes(key)) for key in keys]
+
+
+def key_mask(keys, targets):
+    """Boolean mask of the rows of ``keys`` that are in ``targets``."""
+    if not len(keys) or not len(targets):
+        return np.zeros(len(keys), dtype=bool)
+    # Match on the first 8 bytes with a sorted search, then confirm the rest
+    heads = np.ascontiguousarray(keys).view('<u8')[::2]
+    mask = np.isin(heads, np.ascontiguousarray(targets).view('<u8')[::2])
+    wanted = {bytes(key) for key in targets}
+    for row in np.flatnonzero(mask):
+        mask[row] = bytes(keys[row]) in wanted
+    return mask
+
+
+def nearest_lists(vectors, centroids):
+    """Index of the most similar centroid for every row of ``vectors``."""
+    lists = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        lists[start:start + ASSIGN_CHUNK] = np.argmax(vectors[start:start + ASSIGN_CHUNK] @ centroids.T, axis=1)
+    return lists
+
+
+def top_k(scores, k):
+    """Positions of the k highest scores, highest first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.arange(0)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def index_paths(path):
+    """(meta file, directory) of the index saved at ``path``."""
+    return f'{path}.npz', os.path.dirname(os.path.abspath(path))
+
+
+class FaceIndex:
+    """Inner-product index of unit face embeddings keyed by provider id."""
+
+    def __init__(self, dimensions, keys=(), vectors=None, lists=None, centroids=None):
+        self.dimensions = dimensions
+        # (nlist, dimensions) unit centroids, or None for a flat index
+        self.centroids = centroids
+        keys = np.asarray(keys, dtype=UUID_DTYPE)
+        if vectors is None:
+            vectors = np.empty((0, dimensions or 0), dtype=np.float32)
+        if lists is None:
+            lists = np.zeros(len(keys), dtype=np.int32)
+        # ((keys, vectors, lists, list offsets, removed), (tail keys, vectors, lists)).
+        # Sorted rows are ordered by inverted list. The state is swapped as
+        # one tuple so concurrent readers always see matching arrays.
+        self._state = (self._sorted(keys, vectors, lists), self._empty_tail())
+        self.meta = {}
+
+    @classmethod
+    def from_vectors(cls, provider_ids, vectors):
+        vectors = normalize(vectors)
+        return cls(vectors.shape[1], uuid_keys(provider_ids), vectors)
+
+    def _sorted(self, keys, vectors, lists):
+        offsets = np.searchsorted(lists, np.arange(self.nlist + 1))
+        return keys, vectors, lists, offsets, np.zeros(len(keys), dtype=bool)
+
+    def _empty_tail(self):
+        return (
+            np.empty(0, dtype=UUID_DTYPE),
+            np.empty((0, self.dimensions or 0), dtype=np.float32),
+            np.empty(0, dtype=np.int32),
+        )
+
+    def __len__(self):
+        (keys, _, _, _, removed), tail = self._state
+        return len(keys) - int(removed.sum()) + len(tail[0])
+
+    @property
+    def nlist(self):
+        return 0 if self.centroids is None else len(self.centroids)
+
+    @property
+    def nbytes(self):
+        main, tail = self._state
+        arrays = [*main, *tail] + ([self.centroids] if self.centroids is not None else [])
+        return sum(array.nbytes for array in arrays)
+
+    def _assign(self, vectors):
+        if self.centroids is None:
+            return np.zeros(len(vectors), dtype=np.int32)
+        return nearest_lists(vectors, self.centroids)
+
+    def add(self, provider_ids, vectors):
+        """Add or replace the vectors of ``provider_ids``."""
+        vectors = normalize(vectors)
+        if not self.dimensions and not len(self):
+            # An index built from no vectors takes the size of the first ones
+            self.dimensions = vectors.shape[1]
+            self._state = (self._sorted(*self._empty_tail()), self._empty_tail())
+        if vectors.shape[1] != self.dimensions:
+            raise ValueError(f'Expected {self.dimensions}-dimensional vectors, got {vectors.shape[1]}')
+        keys = uuid_keys(provider_ids)
+        self.remove(provider_ids)
+
+        main, (tail_keys, tail_vectors, tail_lists) = self._state
+        tail = (
+            np.concatenate([tail_keys, keys]),
+            np.concatenate([tail_vectors, vectors]),
+            np.concatenate([tail_lists, self._assign(vectors)]),
+        )
+        self._state = (main, tail)
+        if len(tail[0]) > max(MIN_TAIL, len(main[0]) // TAIL_FRACTION):
+            self.compact()
+
+    def remove(self, provider_ids):
+        keys = uuid_keys(provider_ids)
+        (main_keys, vectors, lists, offsets, removed), tail = self._state
+        hits = key_mask(main_keys, keys) & ~removed
+        if hits.any():
+            removed = removed | hits
+        keep = ~key_mask(tail[0], keys)
+        if not keep.all():
+            tail = tuple(array[keep] for array in tail)
+        self._state = ((main_keys, vectors, lists, offsets, removed), tail)
+
+    def compact(self):
+        """Fold the tail into the sorted lists and drop removed rows."""
+        (keys, vectors, lists, _, removed), (tail_keys, tail_vectors, tail_lists) = self._state
+        keep = ~removed
+        keys = np.concatenate([keys[keep], tail_keys])
+        vectors = np.concatenate([vectors[keep], tail_vectors])
+        lists = np.concatenate([lists[keep], tail_lists])
+        order = np.argsort(lists, kind='stable')
+        self._state = (self._sorted(keys[order], vectors[order], lists[order]), self._empty_tail())
+
+    def vectors(self):
+        """(keys, vectors) of every live row."""
+        (keys, vectors, _, _, removed), (tail_keys, tail_vectors, _) = self._state
+        keep = ~removed
+        return np.concatenate([keys[keep], tail_keys]), np.concatenate([vectors[keep], tail_vectors])
+
+    def train(self, nlist, iterations=10, sample_size=None, seed=0):
+        """
+        Fit an IVF coarse quantizer with spherical k-means on a sample of the
+        vectors, then sort every row into its list.
+        """
+        keys, vectors = self.vectors()
+        if len(vectors) < nlist:
+            raise ValueError(f'Cannot train {nlist} lists on {len(vectors)} vectors')
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(vectors), sample_size or nlist * TRAIN_POINTS_PER_LIST)
+        sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)]
+
+        for _ in range(iterations):
+            assignment = nearest_lists(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            # Reseed empty lists from random sample points
+            empty = np.bincount(assignment, minlength=nlist) == 0
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = normalize(sums)
+
+        self.centroids = centroids
+        lists = nearest_lists(vectors, centroids)
+        order = np.argsort(lists, kind='stable')
+        self._state = (self._sorted(keys[order], vectors[order], lists[order]), self._empty_tail())
+        return self
+
+    def search(self, query, k, nprobe=None):
+        """
+        Return (keys, similarities) of the k live vectors most similar to
+        ``query``, most similar first. On an IVF index only the ``nprobe``
+        lists nearest to the query are scored; None scores every list.
+        """
+        query = normalize(query)[0]
+        (keys, vectors, _, offsets, removed), (tail_keys, tail_vectors, _) = self._state
+
+        if nprobe is None or nprobe >= self.nlist:
+            rows = None
+            scores = vectors @ query
+            dead = removed
+        else:
+            probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            rows = np.concatenate([np.arange(offsets[list_id], offsets[list_id + 1]) for list_id in probe])
+            scores = vectors[rows] @ query
+            dead = removed[rows]
+        if dead.any():
+            scores = np.where(dead, -np.inf, scores)
+
+        top = top_k(scores, k)
+        tail_scores = tail_vectors @ query
+        tail_top = top_k(tail_scores, k)
+        candidate_keys = np.concatenate([keys[top if rows is None else rows[top]], tail_keys[tail_top]])
+        candidate_scores = np.concatenate([scores[top], tail_scores[tail_top]])
+        best = top_k(candidate_scores, k)
+        best = best[np.isfinite(candidate_scores[best])]
+        return candidate_keys[best], candidate_scores[best]
+
+    def save(self, path):
+        """
+        Compact and write the index to ``path``.npz plus a vectors file that
+        load() memory-maps. The meta file is swapped in last, so a reader
+        sees either the old index or the new one, never a mix.
+        """
+        self.compact()
+        keys, vectors, lists, _, _ = self._state[0]
+        meta_path, directory = index_paths(path)
+        os.makedirs(directory, exist_ok=True)
+
+        vectors_name = f'{os.path.basename(path)}.{uuid.uuid4().hex}.npy'
+        with open(os.path.join(directory, vectors_name), 'wb') as vectors_file:
+            np.save(vectors_file, np.ascontiguousarray(vectors, dtype=np.float32))
+        meta = {**self.meta, 'dimensions': self.dimensions, 'vectors': vectors_name}
+        with open(meta_path + '.tmp', 'wb') as meta_file:
+            np.savez(
+                meta_file, keys=keys, lists=lists,
+                centroids=self.centroids if self.centroids is not None else np.empty((0, self.dimensions or 0), np.float32),
+                meta=np.array(json.dumps(meta)),
+            )
+
+        previous = None
+        if os.path.exists(meta_path):
+            with np.load(meta_path) as data:
+                previous = json.loads(str(data['meta'])).get('vectors')
+        os.replace(meta_path + '.tmp', meta_path)
+        # Workers that mapped the old vectors keep their mapping after the unlink
+        if previous and previous != vectors_name:
+            try:
+                os.remove(os.path.join(directory, previous))
+            except FileNotFoundError:
+                pass
+        self.meta = meta
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open an index written by save(), memory-mapping its vectors."""
+        meta_path, directory = index_paths(path)
+        with np.load(meta_path) as data:
+            keys, lists, centroids = data['keys'], data['lists'], data['centroids']
+            meta = json.loads(str(data['meta']))
+        vectors = np.load(os.path.join(directory, meta['vectors']), mmap_mode='r' if mmap else None)
+        if vectors.shape[0] != len(keys) or (len(keys) and vectors.shape[1] != meta['dimensions']):
+            raise ValueError(f'{path}: vectors do not match the index')
+        index = cls(meta['dimensions'], keys, vectors, lists, centroids if len(centroids) else None)
+        index.meta = meta
+        return index
+
+
+class FaceIndexRegistry:
+    """Process-wide duplicate-detection index over the DUPLICATE_MODEL embeddings."""
+
+    def __init__(self):
+        self._index = None
+        self._synced_at = None
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+        self.build_seconds = 0.0
+
+    @property
+    def model_name(self):
+        return face_verification_settings()['DUPLICATE_MODEL']
+
+    def _embeddings(self, since=None):
+        """(provider ids, vectors) of the current embeddings, optionally only those updated since."""
+        rows = ProviderFaceEmbedding.objects.filter(
+            model_name=self.model_name,
+            model_version=MODEL_VERSION,
+            photo_name=F('provider__photo'),
+        )
+        if since is not None:
+            rows = rows.filter(updated_at__gte=since - SYNC_SKEW)
+        provider_ids, vectors = [], []
+        for provider_id, vector in rows.values_list('provider_id', 'vector').iterator(chunk_size=2000):
+            provider_ids.append(provider_id)
+            vectors.append(np.frombuffer(bytes(vector), dtype='<f4'))
+        return provider_ids, vectors
+
+    def build(self, nlist=None):
+        """Rebuild the index from the database, training nlist inverted lists when there is enough data."""
+        config = face_verification_settings()
+        nlist = config['DUPLICATE_NLIST'] if nlist is None else nlist
+        start = time.perf_counter()
+        synced_at = timezone.now()
+        provider_ids, vectors = self._embeddings()
+        if vectors:
+            index = FaceIndex.from_vectors(provider_ids, np.stack(vectors))
+        else:
+            index = FaceIndex(None)
+        if nlist and len(index) >= nlist * TRAIN_POINTS_PER_LIST:
+            index.train(nlist)
+        index.meta = {'model_name': self.model_name, 'model_version': MODEL_VERSION}
+
+        with self._lock:
+            self._index = index
+            self._synced_at = synced_at
+            self._checked_at = time.monotonic()
+            self.build_seconds = time.perf_counter() - start
+        return index
+
+    def _open(self):
+        path = face_verification_settings()['DUPLICATE_INDEX_PATH']
+        if path and os.path.exists(index_paths(path)[0]):
+            try:
+                index = FaceIndex.load(path)
+            except (OSError, ValueError, KeyError):
+                logger.exception('Could not load the face index at %s, rebuilding it', path)
+            else:
+                current = (index.meta.get('model_name'), index.meta.get('model_version')) == (self.model_name, MODEL_VERSION)
+                if current and index.meta.get('synced_at'):
+                    self._index = index
+                    self._synced_at = parse_datetime(index.meta['synced_at'])
+                    self.sync()
+                    return index
+        return self.build()
+
+    def get(self):
+        with self._lock:
+            if self._index is None or self._index.meta.get('model_name') != self.model_name:
+                return self._open()
+            if time.monotonic() - self._checked_at > face_verification_settings()['DUPLICATE_SYNC_SECONDS']:
+                self.sync()
+            return self._index
+
+    def sync(self):
+        """Add the embeddings other workers wrote since the last sync."""
+        with self._lock:
+            synced_at = timezone.now()
+            provider_ids, vectors = self._embeddings(since=self._synced_at)
+            if vectors:
+                self._index.add(provider_ids, np.stack(vectors))
+            self._synced_at = synced_at
+            self._checked_at = time.monotonic()
+
+    def save(self, path=None):
+        path = path or face_verification_settings()['DUPLICATE_INDEX_PATH']
+        if not path:
+            raise ValueError('No face index path given and DUPLICATE_INDEX_PATH is not set')
+        with self._lock:
+            index = self.get()
+            index.meta['synced_at'] = self._synced_at.isoformat()
+            index.save(path)
+        return path
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    # Incremental updates, called from signal handlers
+
+    def embedding_saved(self, embedding):
+        if embedding.model_name != self.model_name or embedding.model_version != MODEL_VERSION:
+            return
+        with self._lock:
+            if self._index is not None:
+                self._index.add([embedding.provider_id], embedding.embedding[np.newaxis])
+
+    def provider_deleted(self, provider_id):
+        with self._lock:
+            if self._index is not None:
+                self._index.remove([provider_id])
+
+    def similar(self, vector, k=None, exclude=None):
+        """
+        The k providers whose photos are most similar to ``vector``, most
+        similar first, as dicts with the cosine similarity and distance and
+        whether the distance is under the model's verification threshold.
+        """
+        config = face_verification_settings()
+        k = k or config['DUPLICATE_TOP_K']
+        index = self.get()
+        if not len(index):
+            return []
+        keys, similarities = index.search(vector, k + (exclude is not None), nprobe=config['DUPLICATE_NPROBE'])
+        threshold = verification.find_threshold(self.model_name, DISTANCE_METRIC) * config['THRESHOLD_MULTIPLIER']
+        matches = []
+        for provider_id, similarity in zip(key_uuids(keys), similarities.tolist()):
+            if exclude is not None and provider_id == exclude:
+                continue
+            distance = 1.0 - similarity
+            matches.append({
+                'provider_id': provider_id,
+                'similarity': similarity,
+                'distance': distance,
+                'likely_duplicate': distance < threshold,
+            })
+        return matches[:k]
+
+    def stats(self):
+        with self._lock:
+            index = self._index
+            return {
+                'model': self.model_name,
+                'loaded': index is not None,
+                'providers': len(index) if index is not None else 0,
+                'dimensions': index.dimensions if index is not None else None,
+                'lists': index.nlist if index is not None else 0,
+                'memory_bytes': index.nbytes if index is not None else 0,
+                'build_seconds': round(self.build_seconds, 4),
+                'synced_at': self._synced_at.isoformat() if self._synced_at else None,
+            }
+
+
+face_index = FaceIndexRegistry()
+
+
+def similar_providers(provider, k=None):
+    """
+    The k existing providers whose photos are most similar to ``provider``'s,
+    embedding the photo first if it has no current embedding.
+    """
+    model_name = face_index.model_name
+    vector = provider_embeddings(provider, [model_name]).get(model_name)
+    if vector is None:
+        compute_provider_embeddings(provider, [model_name])
+        vector = provider_embeddings(provider, [model_name]).get(model_name)
+    if vector is None:
+        raise ValueError(f'Provider {provider.pk} has no photo')
+    return face_index.similar(vector, k, exclude=provider.id)
+
+
+def check_duplicates(provider):
+    """Log the existing providers that look like ``provider``. Returns every match."""
+    matches = similar_providers(provider)
+    duplicates = [match for match in matches if match['likely_duplicate']]
+    if duplicates:
+        logger.warning(
+            'Provider %s looks like %s',
+            provider.pk,
+            ', '.join(f"{match['provider_id']} (distance {match['distance']:.3f})" for match in duplicates),
+        )
+    return matches
+
+
+def schedule_duplicate_check(provider):
+    """Queue a search for providers with the same face for a verification worker."""
+    if face_verification_settings()['DUPLICATE_CHECK']:
+        return FaceVerificationJob.objects.create(provider=provider, kind=FaceJobKind.DUPLICATES)
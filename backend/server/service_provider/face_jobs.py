@@ -0,0 +1,251 @@
+"""
+Database-backed queue of asynchronous face verifications.
+
+POST /service_providers/verify/jobs/ stores the uploaded images in a
+FaceVerificationJob row and answers at once with the job id. Verification
+workers (manage.py run_face_verification_worker) claim queued jobs with
+SELECT ... FOR UPDATE SKIP LOCKED, run them through FaceMatcher and store
+the result. The result is pushed to the notifications WebSocket group of
+``notify_id`` and can be polled from /service_providers/verify/jobs/<id>/.
+Provider signups queue their photo embeddings and duplicate check on the
+same table (FaceJobKind), so API workers never load the models.
+
+Everything lives in the application database; there is no broker. Jobs
+left running by a worker that died are put back on the queue after
+JOB_STALE_SECONDS, and failed once they have been claimed JOB_MAX_ATTEMPTS
+times. A worker only stores its result while it still holds the claim, so
+when a slow job was requeued and claimed again only one run is recorded.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .face_models import face_verification_settings
+from .face_embeddings import compute_provider_embeddings
+from .face_index import check_duplicates
+from .models import FaceJobKind, FaceVerificationJob, FaceVerificationJobStatus
+from .validate_service_provider import FaceMatcher
+
+logger = logging.getLogger(__name__)
+
+
+def _read(upload):
+    return b''.join(upload.chunks()) if hasattr(upload, 'chunks') else upload
+
+
+def _to_python(value):
+    # DeepFace results may hold numpy scalars
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def submit_job(image2, image1=None, provider=None, notify_id=''):
+    """Queue a verification of image1 (or the provider's photo) against image2."""
+    return FaceVerificationJob.objects.create(
+        image1=_read(image1) if image1 is not None else None,
+        image2=_read(image2),
+        provider=provider,
+        notify_id=str(notify_id or ''),
+    )
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def claim_job(worker=None):
+    """Take the oldest queued job and mark it running, or return None if the queue is empty."""
+    with transaction.atomic():
+        job = (
+            FaceVerificationJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=FaceVerificationJobStatus.QUEUED)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = FaceVerificationJobStatus.RUNNING
+        job.started_at = timezone.now()
+        job.worker = worker or worker_name()
+        job.attempts += 1
+        job.save(update_fields=['status', 'started_at', 'worker', 'attempts'])
+    return job
+
+
+def _run(job, matcher):
+    if job.kind == FaceJobKind.EMBEDDINGS:
+        return {'success': True, 'computed': compute_provider_embeddings(job.provider)}
+    if job.kind == FaceJobKind.DUPLICATES:
+        return {'success': True, 'matches': check_duplicates(job.provider)}
+    matcher = matcher or FaceMatcher()
+    if job.provider_id:
+        return matcher.verify_provider(job.provider, bytes(job.image2))
+    return matcher.verify_faces(bytes(job.image1), bytes(job.image2))
+
+
+def _claimed(job):
+    """The job's row, as long as it is still running under this claim."""
+    return FaceVerificationJob.objects.filter(
+        id=job.id, status=FaceVerificationJobStatus.RUNNING, worker=job.worker, attempts=job.attempts
+    )
+
+
+def run_job(job, matcher=None):
+    """
+    Run a claimed job, store the outcome and push it to the recipient. If the
+    job was requeued meanwhile, the outcome is dropped and the job returned
+    unchanged.
+    """
+    try:
+        result = _run(job, matcher)
+    except Exception as exc:
+        logger.warning('Face job %s (%s) failed: %s', job.id, job.kind, exc)
+        result = {'success': False, 'error': str(exc)}
+
+    outcome = {
+        'result': json.loads(json.dumps(result, default=_to_python)),
+        'status': FaceVerificationJobStatus.DONE if result.get('success') else FaceVerificationJobStatus.FAILED,
+        'error': '' if result.get('success') else result.get('error', ''),
+        'finished_at': timezone.now(),
+        # The images are only needed until the job has run
+        'image1': None,
+        'image2': None,
+    }
+    if not _claimed(job).update(**outcome):
+        logger.warning('Face job %s was requeued while %s ran it; dropping its result', job.id, job.worker)
+        return job
+    for field, value in outcome.items():
+        setattr(job, field, value)
+    push_result(job)
+    return job
+
+
+def job_payload(job):
+    return {
+        'job_id': str(job.id),
+        'kind': job.kind,
+        'status': job.status,
+        'result': job.result,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def push_result(job):
+    """Send the finished job to the recipient's notifications WebSocket group."""
+    if not job.notify_id:
+        return
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            f'notifications_{job.notify_id}',
+            {
+                'type': 'notification_message',
+                'message': {'type': 'face_verification', **job_payload(job)},
+            }
+        )
+    except Exception:
+        # The result stays available from the status endpoint
+        logger.exception('Could not push face verification job %s', job.id)
+
+
+def requeue_stale_jobs():
+    """
+    Put back jobs whose worker has not finished them within JOB_STALE_SECONDS.
+    A job that has already been claimed JOB_MAX_ATTEMPTS times probably kills
+    its worker, so it is failed instead of poisoning the queue.
+    """
+    options = face_verification_settings()
+    now = timezone.now()
+    stale = FaceVerificationJob.objects.filter(
+        status=FaceVerificationJobStatus.RUNNING,
+        started_at__lt=now - timedelta(seconds=options['JOB_STALE_SECONDS'])
+    )
+
+    exhausted = list(stale.filter(attempts__gte=options['JOB_MAX_ATTEMPTS']).defer('image1', 'image2'))
+    for job in exhausted:
+        failed = {
+            'status': FaceVerificationJobStatus.FAILED,
+            'error': f'Worker did not finish the job in {job.attempts} attempts',
+            'finished_at': now,
+            'image1': None,
+            'image2': None,
+        }
+        # The worker may have finished it since it was read
+        if not _claimed(job).update(**failed):
+            continue
+        for field, value in failed.items():
+            setattr(job, field, value)
+        logger.error('Face verification job %s failed after %s attempts', job.id, job.attempts)
+        push_result(job)
+
+    return stale.filter(attempts__lt=options['JOB_MAX_ATTEMPTS']).update(
+        status=FaceVerificationJobStatus.QUEUED, started_at=None, worker=''
+    )
+
+
+def _summary(seconds):
+    if not seconds:
+        return {'avg': None, 'p95': None, 'max': None}
+    seconds = sorted(seconds)
+    return {
+        'avg': round(sum(seconds) / len(seconds), 3),
+        'p95': round(seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))], 3),
+        'max': round(seconds[-1], 3),
+    }
+
+
+def job_metrics(window=None):
+    """Queue depth now, and wait/run times of jobs finished in the last ``window`` seconds."""
+    window = window or face_verification_settings()['JOB_METRICS_WINDOW']
+    now = timezone.now()
+    oldest = (
+        FaceVerificationJob.objects.filter(status=FaceVerificationJobStatus.QUEUED)
+        .order_by('created_at').values_list('created_at', flat=True).first()
+    )
+    finished = FaceVerificationJob.objects.filter(
+        finished_at__gte=now - timedelta(seconds=window)
+    ).values_list('created_at', 'started_at', 'finished_at')
+
+    wait_seconds, run_seconds = [], []
+    for created_at, started_at, finished_at in finished:
+        wait_seconds.append((started_at - created_at).total_seconds())
+        run_seconds.append((finished_at - started_at).total_seconds())
+
+    return {
+        'queue_depth': FaceVerificationJob.objects.filter(status=FaceVerificationJobStatus.QUEUED).count(),
+        'running': FaceVerificationJob.objects.filter(status=FaceVerificationJobStatus.RUNNING).count(),
+        'oldest_queued_seconds': round((now - oldest).total_seconds(), 3) if oldest else None,
+        'window_seconds': window,
+        'finished': len(run_seconds),
+        'wait_seconds': _summary(wait_seconds),
+        'run_seconds': _summary(run_seconds),
+    }
+
+
+def work(stop, poll_interval=None, matcher=None):
+    """Claim and run jobs until ``stop`` is set, sleeping poll_interval when the queue is empty."""
+    poll_interval = poll_interval or face_verification_settings()['JOB_POLL_SECONDS']
+    name = worker_name()
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            job = claim_job(name)
+            if job is None:
+                stop.wait(poll_interval)
+                continue
+            run_job(job, matcher)
+        except Exception:
+            logger.exception('Face verification worker %s failed', name)
+            stop.wait(poll_interval)
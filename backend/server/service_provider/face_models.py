@@ -0,0 +1,395 @@
+"""
+Process-wide registry of the face verification models.
+
+DeepFace builds a model the first time it is used and keeps it in its own
+module-level cache, so the first verification in every worker used to pay
+for loading four networks. The registry loads and warms every configured
+model once, at worker start when PRELOAD is on (see server/wsgi.py and
+server/asgi.py) or on the first verification otherwise, keeps references
+to them and records how long each took and how much memory it added.
+DeepFace.verify/represent then reuse the cached models.
+
+The ML stack itself is imported lazily. Enable PRELOAD only on the workers
+that serve /service_providers/verify/; the others never load TensorFlow.
+"""
+import logging
+import os
+import resource
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from server.lazy_import import lazy_module
+
+from .face_detection import prepare_face
+from .tflite_backend import TFLiteEmbedder, graph_path
+
+# Imported on first use so processes that never verify a face do not load
+# OpenCV, DeepFace and TensorFlow
+cv2 = lazy_module('cv2')
+DeepFace = lazy_module('deepface.DeepFace')
+detection = lazy_module('deepface.modules.detection')
+preprocessing = lazy_module('deepface.modules.preprocessing')
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    # Models used for verification, in the order they are run
+    'MODELS': ['VGG-Face', 'Facenet', 'ArcFace', 'Dlib'],
+    # Load and warm the models in a background thread when a worker starts;
+    # for dedicated verification workers
+    'PRELOAD': False,
+    'THRESHOLD_MULTIPLIER': 1.0,
+    # Faces are detected once per image on a copy whose longer side is at
+    # most this many pixels (see face_detection.py)
+    'DETECTION_MAX_SIDE': 640,
+    # 'serial' runs the models one after another in the request thread;
+    # 'parallel' sends them to the shared pool service (manage.py
+    # run_face_pool) listening on POOL_ADDRESS, which runs POOL_SIZE
+    # worker processes for the whole host; 'server' gets embeddings from
+    # the batching inference server (manage.py run_inference_server)
+    'EXECUTION': 'serial',
+    'POOL_SIZE': 2,
+    'POOL_ADDRESS': ('127.0.0.1', 8765),
+    # Shared secret for the pool connection; derived from SECRET_KEY when unset
+    'POOL_AUTHKEY': None,
+    # Seconds to wait for one model's result in parallel mode
+    'MODEL_TIMEOUT': 30,
+    # Embed a provider's photo when it is uploaded so re-verification only
+    # has to embed the new selfie (see face_embeddings.py)
+    'PRECOMPUTE_EMBEDDINGS': True,
+    # Inference server address, and how it batches faces across requests:
+    # at most BATCH_MAX_SIZE per forward pass, waiting at most
+    # BATCH_MAX_WAIT_MS for a batch to fill
+    'INFERENCE_SERVER': '127.0.0.1:50051',
+    'BATCH_MAX_SIZE': 16,
+    'BATCH_MAX_WAIT_MS': 10,
+    'INFERENCE_THREADS': 16,
+    # 'keras' runs the DeepFace models; 'tflite' runs the graphs converted
+    # by manage.py convert_face_models (see tflite_backend.py) from
+    # TFLITE_DIR, with TFLITE_QUANTIZATION 'none', 'dynamic' or 'int8' and
+    # TFLITE_THREADS CPU threads per interpreter
+    'BACKEND': 'keras',
+    'TFLITE_DIR': 'face_models_tflite',
+    'TFLITE_QUANTIZATION': 'dynamic',
+    'TFLITE_THREADS': None,
+    # 'all' runs every model; 'cascade' runs them one at a time in
+    # CASCADE_ORDER and stops once a distance is CASCADE_MARGIN * threshold
+    # away from the threshold (see face_cascade.py)
+    'POLICY': 'all',
+    'CASCADE_ORDER': ['Facenet', 'ArcFace', 'Dlib', 'VGG-Face'],
+    'CASCADE_MARGIN': 0.25,
+    # Asynchronous jobs (face_jobs.py): seconds an idle worker sleeps between
+    # polls, after which a running job is assumed lost and requeued, and over
+    # which job_metrics reports wait and run times
+    'JOB_POLL_SECONDS': 1.0,
+    'JOB_STALE_SECONDS': 300,
+    'JOB_MAX_ATTEMPTS': 3,
+    'JOB_METRICS_WINDOW': 3600,
+    # Duplicate-provider detection (face_index.py): signups are searched
+    # against the DUPLICATE_MODEL embeddings of every provider for the
+    # DUPLICATE_TOP_K most similar faces. DUPLICATE_NLIST > 0 trains an IVF
+    # quantizer when the index is built and searches DUPLICATE_NPROBE lists.
+    # manage.py build_face_index saves it to DUPLICATE_INDEX_PATH, which
+    # workers memory-map, and workers sync newer embeddings from the
+    # database every DUPLICATE_SYNC_SECONDS
+    'DUPLICATE_CHECK': True,
+    'DUPLICATE_MODEL': 'Facenet',
+    'DUPLICATE_TOP_K': 5,
+    'DUPLICATE_NLIST': 0,
+    'DUPLICATE_NPROBE': 8,
+    'DUPLICATE_INDEX_PATH': None,
+    'DUPLICATE_SYNC_SECONDS': 60,
+}
+
+COLD, LOADING, READY, FAILED = 'cold', 'loading', 'ready', 'failed'
+
+# Loaded TFLite graphs by path, shared by every thread
+_embedders = {}
+_embedders_lock = threading.Lock()
+
+# Blank image pushed through each model once so lazy graph construction
+# happens at load time instead of on the first request
+WARMUP_IMAGE = np.zeros((224, 224, 3), dtype=np.uint8)
+
+
+def face_verification_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'FACE_VERIFICATION', {})}
+
+
+def decode_image(source):
+    """
+    Decode an image once into a BGR array. Accepts an array (returned as is),
+    a file path, raw bytes or an uploaded file, which is read from its buffer
+    without touching the disk. Returns None if it is not a readable image.
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, str):
+        return cv2.imread(source)
+    if hasattr(source, 'chunks'):
+        data = b''.join(source.chunks())
+    elif hasattr(source, 'read'):
+        data = source.read()
+    else:
+        data = source
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def tflite_embedder(model_name):
+    """
+    The converted graph of ``model_name`` when BACKEND is 'tflite', or None
+    to use the DeepFace model (Keras backend, or no graph converted for it).
+    """
+    config = face_verification_settings()
+    if config['BACKEND'] != 'tflite':
+        return None
+    path = graph_path(config['TFLITE_DIR'], model_name, config['TFLITE_QUANTIZATION'])
+    with _embedders_lock:
+        if path not in _embedders:
+            _embedders[path] = TFLiteEmbedder(
+                path, config['TFLITE_THREADS'], l2_normalize=model_name == 'VGG-Face'
+            ) if os.path.exists(path) else None
+        return _embedders[path]
+
+
+def build_and_warm(model_name):
+    """Build one model, run a blank image through it and return load stats."""
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    embedder = tflite_embedder(model_name)
+    model = embedder or DeepFace.build_model(model_name)
+    loaded = time.perf_counter()
+    if embedder:
+        embedder.forward(np.zeros((1, *embedder.input_shape, 3), dtype=np.float32))
+    else:
+        DeepFace.represent(
+            img_path=WARMUP_IMAGE,
+            model_name=model_name,
+            detector_backend='skip',
+            enforce_detection=False,
+        )
+    return model, {
+        'load_seconds': round(loaded - start, 3),
+        'warmup_seconds': round(time.perf_counter() - loaded, 3),
+        'memory_bytes': max(rss_bytes() - rss_before, 0),
+    }
+
+
+def run_model(model_name, image1, image2, threshold_multiplier):
+    """
+    Verify one pair of aligned face crops (see face_detection.py) with one
+    model and apply the threshold multiplier.
+    """
+    if tflite_embedder(model_name):
+        from .face_embeddings import compare_embeddings
+
+        return compare_embeddings(
+            model_name, represent_model(model_name, image1), represent_model(model_name, image2),
+            threshold_multiplier
+        )
+
+    result = DeepFace.verify(
+        img1_path=image1,
+        img2_path=image2,
+        model_name=model_name,
+        detector_backend='skip',  # Already detected and aligned
+        enforce_detection=False
+    )
+
+    adjusted_threshold = result['threshold'] * threshold_multiplier
+    return {
+        'model': model_name,
+        'verified': result['distance'] < adjusted_threshold,
+        'distance': result['distance'],
+        'threshold': adjusted_threshold
+    }
+
+
+def represent_model(model_name, image):
+    """Embedding of an aligned face crop, preprocessed the way DeepFace.verify does it."""
+    if tflite_embedder(model_name):
+        return forward_batch(model_name, [preprocess_face(model_name, image)])[0]
+
+    faces = DeepFace.represent(
+        img_path=image,
+        model_name=model_name,
+        detector_backend='skip',  # Already detected and aligned
+        enforce_detection=False
+    )
+    return np.asarray(faces[0]['embedding'], dtype=np.float32)
+
+
+def preprocess_face(model_name, image):
+    """
+    Resize and normalize an aligned face crop the way DeepFace.represent
+    does, without running the network. Returns a (1, height, width, 3)
+    batch of one for forward_batch.
+    """
+    faces = detection.extract_faces(
+        img_path=image,
+        detector_backend='skip',  # Already detected and aligned
+        grayscale=False,
+        enforce_detection=False,
+    )
+    face = faces[0]['face'][:, :, ::-1]  # extract_faces returns RGB, the models expect BGR
+    embedder = tflite_embedder(model_name)
+    height, width = (embedder or DeepFace.build_model(model_name)).input_shape[:2]
+    face = preprocessing.resize_image(img=face, target_size=(width, height))
+    return preprocessing.normalize_input(img=face, normalization='base')
+
+
+def forward_batch(model_name, faces):
+    """Embed a batch of preprocessed faces in one forward pass. Returns an (n, dim) float32 array."""
+    batch = np.concatenate(faces)
+    embedder = tflite_embedder(model_name)
+    if embedder:
+        return embedder.forward(batch)
+    return keras_forward(model_name, batch)
+
+
+def keras_forward(model_name, batch):
+    """Embed an (n, h, w, 3) batch with the DeepFace (Keras) model."""
+    model = DeepFace.build_model(model_name)
+    if not hasattr(model, 'model') or model_name == 'Dlib':
+        # Not a Keras graph; embed one by one
+        return np.asarray([model.forward(face[np.newaxis]) for face in batch], dtype=np.float32)
+    embeddings = np.asarray(model.model(batch, training=False), dtype=np.float32)
+    if model_name == 'VGG-Face':
+        # VggFaceClient.forward normalizes its output
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings
+
+
+def rss_bytes():
+    """Resident set size of this process."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Peak rather than current RSS, but good enough off Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class FaceModelRegistry:
+    """Loads, warms and holds the face verification models for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._local = threading.local()
+        self.models = {}
+        self.state = COLD
+        self.error = None
+        self.model_stats = {}
+        self.load_seconds = 0.0
+
+    @property
+    def model_names(self):
+        return list(face_verification_settings()['MODELS'])
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    @property
+    def eye_cascade(self):
+        eye_cascade = getattr(self._local, 'eye_cascade', None)
+        if eye_cascade is None:
+            eye_cascade = self._local.eye_cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + 'haarcascade_eye.xml'
+            )
+        return eye_cascade
+
+    def prepare_face(self, image):
+        """Aligned crop of the single face in ``image``; see face_detection.prepare_face."""
+        return prepare_face(
+            decode_image(image), self.cascade, self.eye_cascade,
+            face_verification_settings()['DETECTION_MAX_SIDE']
+        )
+
+    @property
+    def cascade(self):
+        # CascadeClassifier is not safe to share across threads, so each
+        # request thread keeps its own (loaded once per thread, not per request)
+        cascade = getattr(self._local, 'cascade', None)
+        if cascade is None:
+            cascade = self._local.cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+            )
+        return cascade
+
+    def load(self):
+        """Load and warm every configured model. Safe to call more than once."""
+        with self._lock:
+            if self.state == READY:
+                return
+            self.state = LOADING
+            start = time.perf_counter()
+            try:
+                self.cascade
+                execution = face_verification_settings()['EXECUTION']
+                if execution == 'parallel':
+                    # The models live in the shared pool service (manage.py
+                    # run_face_pool); this worker only checks it is reachable
+                    from .face_pool import face_pool_client
+
+                    self.model_stats = face_pool_client.stats()['workers']
+                elif execution == 'server':
+                    # Same for the inference server (manage.py run_inference_server)
+                    from .inference_server import inference_client
+
+                    inference_client.stats()
+                else:
+                    for model_name in self.model_names:
+                        self.models[model_name], self.model_stats[model_name] = build_and_warm(model_name)
+            except Exception as exc:
+                self.state = FAILED
+                self.error = str(exc)
+                logger.exception('Loading face models failed')
+            else:
+                self.state = READY
+                self.error = None
+            finally:
+                self.load_seconds = time.perf_counter() - start
+                self._loaded.set()
+
+        if self.ready:
+            logger.info('Face models ready in %.1fs: %s', self.load_seconds, self.model_stats)
+
+    def start(self):
+        """Load the models in a background thread if PRELOAD is enabled."""
+        if self.state != COLD or not face_verification_settings()['PRELOAD']:
+            return
+        threading.Thread(target=self.load, name='face-model-loader', daemon=True).start()
+
+    def wait(self, timeout=None):
+        """Block until the models are loaded, loading them here if nobody has started."""
+        if self.ready:
+            return True
+        if self.state in (COLD, FAILED):
+            self.load()
+        self._loaded.wait(timeout)
+        return self.ready
+
+    def recheck(self):
+        """Retry a failed remote check; the pool or inference server may have come up since."""
+        if self.state == FAILED and face_verification_settings()['EXECUTION'] in ('parallel', 'server'):
+            self.load()
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'error': self.error,
+            'load_seconds': round(self.load_seconds, 3),
+            'memory_bytes': sum(item['memory_bytes'] for item in self.model_stats.values()),
+            'rss_bytes': rss_bytes(),
+            'models': self.model_stats,
+        }
+
+
+face_models = FaceModelRegistry()
@@ -0,0 +1,331 @@
+"""
+Shared process pool for parallel face verification.
+
+With FACE_VERIFICATION['EXECUTION'] = 'parallel' every model of a
+verification runs as its own task on a pool of POOL_SIZE worker processes,
+so a request takes about as long as its slowest model instead of the sum of
+all of them.
+
+The pool is a single service per host (``manage.py run_face_pool``), not one
+per API worker, so POOL_SIZE bounds the cores verification can take no
+matter how many web workers are running. Web workers send their requests to
+it over POOL_ADDRESS with multiprocessing.connection and never load the
+networks themselves. Each pool worker loads and warms every model once when
+it starts.
+
+A running task cannot be cancelled. When a model misses MODEL_TIMEOUT, the
+pool's workers are killed and a fresh executor is warmed in the background,
+rather than leaving a slot busy that every later request would queue
+behind. Other requests that were in flight on the killed workers report
+their models as failed.
+
+Workers are started with the 'spawn' method: forking a process that
+already runs TensorFlow threads is not safe.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from multiprocessing.connection import AuthenticationError, Client, answer_challenge, deliver_challenge
+
+from django.conf import settings
+
+from .face_models import build_and_warm, face_verification_settings, represent_model, run_model
+
+logger = logging.getLogger(__name__)
+
+# Seconds a client waits on top of MODEL_TIMEOUT before giving up on the pool
+CLIENT_TIMEOUT_SLACK = 5
+
+# Seconds a connecting client gets to complete the authkey handshake
+HANDSHAKE_TIMEOUT = 5
+
+# Loaded models of the current worker process, filled by _init_worker
+_worker_stats = {}
+
+
+def _init_worker(model_names):
+    # Spawned workers start from a blank interpreter; DJANGO_SETTINGS_MODULE
+    # is inherited from the pool service
+    import django
+
+    django.setup()
+    for model_name in model_names:
+        _, _worker_stats[model_name] = build_and_warm(model_name)
+
+
+def _worker_info():
+    return os.getpid(), dict(_worker_stats)
+
+
+def pool_address():
+    host, port = face_verification_settings()['POOL_ADDRESS']
+    return host, int(port)
+
+
+def pool_authkey():
+    authkey = face_verification_settings().get('POOL_AUTHKEY')
+    if authkey:
+        return authkey.encode() if isinstance(authkey, str) else authkey
+    return hashlib.sha256(settings.SECRET_KEY.encode()).digest()
+
+
+class FaceVerificationPool:
+    """ProcessPoolExecutor running one task per model, recycled after a timeout."""
+
+    def __init__(self, size=None, timeout=None, runner=run_model, model_names=None):
+        self._size = size
+        self._timeout = timeout
+        self._model_names = model_names
+        self.runner = runner
+        self.recycles = 0
+        self._executor = None
+        self._closed = False
+        self._started = None
+        self._worker_stats = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self._size or face_verification_settings()['POOL_SIZE']
+
+    @property
+    def timeout(self):
+        return self._timeout or face_verification_settings()['MODEL_TIMEOUT']
+
+    @property
+    def model_names(self):
+        if self._model_names is not None:
+            return list(self._model_names)
+        return list(face_verification_settings()['MODELS'])
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Face verification pool is shut down')
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.size,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.model_names,),
+                )
+            return self._executor
+
+    def start(self):
+        """Start the workers and wait for their models. Returns load stats per model and worker."""
+        with self._start_lock:
+            executor = self.executor
+            if self._started is executor:
+                return self._worker_stats
+            futures = [executor.submit(_worker_info) for _ in range(self.size)]
+            stats = {}
+            for future in futures:
+                pid, models = future.result()
+                for model_name, model_stats in models.items():
+                    stats[f'{model_name}@{pid}'] = model_stats
+            self._started, self._worker_stats = executor, stats
+            return stats
+
+    def verify(self, model_names, image1, image2, threshold_multiplier):
+        """
+        Run every model concurrently. Returns results in model order; a model
+        that fails or does not answer within the timeout is reported as not
+        verified with an 'error'.
+        """
+        results = []
+        for model_name, result in self._run(self.runner, model_names, image1, image2, threshold_multiplier):
+            if isinstance(result, Exception):
+                result = {'model': model_name, 'verified': False, 'error': str(result)}
+            results.append(result)
+        return results
+
+    def represent(self, model_names, image):
+        """Embed one image with every model concurrently. Returns {model: float32 vector}."""
+        embeddings = {}
+        for model_name, result in self._run(represent_model, model_names, image):
+            if isinstance(result, Exception):
+                raise RuntimeError(f'{model_name}: {result}')
+            embeddings[model_name] = result
+        return embeddings
+
+    def _run(self, func, model_names, *args):
+        """Submit ``func(model_name, *args)`` per model; yields (model_name, result or exception)."""
+        # Warm-up (first use or after a recycle) does not count against the deadline
+        self.start()
+        executor = self.executor
+        deadline = time.monotonic() + self.timeout
+        futures = [(model_name, executor.submit(func, model_name, *args)) for model_name in model_names]
+
+        results = []
+        timed_out = False
+        for model_name, future in futures:
+            try:
+                results.append((model_name, future.result(timeout=max(deadline - time.monotonic(), 0))))
+            except TimeoutError:
+                timed_out = True
+                results.append((model_name, TimeoutError(f'Timed out after {self.timeout}s')))
+            except Exception as exc:
+                results.append((model_name, exc))
+
+        if timed_out:
+            self._recycle(executor)
+        return results
+
+    def _recycle(self, executor):
+        """Kill the workers of ``executor`` so stuck tasks stop holding pool slots."""
+        with self._lock:
+            if self._executor is not executor:
+                # Another request already recycled it
+                return
+            self._executor = None
+            self.recycles += 1
+        self._kill(executor)
+        logger.warning('Face verification pool recycled after a model timeout')
+        threading.Thread(target=self._warm_quietly, name='face-pool-warmup', daemon=True).start()
+
+    def _warm_quietly(self):
+        try:
+            self.start()
+        except Exception:
+            logger.exception('Warming the face verification pool failed')
+
+    @staticmethod
+    def _kill(executor):
+        processes = list((executor._processes or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'timeout': self.timeout,
+            'recycles': self.recycles,
+            'workers': self._worker_stats,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._closed = True
+        if executor is not None:
+            self._kill(executor)
+
+
+def _disconnect(conn):
+    # Shutting the socket down wakes a recv() blocked on a silent client
+    try:
+        with socket.socket(fileno=os.dup(conn.fileno())) as sock:
+            sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def _authenticate(conn, authkey):
+    """The handshake Listener.accept() does with an authkey, cut off after HANDSHAKE_TIMEOUT."""
+    lock = threading.Lock()
+    finished = False
+
+    def expire():
+        with lock:
+            if not finished:
+                _disconnect(conn)
+
+    timer = threading.Timer(HANDSHAKE_TIMEOUT, expire)
+    timer.start()
+    try:
+        deliver_challenge(conn, authkey)
+        answer_challenge(conn, authkey)
+    finally:
+        with lock:
+            finished = True
+        timer.cancel()
+
+
+def _handle(pool, conn, authkey=None):
+    with conn:
+        if authkey:
+            try:
+                _authenticate(conn, authkey)
+            except (AuthenticationError, EOFError, OSError) as exc:
+                logger.warning('Rejected face pool connection: %s', exc)
+                return
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        try:
+            if request[0] == 'verify':
+                payload = pool.verify(*request[1:])
+            elif request[0] == 'represent':
+                payload = pool.represent(*request[1:])
+            elif request[0] == 'stats':
+                payload = pool.stats()
+            else:
+                raise ValueError(f'Unknown request {request[0]!r}')
+            conn.send(('ok', payload))
+        except Exception as exc:
+            conn.send(('error', str(exc)))
+
+
+def serve(pool, listener, stop=None, authkey=None):
+    """
+    Answer verification requests from the web workers until the listener is
+    closed or ``stop`` is set (checked after each accepted connection).
+
+    ``listener`` must be created without an authkey: Listener.accept() would
+    run the handshake on this thread, where one slow or misbehaving client
+    holds up every other connection. The handshake with ``authkey`` is done
+    on the connection's own thread instead.
+    """
+    while stop is None or not stop.is_set():
+        try:
+            conn = listener.accept()
+        except OSError:
+            return
+        except Exception:
+            logger.exception('Rejected face pool connection')
+            continue
+        if stop is not None and stop.is_set():
+            conn.close()
+            return
+        threading.Thread(target=_handle, args=(pool, conn, authkey), daemon=True).start()
+
+
+class FacePoolClient:
+    """Used by the web workers to run verifications on the shared pool service."""
+
+    def __init__(self, address=None, authkey=None):
+        self._address = address
+        self._authkey = authkey
+
+    def _call(self, message, timeout):
+        with Client(self._address or pool_address(), authkey=self._authkey or pool_authkey()) as conn:
+            conn.send(message)
+            if not conn.poll(timeout):
+                raise TimeoutError('Face verification pool did not answer')
+            status, payload = conn.recv()
+        if status != 'ok':
+            raise RuntimeError(payload)
+        return payload
+
+    def verify(self, model_names, image1, image2, threshold_multiplier):
+        timeout = face_verification_settings()['MODEL_TIMEOUT'] + CLIENT_TIMEOUT_SLACK
+        return self._call(('verify', model_names, image1, image2, threshold_multiplier), timeout)
+
+    def represent(self, model_names, image):
+        timeout = face_verification_settings()['MODEL_TIMEOUT'] + CLIENT_TIMEOUT_SLACK
+        return self._call(('represent', model_names, image), timeout)
+
+    def stats(self):
+        return self._call(('stats',), CLIENT_TIMEOUT_SLACK)
+
+
+face_pool_client = FacePoolClient()
@@ -0,0 +1,179 @@
+from math import radians, degrees, cos, sin, asin, sqrt, floor
+
+import numpy as np
+from django.db.models import Q
+
+# Radius of earth in kilometers
+EARTH_RADIUS_KM = 6371
+
+# Providers are bucketed into a fixed lat/lon grid. A 0.25 degree cell is
+# ~27.8 km tall, so the default 25 km search never spans more than 3x3 cells.
+GRID_CELL_DEGREES = 0.25
+GRID_COLUMNS = int(360 / GRID_CELL_DEGREES)
+
+# Above this many cells an IN (...) list stops paying off and the bounding
+# box range filter alone is used.
+MAX_GRID_CELLS = 64
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate the great circle distance between two points
+    on the earth (specified in decimal degrees)
+    """
+    # Convert decimal degrees to radians
+    lat1, lon1, lat2, lon2 = map(radians, [float(lat1), float(lon1), float(lat2), float(lon2)])
+
+    # Haversine formula
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+    return c * EARTH_RADIUS_KM
+
+
+def haversine_distances(latitude, longitude, latitudes, longitudes):
+    """
+    Vectorized haversine: great circle distances in km from one point to
+    every point in the given latitude/longitude arrays (decimal degrees).
+    """
+    lat1 = np.radians(float(latitude))
+    lon1 = np.radians(float(longitude))
+    lat2 = np.radians(np.ascontiguousarray(latitudes, dtype=np.float64))
+    lon2 = np.radians(np.ascontiguousarray(longitudes, dtype=np.float64))
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    # Clip guards against rounding pushing a fraction past 1.0
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_within(latitude, longitude, latitudes, longitudes, radius_km):
+    """
+    Compute distances, apply the radius mask and order the matches in one pass.
+
+    Returns (indices, distances): positions into the input arrays of every
+    point within radius_km, nearest first, and their distances in km.
+    """
+    distances = haversine_distances(latitude, longitude, latitudes, longitudes)
+    indices = np.flatnonzero(distances <= float(radius_km))
+    order = np.argsort(distances[indices], kind='stable')
+    indices = indices[order]
+    return indices, distances[indices]
+
+
+def nearest_k(latitude, longitude, latitudes, longitudes, keys, k, radius_km=None, after=None):
+    """
+    Select the k nearest points, ordered by (distance, key).
+
+    ``keys`` is a unique, sortable id per point used to break distance ties.
+    ``after`` is an optional (distance, key) position; only points strictly
+    after it are considered, which gives stable keyset pages. The selection
+    is a partial partition, so the cost of ordering depends on k rather than
+    on the number of points in range.
+
+    Returns (indices, distances) like nearest_within.
+    """
+    distances = haversine_distances(latitude, longitude, latitudes, longitudes)
+    keys = np.asarray(keys)
+
+    mask = np.ones(len(distances), dtype=bool)
+    if radius_km is not None:
+        mask &= distances <= float(radius_km)
+    if after is not None:
+        after_distance, after_key = after
+        mask &= (distances > after_distance) | ((distances == after_distance) & (keys > after_key))
+    candidates = np.flatnonzero(mask)
+
+    if len(candidates) > k:
+        # Keep everything up to the k-th distance so ties are broken by key
+        kth = np.partition(distances[candidates], k - 1)[k - 1]
+        candidates = candidates[distances[candidates] <= kth]
+
+    order = np.lexsort((keys[candidates], distances[candidates]))[:k]
+    indices = candidates[order]
+    return indices, distances[indices]
+
+
+def _grid_row(latitude):
+    return floor((float(latitude) + 90) / GRID_CELL_DEGREES)
+
+
+def _grid_column(longitude):
+    return floor((float(longitude) + 180) / GRID_CELL_DEGREES) % GRID_COLUMNS
+
+
+def grid_cell(latitude, longitude):
+    """Return the grid cell number containing the given coordinates."""
+    return _grid_row(latitude) * GRID_COLUMNS + _grid_column(longitude)
+
+
+def grid_cells(latitudes, longitudes):
+    """Vectorized grid_cell for arrays of coordinates."""
+    rows = np.floor((np.asarray(latitudes, dtype=np.float64) + 90) / GRID_CELL_DEGREES)
+    columns = np.floor((np.asarray(longitudes, dtype=np.float64) + 180) / GRID_CELL_DEGREES) % GRID_COLUMNS
+    return (rows * GRID_COLUMNS + columns).astype(np.int32)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Return (min_lat, max_lat, min_lon, max_lon) enclosing every point within
+    radius_km of the given coordinates. The longitude bounds are None when the
+    circle touches a pole or crosses the antimeridian.
+    """
+    latitude = float(latitude)
+    longitude = float(longitude)
+    angular_radius = float(radius_km) / EARTH_RADIUS_KM
+
+    min_lat = latitude - degrees(angular_radius)
+    max_lat = latitude + degrees(angular_radius)
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90), min(max_lat, 90), None, None
+
+    lon_delta = degrees(asin(min(1.0, sin(angular_radius) / cos(radians(latitude)))))
+    min_lon = longitude - lon_delta
+    max_lon = longitude + lon_delta
+    if min_lon < -180 or max_lon > 180:
+        return min_lat, max_lat, None, None
+
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def grid_cells_for_box(min_lat, max_lat, min_lon, max_lon):
+    """
+    Return the grid cells overlapping a bounding box, or None when the box is
+    unbounded in longitude or covers more than MAX_GRID_CELLS cells.
+    """
+    if min_lon is None or max_lon is None:
+        return None
+
+    rows = range(_grid_row(min_lat), _grid_row(max_lat) + 1)
+    first, last = _grid_column(min_lon), _grid_column(max_lon)
+    if last >= first:
+        columns = range(first, last + 1)
+    else:
+        # max_lon == 180 wraps to column 0, where longitude 180 is stored
+        columns = [*range(first, GRID_COLUMNS), *range(0, last + 1)]
+    if len(rows) * len(columns) > MAX_GRID_CELLS:
+        return None
+
+    return [row * GRID_COLUMNS + column for row in rows for column in columns]
+
+
+def nearby_filter(latitude, longitude, radius_km):
+    """
+    Build a Q object that narrows a ServiceProvider queryset down to providers
+    inside the bounding box of the search circle, using the indexed grid cell
+    column. Rows returned are candidates only; callers still apply the exact
+    distance.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+
+    lookups = {'latitude__range': (min_lat, max_lat)}
+    if min_lon is not None:
+        lookups['longitude__range'] = (min_lon, max_lon)
+
+    cells = grid_cells_for_box(min_lat, max_lat, min_lon, max_lon)
+    if cells is not None:
+        lookups['grid_cell__in'] = cells
+
+    return Q(**lookups)
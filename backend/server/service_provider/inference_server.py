@@ -0,0 +1,199 @@
+"""
+Local face inference server with cross-request dynamic batching.
+
+Every Django worker used to push its own batch of one through TensorFlow.
+With FACE_VERIFICATION['EXECUTION'] = 'server' they send images to one
+inference server per host instead (``manage.py run_inference_server``),
+which holds the models. Detection and preprocessing run in the gRPC
+handler threads, in parallel across requests. The network forward pass
+goes through a MicroBatcher per model, which gathers faces from all
+callers until BATCH_MAX_SIZE is reached or the oldest has waited
+BATCH_MAX_WAIT_MS, and runs them as one batch.
+
+The service is plain gRPC with generic handlers, so no generated stubs are
+needed. Messages are NumPy .npz archives: a JSON header plus named arrays.
+"""
+import io
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import grpc
+import numpy as np
+
+from .face_models import face_verification_settings, forward_batch, preprocess_face
+
+logger = logging.getLogger(__name__)
+
+SERVICE = 'faceinference.FaceInference'
+
+
+def encode_message(header, arrays=None):
+    buffer = io.BytesIO()
+    np.savez(buffer, __header__=np.frombuffer(json.dumps(header).encode(), dtype=np.uint8), **(arrays or {}))
+    return buffer.getvalue()
+
+
+def decode_message(data):
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        header = json.loads(archive['__header__'].tobytes())
+        return header, {name: archive[name] for name in archive.files if name != '__header__'}
+
+
+class MicroBatcher:
+    """Collects items from many threads and runs ``forward`` on them in batches."""
+
+    def __init__(self, forward, max_batch, max_wait, name='batcher'):
+        self.forward = forward
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self.batches = 0
+        self.items = 0
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queue one item; the Future resolves to its row of the batch output."""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        pending = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(pending) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return pending
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            pending = self._collect()
+            if not pending:
+                continue
+            try:
+                outputs = self.forward([item for item, _ in pending])
+            except Exception as exc:
+                for _, future in pending:
+                    future.set_exception(exc)
+                continue
+            self.batches += 1
+            self.items += len(pending)
+            for (_, future), output in zip(pending, outputs):
+                future.set_result(output)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch': round(self.items / self.batches, 2) if self.batches else 0,
+            'queued': self._queue.qsize(),
+        }
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+class InferenceService:
+    """Embeds images with the resident models, batching forward passes across requests."""
+
+    def __init__(self, model_names, max_batch, max_wait, preprocess=preprocess_face, forward=forward_batch):
+        self.preprocess = preprocess
+        self.batchers = {
+            model_name: MicroBatcher(
+                lambda faces, model_name=model_name: forward(model_name, faces),
+                max_batch, max_wait, name=f'batcher-{model_name}'
+            )
+            for model_name in model_names
+        }
+
+    def embed(self, model_names, image, timeout):
+        futures = {
+            model_name: self.batchers[model_name].submit(self.preprocess(model_name, image))
+            for model_name in model_names
+        }
+        return {model_name: future.result(timeout) for model_name, future in futures.items()}
+
+    def handle_embed(self, request, context):
+        header, arrays = decode_message(request)
+        unknown = set(header['models']) - set(self.batchers)
+        if unknown:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, f'Models not loaded: {sorted(unknown)}')
+        embeddings = self.embed(header['models'], arrays['image'], face_verification_settings()['MODEL_TIMEOUT'])
+        return encode_message({'models': list(embeddings)}, embeddings)
+
+    def handle_stats(self, request, context):
+        return encode_message({model_name: batcher.stats() for model_name, batcher in self.batchers.items()})
+
+    def handler(self):
+        return grpc.method_handlers_generic_handler(SERVICE, {
+            'Embed': grpc.unary_unary_rpc_method_handler(self.handle_embed),
+            'Stats': grpc.unary_unary_rpc_method_handler(self.handle_stats),
+        })
+
+    def stop(self):
+        for batcher in self.batchers.values():
+            batcher.stop()
+
+
+def start_server(service, address, threads):
+    """Start a gRPC server for ``service``. Returns (server, bound port)."""
+    server = grpc.server(ThreadPoolExecutor(max_workers=threads))
+    server.add_generic_rpc_handlers((service.handler(),))
+    port = server.add_insecure_port(address)
+    server.start()
+    return server, port
+
+
+class InferenceClient:
+    """Used by FaceMatcher in 'server' mode. One channel per process, shared by all threads."""
+
+    def __init__(self, target=None):
+        self._target = target
+        self._channel = None
+        self._lock = threading.Lock()
+
+    @property
+    def channel(self):
+        with self._lock:
+            if self._channel is None:
+                self._channel = grpc.insecure_channel(self._target or face_verification_settings()['INFERENCE_SERVER'])
+            return self._channel
+
+    def _call(self, method, request, timeout):
+        call = self.channel.unary_unary(f'/{SERVICE}/{method}')
+        return decode_message(call(request, timeout=timeout))
+
+    def represent(self, model_names, image):
+        """Embed one image with each model. Returns {model: float32 vector}."""
+        timeout = face_verification_settings()['MODEL_TIMEOUT']
+        _, embeddings = self._call('Embed', encode_message({'models': list(model_names)}, {'image': image}), timeout)
+        return embeddings
+
+    def stats(self):
+        header, _ = self._call('Stats', encode_message({}), 5)
+        return header
+
+    def close(self):
+        with self._lock:
+            if self._channel is not None:
+                self._channel.close()
+                self._channel = None
+
+
+inference_client = InferenceClient()
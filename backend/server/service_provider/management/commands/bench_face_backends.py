@@ -0,0 +1,97 @@
+import os
+import statistics
+import time
+
+import numpy as np
+from deepface import DeepFace
+from deepface.modules.verification import find_cosine_distance, find_threshold
+from django.core.management.base import BaseCommand, CommandError
+
+from service_provider.face_cascade import labelled_pairs
+from service_provider.face_models import (
+    face_models, face_verification_settings, keras_forward, preprocess_face, rss_bytes
+)
+from service_provider.tflite_backend import QUANTIZATIONS, TFLiteEmbedder, graph_path
+
+
+def timed_embeddings(forward, faces):
+    embeddings, timings = {}, []
+    for path, face in faces.items():
+        start = time.perf_counter()
+        embeddings[path] = forward(face)[0]
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return embeddings, statistics.median(timings), timings[max(int(len(timings) * 0.95) - 1, 0)]
+
+
+def decisions(model_name, embeddings, pairs):
+    threshold = find_threshold(model_name, 'cosine')
+    return [find_cosine_distance(embeddings[path1], embeddings[path2]) < threshold for _, path1, path2 in pairs]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the TFLite face embedding graphs with the DeepFace (Keras) reference on a labelled image set '
+        '(one directory per person): embedding similarity, decision parity, accuracy, latency and memory.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('image_dir')
+        parser.add_argument('--models', nargs='+', help='Models to compare (default: FACE_VERIFICATION MODELS)')
+        parser.add_argument('--quantizations', nargs='+', choices=QUANTIZATIONS, default=list(QUANTIZATIONS))
+        parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+        parser.add_argument('--tflite-dir', default=face_verification_settings()['TFLITE_DIR'])
+        parser.add_argument('--max-pairs', type=int, default=200)
+
+    def handle(self, *args, **options):
+        pairs = labelled_pairs(options['image_dir'], options['max_pairs'])
+        if not pairs:
+            raise CommandError(f'No labelled image pairs found in {options["image_dir"]}')
+        images = {path: face_models.prepare_face(path)[0] for _, *pair in pairs for path in pair}
+        pairs = [(same, path1, path2) for same, path1, path2 in pairs
+                 if images[path1] is not None and images[path2] is not None]
+        images = {path: image for path, image in images.items() if image is not None}
+        labels = [same_person for same_person, _, _ in pairs]
+
+        self.stdout.write(
+            f"{'model':>9} {'backend':>15} {'threads':>7} {'min cos':>8} {'agree':>6} {'accuracy':>8} "
+            f"{'p50 ms':>7} {'p95 ms':>7} {'RSS MiB':>8}"
+        )
+        for model_name in options['models'] or face_models.model_names:
+            rss_before = rss_bytes()
+            model = DeepFace.build_model(model_name)
+            if not hasattr(model, 'model') or model_name == 'Dlib':
+                self.stderr.write(f'{model_name}: not a Keras model, skipped')
+                continue
+            faces = {path: preprocess_face(model_name, image) for path, image in images.items()}
+            keras_forward(model_name, next(iter(faces.values())))
+            keras_memory = rss_bytes() - rss_before
+
+            reference, p50, p95 = timed_embeddings(lambda face: keras_forward(model_name, face), faces)
+            reference_decisions = decisions(model_name, reference, pairs)
+            accuracy = np.mean([decision == label for decision, label in zip(reference_decisions, labels)])
+            self.stdout.write(
+                f"{model_name:>9} {'keras':>15} {'-':>7} {1.0:>8.4f} {1.0:>6.3f} {accuracy:>8.3f} "
+                f"{p50:>7.1f} {p95:>7.1f} {keras_memory / 2 ** 20:>8.1f}"
+            )
+
+            for quantization in options['quantizations']:
+                path = graph_path(options['tflite_dir'], model_name, quantization)
+                if not os.path.exists(path):
+                    self.stderr.write(f'{model_name}: no {quantization} graph at {path}, run convert_face_models')
+                    continue
+                for threads in options['threads']:
+                    rss_before = rss_bytes()
+                    embedder = TFLiteEmbedder(path, threads, l2_normalize=model_name == 'VGG-Face')
+                    embedder.forward(next(iter(faces.values())))
+                    memory = rss_bytes() - rss_before
+
+                    embeddings, p50, p95 = timed_embeddings(embedder.forward, faces)
+                    similarity = min(1 - find_cosine_distance(reference[path], embeddings[path]) for path in faces)
+                    backend_decisions = decisions(model_name, embeddings, pairs)
+                    agreement = np.mean([a == b for a, b in zip(reference_decisions, backend_decisions)])
+                    accuracy = np.mean([decision == label for decision, label in zip(backend_decisions, labels)])
+                    self.stdout.write(
+                        f"{model_name:>9} {'tflite-' + quantization:>15} {threads:>7} {similarity:>8.4f} "
+                        f"{agreement:>6.3f} {accuracy:>8.3f} {p50:>7.1f} {p95:>7.1f} {memory / 2 ** 20:>8.1f}"
+                    )
@@ -0,0 +1,124 @@
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from service_provider.face_index import FaceIndex, key_uuids, normalize
+
+
+def timing_summary(timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+    return statistics.median(timings), p95
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the duplicate-provider face index on synthetic embeddings: recall@k and '
+        'query latency of the flat and IVF searches, training, incremental updates and '
+        'memory-mapped loading. No database rows are touched.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help='Comma separated provider counts to benchmark')
+        parser.add_argument('--dimensions', type=int, default=128, help='Embedding size (Facenet: 128)')
+        parser.add_argument('--k', type=int, default=5, help='Neighbours returned per query')
+        parser.add_argument('--queries', type=int, default=200, help='Queries per size')
+        parser.add_argument('--nlist', type=int,
+                            help='Inverted lists to train (default: 4 * sqrt(providers))')
+        parser.add_argument('--nprobe', default='1,4,8,16,32', help='Comma separated lists probed per query')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        k = options['k']
+        nprobes = [int(nprobe) for nprobe in options['nprobe'].split(',')]
+
+        self.stdout.write(
+            f"{'providers':>10} {'search':>10} {'recall@k':>9} {'dup found':>10} {'median ms':>10} {'p95 ms':>10}"
+        )
+        for size in (int(size) for size in options['sizes'].split(',')):
+            provider_ids = [uuid.uuid4() for _ in range(size)]
+            vectors = self._embeddings(size, options['dimensions'], rng)
+            # A duplicate signup: an existing provider's face in a new photo
+            sources = rng.choice(size, options['queries'], replace=False)
+            noise = rng.normal(0, 0.2 / np.sqrt(options['dimensions']), (len(sources), options['dimensions']))
+            queries = normalize(vectors[sources] + noise)
+
+            index = FaceIndex.from_vectors(provider_ids, vectors)
+            exact = self._run(size, 'flat', index, queries, sources, provider_ids, k, None)
+
+            nlist = options['nlist'] or int(4 * np.sqrt(size))
+            start = time.perf_counter()
+            index.train(nlist)
+            self.stdout.write(
+                f"{size:>10} trained {nlist} lists in {time.perf_counter() - start:.2f}s, "
+                f"{index.nbytes / 1024 / 1024:.1f} MiB"
+            )
+            for nprobe in nprobes:
+                if nprobe < nlist:
+                    self._run(size, f'ivf/{nprobe}', index, queries, sources, provider_ids, k, nprobe, exact)
+
+            self._updates(size, index, rng)
+            self._persistence(size, index, queries, k, nprobes[-1])
+
+    def _embeddings(self, size, dimensions, rng):
+        """Unit vectors scattered around size / 100 cluster centres, standing in for face embeddings."""
+        centers = normalize(rng.normal(size=(max(size // 100, 1), dimensions)))
+        noise = rng.normal(0, 0.6 / np.sqrt(dimensions), (size, dimensions)).astype(np.float32)
+        return normalize(centers[rng.integers(len(centers), size=size)] + noise)
+
+    def _run(self, size, name, index, queries, sources, provider_ids, k, nprobe, exact=None):
+        results, timings = [], []
+        for query in queries:
+            start = time.perf_counter()
+            keys, _ = index.search(query, k, nprobe=nprobe)
+            timings.append((time.perf_counter() - start) * 1000)
+            results.append(set(key_uuids(keys)))
+
+        found = sum(provider_ids[source] in result for source, result in zip(sources, results)) / len(sources)
+        recall = 1.0 if exact is None else statistics.mean(
+            len(result & truth) / len(truth) for result, truth in zip(results, exact) if truth
+        )
+        median, p95 = timing_summary(timings)
+        self.stdout.write(
+            f"{size:>10} {name:>10} {recall:>9.3f} {found:>10.3f} {median:>10.2f} {p95:>10.2f}"
+        )
+        return results
+
+    def _updates(self, size, index, rng):
+        added = [uuid.uuid4() for _ in range(1000)]
+        vectors = normalize(rng.normal(size=(len(added), index.dimensions)))
+        start = time.perf_counter()
+        for provider_id, vector in zip(added, vectors):
+            index.add([provider_id], vector)
+        add_ms = (time.perf_counter() - start) * 1000 / len(added)
+        start = time.perf_counter()
+        for provider_id in added:
+            index.remove([provider_id])
+        remove_ms = (time.perf_counter() - start) * 1000 / len(added)
+        self.stdout.write(f"{size:>10} add {add_ms:.3f} ms, remove {remove_ms:.3f} ms per provider")
+
+    def _persistence(self, size, index, queries, k, nprobe):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'providers')
+            start = time.perf_counter()
+            index.save(path)
+            save_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            loaded = FaceIndex.load(path)
+            load_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            loaded.search(queries[0], k, nprobe=nprobe)
+            first_ms = (time.perf_counter() - start) * 1000
+            del loaded
+        self.stdout.write(
+            f"{size:>10} saved in {save_seconds:.2f}s, memory-mapped in {load_ms:.2f} ms, "
+            f"first query {first_ms:.2f} ms"
+        )
@@ -0,0 +1,75 @@
+import statistics
+import threading
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from service_provider.face_models import build_and_warm, forward_batch, preprocess_face
+from service_provider.inference_server import InferenceClient, InferenceService, start_server
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the face inference server end to end over gRPC at different maximum batch sizes, '
+        'with concurrent clients, and reports throughput and latency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-sizes', default='1,2,4,8,16,32',
+                            help='Comma separated BATCH_MAX_SIZE values to benchmark')
+        parser.add_argument('--max-wait-ms', type=float, default=10)
+        parser.add_argument('--clients', type=int, default=32, help='Concurrent client threads')
+        parser.add_argument('--requests', type=int, default=20, help='Requests per client')
+        parser.add_argument('--model', default='Facenet')
+
+    def handle(self, *args, **options):
+        model_name = options['model']
+        build_and_warm(model_name)
+        rng = np.random.default_rng(42)
+        images = [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(8)]
+        face = preprocess_face(model_name, images[0])
+
+        self.stdout.write(
+            f"{'max batch':>9} {'req/s':>8} {'mean batch':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        for max_batch in [int(size) for size in options['batch_sizes'].split(',')]:
+            # Preprocessing is per request either way; reuse one face so the forward pass is measured
+            service = InferenceService(
+                [model_name], max_batch, options['max_wait_ms'] / 1000,
+                preprocess=lambda model_name, image: face, forward=forward_batch
+            )
+            server, port = start_server(service, '127.0.0.1:0', options['clients'])
+            client = InferenceClient(f'127.0.0.1:{port}')
+            client.represent([model_name], images[0])
+
+            latencies = []
+            lock = threading.Lock()
+
+            def run_client(seed):
+                timings = []
+                for i in range(options['requests']):
+                    start = time.perf_counter()
+                    client.represent([model_name], images[(seed + i) % len(images)])
+                    timings.append((time.perf_counter() - start) * 1000)
+                with lock:
+                    latencies.extend(timings)
+
+            threads = [threading.Thread(target=run_client, args=(seed,)) for seed in range(options['clients'])]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            latencies.sort()
+            stats = service.batchers[model_name].stats()
+            self.stdout.write(
+                f"{max_batch:>9} {len(latencies) / elapsed:>8.1f} {stats['mean_batch']:>10.2f} "
+                f"{statistics.median(latencies):>8.1f} {latencies[int(len(latencies) * 0.95) - 1]:>8.1f} "
+                f"{latencies[int(len(latencies) * 0.99) - 1]:>8.1f}"
+            )
+            client.close()
+            server.stop(grace=None)
+            service.stop()
@@ -0,0 +1,140 @@
+import random
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from service.models import Service
+from sub_service.models import SubService
+from service_provider.geo import grid_cell, haversine_distance, nearby_filter, nearest_within
+from service_provider.models import ServiceProvider, ProviderService
+from service_provider.provider_index import provider_index
+
+# Rough bounding box of mainland India
+INDIA_LAT = (8.0, 37.0)
+INDIA_LON = (68.0, 97.0)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the provider radius search against the legacy full-scan path '
+        'on synthetic providers. All generated rows are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help='Comma separated provider counts to benchmark')
+        parser.add_argument('--radius', type=float, default=25, help='Search radius in km')
+        parser.add_argument('--queries', type=int, default=20, help='Queries per size')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        radius = options['radius']
+
+        self.stdout.write(f"{'providers':>10} {'path':>8} {'rows read':>10} {'median ms':>10} {'p95 ms':>10}")
+        for size in sizes:
+            with transaction.atomic():
+                sub_service = self._populate(size, rng)
+                points = [(rng.uniform(*INDIA_LAT), rng.uniform(*INDIA_LON))
+                          for _ in range(options['queries'])]
+
+                index = provider_index.build(sub_service.id)
+                self.stdout.write(
+                    f"{size:>10} resident index built in {index.build_seconds * 1000:.1f} ms, "
+                    f"{index.nbytes / 1024:.1f} KiB"
+                )
+
+                for name, search in (
+                    ('scan', self._full_scan),
+                    ('indexed', self._indexed),
+                    ('resident', self._resident),
+                ):
+                    timings = []
+                    rows_read = 0
+                    for lat, lon in points:
+                        start = time.perf_counter()
+                        rows_read += search(sub_service.id, lat, lon, radius)
+                        timings.append((time.perf_counter() - start) * 1000)
+                    timings.sort()
+                    p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+                    self.stdout.write(
+                        f"{size:>10} {name:>8} {rows_read // len(points):>10} "
+                        f"{statistics.median(timings):>10.2f} {p95:>10.2f}"
+                    )
+
+                provider_index.invalidate(sub_service.id)
+                transaction.set_rollback(True)
+
+    def _populate(self, size, rng):
+        service = Service.objects.create(name=f'Benchmark {rng.random()}')
+        sub_service = SubService.objects.create(name='Benchmark', main_service=service)
+
+        batch_size = 5000
+        for offset in range(0, size, batch_size):
+            providers = []
+            for i in range(offset, min(offset + batch_size, size)):
+                lat = round(rng.uniform(*INDIA_LAT), 6)
+                lon = round(rng.uniform(*INDIA_LON), 6)
+                providers.append(ServiceProvider(
+                    main_service=service,
+                    first_name='Bench',
+                    last_name=f'Provider {i}',
+                    aadhaar=f'9{i:011d}',
+                    gender='O',
+                    mobile_number=f'9{i:09d}',
+                    photo='providers/benchmark.jpg',
+                    street_address='Benchmark street',
+                    city='Benchmark',
+                    state='Karnataka',
+                    postal_code='560001',
+                    latitude=lat,
+                    longitude=lon,
+                    grid_cell=grid_cell(lat, lon),
+                ))
+            ServiceProvider.objects.bulk_create(providers)
+            ProviderService.objects.bulk_create([
+                ProviderService(provider=provider, sub_service=sub_service, price=100)
+                for provider in providers
+            ])
+        return sub_service
+
+    def _full_scan(self, subservice_id, lat, lon, radius):
+        """The original search: every row for the sub-service, distance in Python."""
+        queryset = ProviderService.objects.filter(
+            sub_service_id=subservice_id
+        ).select_related('provider')
+        rows = 0
+        matches = []
+        for provider_service in queryset.iterator(chunk_size=2000):
+            rows += 1
+            provider = provider_service.provider
+            distance = haversine_distance(lat, lon, provider.latitude, provider.longitude)
+            if distance <= radius:
+                matches.append((distance, provider_service))
+        matches.sort(key=lambda match: match[0])
+        return rows
+
+    def _indexed(self, subservice_id, lat, lon, radius):
+        queryset = ProviderService.objects.filter(
+            provider__in=ServiceProvider.objects.filter(
+                nearby_filter(lat, lon, radius)
+            ).values('id'),
+            sub_service_id=subservice_id
+        ).select_related('provider')
+        candidates = list(queryset)
+        nearest_within(
+            lat, lon,
+            np.array([ps.provider.latitude for ps in candidates], dtype=np.float64),
+            np.array([ps.provider.longitude for ps in candidates], dtype=np.float64),
+            radius
+        )
+        return len(candidates)
+
+    def _resident(self, subservice_id, lat, lon, radius):
+        ids, _ = provider_index.get(subservice_id).query_radius(lat, lon, radius)
+        ProviderService.objects.select_related('provider').in_bulk(ids.tolist())
+        return len(ids)
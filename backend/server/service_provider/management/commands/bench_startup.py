@@ -0,0 +1,115 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Child-process bootstrap reproducing the old eager behaviour: the ML stack is
+# imported with the URL conf and the models are preloaded at worker start
+EAGER_BOOTSTRAP = (
+    "import os, runpy, sys; os.environ['FACE_VERIFICATION_PRELOAD'] = '1'; "
+    "import cv2, PIL.Image, deepface.DeepFace; "
+    "sys.argv = sys.argv[1:]; runpy.run_path(sys.argv[0], run_name='__main__')"
+)
+
+
+def rss_of(pid):
+    """Current resident set size of another process, from /proc."""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures startup time and resident memory of manage.py check, a daphne boot and its first request, '
+        'with the face verification stack imported lazily (current) and eagerly (previous behaviour).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/service_providers/',
+                            help='URL requested after daphne boots (default: provider listing)')
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--timeout', type=float, default=300)
+
+    def command(self, mode, *args):
+        manage_py = os.path.join(settings.BASE_DIR, 'manage.py')
+        if mode == 'eager':
+            return [sys.executable, '-c', EAGER_BOOTSTRAP, manage_py, *args]
+        return [sys.executable, manage_py, *args]
+
+    def run_check(self, mode):
+        start = time.perf_counter()
+        process = subprocess.Popen(self.command(mode, 'check'), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return {
+            'seconds': round(time.perf_counter() - start, 3),
+            'max_rss_mib': round(usage.ru_maxrss / 1024, 1),
+            'ok': process.returncode == 0,
+        }
+
+    def run_daphne(self, mode, path, timeout):
+        port = free_port()
+        daphne = [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port), 'server.asgi:application']
+        if mode == 'eager':
+            daphne = [sys.executable, '-c', EAGER_BOOTSTRAP.replace(
+                "runpy.run_path(sys.argv[0], run_name='__main__')", "runpy.run_module('daphne', run_name='__main__')"
+            ), *daphne[2:]]
+
+        start = time.perf_counter()
+        process = subprocess.Popen(daphne, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                if process.poll() is not None or time.perf_counter() - start > timeout:
+                    return {'ok': False}
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            boot_seconds = time.perf_counter() - start
+            boot_rss = rss_of(process.pid)
+
+            request_start = time.perf_counter()
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=timeout).read()
+            except Exception:
+                # Any answer counts; only the cost of serving it matters here
+                pass
+            first_request_seconds = time.perf_counter() - request_start
+            return {
+                'ok': True,
+                'boot_seconds': round(boot_seconds, 3),
+                'boot_rss_mib': round((boot_rss or 0) / 2 ** 20, 1),
+                'first_request_seconds': round(first_request_seconds, 3),
+                'after_request_rss_mib': round((rss_of(process.pid) or 0) / 2 ** 20, 1),
+            }
+        finally:
+            process.terminate()
+            process.wait()
+
+    def handle(self, *args, **options):
+        report = {}
+        for mode in ('eager', 'lazy'):
+            report[mode] = {
+                'check': [self.run_check(mode) for _ in range(options['runs'])],
+                'daphne': [self.run_daphne(mode, options['path'], options['timeout']) for _ in range(options['runs'])],
+            }
+        self.stdout.write(json.dumps(report, indent=2))
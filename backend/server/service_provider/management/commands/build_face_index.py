@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from service_provider.face_index import face_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Builds the duplicate-provider face index from the stored embeddings, optionally '
+        'trains an IVF quantizer, and saves it for workers to memory-map.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nlist', type=int,
+                            help='Inverted lists to train, 0 for a flat index (default: DUPLICATE_NLIST)')
+        parser.add_argument('--output', help='Index path (default: DUPLICATE_INDEX_PATH)')
+
+    def handle(self, *args, **options):
+        face_index.build(nlist=options['nlist'])
+        try:
+            path = face_index.save(options['output'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        self.stdout.write(json.dumps({**face_index.stats(), 'path': path}, indent=2))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from service_provider.face_embeddings import compute_provider_embeddings
+from service_provider.face_models import face_models
+from service_provider.models import ServiceProvider
+
+
+class Command(BaseCommand):
+    help = 'Computes and stores face embeddings of existing provider photos for every configured model.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', nargs='+', help='Models to embed with (default: FACE_VERIFICATION MODELS)')
+        parser.add_argument('--force', action='store_true',
+                            help='Recompute embeddings that are already current')
+
+    def handle(self, *args, **options):
+        model_names = options['models'] or face_models.model_names
+        face_models.wait()
+
+        start = time.perf_counter()
+        providers = ServiceProvider.objects.exclude(photo='').only('id', 'photo')
+        total = computed = current = failed = 0
+        for provider in providers.iterator(chunk_size=500):
+            total += 1
+            try:
+                embedded = compute_provider_embeddings(provider, model_names, force=options['force'])
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f'{provider.id}: {exc}')
+                continue
+            if embedded:
+                computed += 1
+            else:
+                current += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} providers: {computed} embedded, {current} up to date, {failed} failed '
+            f'in {time.perf_counter() - start:.1f}s'
+        ))
@@ -0,0 +1,48 @@
+import os
+
+from deepface import DeepFace
+from django.core.management.base import BaseCommand, CommandError
+
+from service_provider.face_cascade import labelled_pairs
+from service_provider.face_models import face_models, face_verification_settings, preprocess_face
+from service_provider.tflite_backend import QUANTIZATIONS, convert, graph_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts the face embedding models to TFLite graphs for FACE_VERIFICATION BACKEND 'tflite', "
+        'optionally quantized.'
+    )
+
+    def add_arguments(self, parser):
+        config = face_verification_settings()
+        parser.add_argument('--models', nargs='+', help='Models to convert (default: FACE_VERIFICATION MODELS)')
+        parser.add_argument('--quantization', choices=QUANTIZATIONS, default=config['TFLITE_QUANTIZATION'])
+        parser.add_argument('--output-dir', default=config['TFLITE_DIR'])
+        parser.add_argument('--calibration-dir',
+                            help='Face images (one sub-directory per person) to calibrate int8 activations')
+        parser.add_argument('--calibration-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        quantization = options['quantization']
+        calibration_images = []
+        if quantization == 'int8':
+            if not options['calibration_dir']:
+                raise CommandError('int8 quantization needs --calibration-dir')
+            paths = {path for _, *pair in labelled_pairs(options['calibration_dir'], options['calibration_size'])
+                     for path in pair}
+            faces = (face_models.prepare_face(path)[0] for path in sorted(paths))
+            calibration_images = [face for face in faces if face is not None][:options['calibration_size']]
+
+        os.makedirs(options['output_dir'], exist_ok=True)
+        for model_name in options['models'] or face_models.model_names:
+            model = DeepFace.build_model(model_name)
+            if not hasattr(model, 'model') or model_name == 'Dlib':
+                self.stderr.write(f'{model_name}: not a Keras model, it keeps using DeepFace')
+                continue
+            faces = [preprocess_face(model_name, image) for image in calibration_images]
+            content = convert(model.model, quantization, faces)
+            path = graph_path(options['output_dir'], model_name, quantization)
+            with open(path, 'wb') as graph:
+                graph.write(content)
+            self.stdout.write(self.style.SUCCESS(f'{model_name}: {path} ({len(content) / 2 ** 20:.1f} MiB)'))
@@ -0,0 +1,52 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from service_provider.face_cascade import cascade_order, evaluate, labelled_pairs
+from service_provider.face_models import face_models, face_verification_settings, run_model
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures every face model once per image pair of a labelled set (one directory per person) '
+        'and reports the latency the cascade policy saves and how often it disagrees with running all models.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('image_dir', help='Directory with one sub-directory of face images per person')
+        parser.add_argument('--max-pairs', type=int, default=200,
+                            help='Maximum same-person and different-person pairs each (default: 200)')
+        parser.add_argument('--order', nargs='+', help='Cascade order (default: CASCADE_ORDER)')
+        parser.add_argument('--margin', type=float, nargs='+',
+                            help='Margins to evaluate (default: CASCADE_MARGIN)')
+
+    def handle(self, *args, **options):
+        config = face_verification_settings()
+        pairs = labelled_pairs(options['image_dir'], options['max_pairs'])
+        if not pairs:
+            raise CommandError(f'No labelled image pairs found in {options["image_dir"]}')
+        face_models.wait()
+        model_names = cascade_order(face_models.model_names, options['order'] or config['CASCADE_ORDER'])
+
+        # Detected and aligned once per image, as FaceMatcher does
+        faces = {path: face_models.prepare_face(path)[0] for _, *pair in pairs for path in pair}
+        measured = []
+        for same_person, path1, path2 in pairs:
+            if faces[path1] is None or faces[path2] is None:
+                continue
+            results = {}
+            for model_name in model_names:
+                start = time.perf_counter()
+                result = run_model(model_name, faces[path1], faces[path2], config['THRESHOLD_MULTIPLIER'])
+                results[model_name] = (result, time.perf_counter() - start)
+            measured.append((same_person, results))
+        skipped = len(pairs) - len(measured)
+        if skipped:
+            self.stderr.write(f'Skipped {skipped} pairs without exactly one detectable face per image')
+
+        reports = {
+            str(margin): evaluate(measured, model_names, margin)
+            for margin in options['margin'] or [config['CASCADE_MARGIN']]
+        }
+        self.stdout.write(json.dumps({'order': model_names, 'margins': reports}, indent=2))
@@ -0,0 +1,76 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from server.renditions import FORMATS, RENDITIONS, is_rendition, render, rendition_name, write_atomically
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+
+def _targets(name):
+    return [rendition_name(name, rendition, ext) for rendition in RENDITIONS for ext in FORMATS]
+
+
+def _process(media_root, name, force):
+    """Render one file under MEDIA_ROOT. Runs in a worker process, so it only uses the filesystem."""
+    source = os.path.join(media_root, name)
+    modified = os.path.getmtime(source)
+    if not force and all(
+        os.path.exists(os.path.join(media_root, target))
+        and os.path.getmtime(os.path.join(media_root, target)) >= modified
+        for target in _targets(name)
+    ):
+        return name, 0, None
+
+    try:
+        with open(source, 'rb') as image_file:
+            outputs = render(image_file.read())
+    except Exception as exc:
+        return name, 0, str(exc)
+
+    for (rendition, ext), content in outputs.items():
+        write_atomically(os.path.join(media_root, rendition_name(name, rendition, ext)), content)
+    return name, len(outputs), None
+
+
+class Command(BaseCommand):
+    help = 'Generates thumb/card/full WebP and JPEG renditions for existing images in MEDIA_ROOT.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Worker processes (default: CPU count)')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate renditions that are already up to date')
+
+    def handle(self, *args, **options):
+        media_root = settings.MEDIA_ROOT
+        names = []
+        for directory, _, files in os.walk(media_root):
+            for filename in files:
+                name = os.path.relpath(os.path.join(directory, filename), media_root).replace(os.sep, '/')
+                if filename.lower().endswith(IMAGE_EXTENSIONS) and not is_rendition(name):
+                    names.append(name)
+
+        start = time.perf_counter()
+        generated = skipped = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            results = pool.map(
+                _process, [media_root] * len(names), names, [options['force']] * len(names),
+                chunksize=8
+            )
+            for name, written, error in results:
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                elif written:
+                    generated += 1
+                else:
+                    skipped += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(names)} images: {generated} rendered, {skipped} up to date, {failed} failed '
+            f'in {time.perf_counter() - start:.1f}s'
+        ))
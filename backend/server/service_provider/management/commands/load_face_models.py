@@ -0,0 +1,15 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from service_provider.face_models import face_models
+
+
+class Command(BaseCommand):
+    help = 'Loads and warms the configured face verification models and reports load time and memory.'
+
+    def handle(self, *args, **options):
+        face_models.load()
+        self.stdout.write(json.dumps(face_models.stats(), indent=2))
+        if not face_models.ready:
+            raise CommandError(f'Face models failed to load: {face_models.error}')
@@ -0,0 +1,24 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from sub_service.models import SubService
+from service_provider.provider_index import provider_index
+
+
+class Command(BaseCommand):
+    help = 'Builds the provider location index for every sub-service and reports rebuild time and memory use'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sub-service', help='Only build the index for this sub-service id')
+
+    def handle(self, *args, **options):
+        if options['sub_service']:
+            sub_service_ids = [options['sub_service']]
+        else:
+            sub_service_ids = SubService.objects.values_list('id', flat=True)
+
+        for sub_service_id in sub_service_ids:
+            provider_index.build(sub_service_id)
+
+        self.stdout.write(json.dumps(provider_index.stats(), indent=2))
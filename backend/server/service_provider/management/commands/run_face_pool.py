@@ -0,0 +1,32 @@
+import json
+from multiprocessing.connection import Listener
+
+from django.core.management.base import BaseCommand
+
+from service_provider.face_pool import FaceVerificationPool, pool_address, pool_authkey, serve
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the shared face verification pool used when FACE_VERIFICATION EXECUTION is '
+        "'parallel'. Start one per host; its POOL_SIZE workers serve every web worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, help='Worker processes (default: POOL_SIZE)')
+
+    def handle(self, *args, **options):
+        pool = FaceVerificationPool(size=options['size'])
+        self.stdout.write(f'Starting {pool.size} face verification workers...')
+        self.stdout.write(json.dumps(pool.start(), indent=2))
+
+        address = pool_address()
+        # serve() authenticates each connection on its own thread
+        with Listener(address) as listener:
+            self.stdout.write(self.style.SUCCESS(f'Face verification pool listening on {address[0]}:{address[1]}'))
+            try:
+                serve(pool, listener, authkey=pool_authkey())
+            except KeyboardInterrupt:
+                pass
+            finally:
+                pool.shutdown()
@@ -0,0 +1,43 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from service_provider.face_jobs import requeue_stale_jobs, work
+from service_provider.face_models import face_models, face_verification_settings
+
+
+class Command(BaseCommand):
+    help = 'Runs face verification workers that process queued verification jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker threads sharing this process\'s models (default: 1)')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Loading face models...')
+        if not face_models.wait():
+            self.stderr.write(f'Face models {face_models.state}: {face_models.error}')
+            return
+
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=work, args=(stop,), name=f'face-job-worker-{i}', daemon=True)
+            for i in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(self.style.SUCCESS(f'{len(threads)} face verification workers running'))
+
+        stale_seconds = face_verification_settings()['JOB_STALE_SECONDS']
+        try:
+            while not stop.is_set():
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    self.stderr.write(f'Requeued {requeued} stale jobs')
+                stop.wait(stale_seconds / 2)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from service_provider.face_models import build_and_warm, face_models, face_verification_settings
+from service_provider.inference_server import InferenceService, start_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the local face inference server used when FACE_VERIFICATION EXECUTION is 'server'. "
+        'Start one per host; it batches embedding requests from every Django worker.'
+    )
+
+    def add_arguments(self, parser):
+        config = face_verification_settings()
+        parser.add_argument('--address', default=config['INFERENCE_SERVER'])
+        parser.add_argument('--max-batch', type=int, default=config['BATCH_MAX_SIZE'])
+        parser.add_argument('--max-wait-ms', type=float, default=config['BATCH_MAX_WAIT_MS'])
+        parser.add_argument('--threads', type=int, default=config['INFERENCE_THREADS'],
+                            help='gRPC handler threads; detection and preprocessing run on these')
+
+    def handle(self, *args, **options):
+        # The server holds the models itself, whatever EXECUTION the web workers use
+        self.stdout.write('Loading face models...')
+        for model_name in face_models.model_names:
+            _, stats = build_and_warm(model_name)
+            self.stdout.write(f'{model_name}: {json.dumps(stats)}')
+
+        service = InferenceService(face_models.model_names, options['max_batch'], options['max_wait_ms'] / 1000)
+        server, _ = start_server(service, options['address'], options['threads'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Face inference server listening on {options['address']} "
+            f"(batches of up to {options['max_batch']}, {options['max_wait_ms']} ms max wait)"
+        ))
+        try:
+            server.wait_for_termination()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop(grace=5).wait()
+            service.stop()
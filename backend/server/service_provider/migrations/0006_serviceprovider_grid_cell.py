@@ -0,0 +1,37 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:30
+
+from django.db import migrations, models
+from service_provider.geo import grid_cell
+
+
+def populate_grid_cells(apps, schema_editor):
+    ServiceProvider = apps.get_model('service_provider', 'ServiceProvider')
+    batch = []
+    for provider in ServiceProvider.objects.only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        provider.grid_cell = grid_cell(provider.latitude, provider.longitude)
+        batch.append(provider)
+        if len(batch) >= 2000:
+            ServiceProvider.objects.bulk_update(batch, ['grid_cell'])
+            batch = []
+    if batch:
+        ServiceProvider.objects.bulk_update(batch, ['grid_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0005_serviceprovider_email_serviceprovider_password'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='grid_cell',
+            field=models.PositiveIntegerField(editable=False, help_text='Spatial grid cell derived from latitude/longitude, used to prefilter radius searches', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='serviceprovider',
+            index=models.Index(fields=['grid_cell', 'latitude', 'longitude'], name='provider_grid_cell_idx'),
+        ),
+        migrations.RunPython(populate_grid_cells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.16 on 2026-10-18 21:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0006_serviceprovider_grid_cell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderFaceEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(help_text='DeepFace model that produced the embedding', max_length=32)),
+                ('model_version', models.CharField(help_text='Version tag of the model and preprocessing', max_length=32)),
+                ('photo_name', models.CharField(help_text='Storage name of the photo the embedding was computed from', max_length=255)),
+                ('dimensions', models.PositiveIntegerField()),
+                ('vector', models.BinaryField(help_text='Embedding as little-endian float32')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='face_embeddings', to='service_provider.serviceprovider')),
+            ],
+            options={
+                'verbose_name': 'Provider Face Embedding',
+                'verbose_name_plural': 'Provider Face Embeddings',
+                'unique_together': {('provider', 'model_name')},
+            },
+        ),
+    ]
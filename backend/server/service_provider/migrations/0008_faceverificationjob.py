@@ -0,0 +1,38 @@
+# Generated by Django 4.2.16 on 2026-10-18 21:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0007_providerfaceembedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceVerificationJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('notify_id', models.CharField(blank=True, help_text='User id whose notifications group receives the result', max_length=64)),
+                ('image1', models.BinaryField(blank=True, null=True)),
+                ('image2', models.BinaryField(blank=True, null=True)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('provider', models.ForeignKey(blank=True, help_text='Provider whose registered photo image2 is matched against, if any', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='face_verification_jobs', to='service_provider.serviceprovider')),
+            ],
+            options={
+                'verbose_name': 'Face Verification Job',
+                'verbose_name_plural': 'Face Verification Jobs',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='face_job_status_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0008_faceverificationjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='providerfaceembedding',
+            index=models.Index(fields=['model_name', 'updated_at'], name='face_embedding_sync_idx'),
+        ),
+    ]
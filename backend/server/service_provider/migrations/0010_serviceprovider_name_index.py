@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-19 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0009_providerfaceembedding_face_embedding_sync_idx'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='serviceprovider',
+            options={'verbose_name': 'Service Provider', 'verbose_name_plural': 'Service Providers'},
+        ),
+        migrations.AddIndex(
+            model_name='serviceprovider',
+            index=models.Index(fields=['first_name', 'last_name', 'id'], name='provider_name_idx'),
+        ),
+    ]
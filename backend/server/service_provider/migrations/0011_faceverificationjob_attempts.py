@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0010_serviceprovider_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceverificationjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, help_text='Times a worker has claimed the job'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0011_faceverificationjob_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceverificationjob',
+            name='kind',
+            field=models.CharField(choices=[('verify', 'Verify'), ('embeddings', 'Photo Embeddings'), ('duplicates', 'Duplicate Check')], default='verify', max_length=10),
+        ),
+    ]
@@ -1,5 +1,6 @@
 # models.py
 import uuid
+import numpy as np
 from django.db import models
 from django.core.validators import (
     MinLengthValidator,
@@ -12,6 +13,7 @@ from django.utils.translation import gettext_lazy as _
 from sub_service.models import SubService
 from service.models import Service
 from django.contrib.auth.hashers import make_password
+from .geo import grid_cell
 
 def validate_image_size(value):
     """Validate that the image size is less than 2MB."""
@@ -173,6 +175,11 @@ class ServiceProvider(models.Model):
         ],
         help_text=_("Longitude coordinate")
     )
+    grid_cell = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        help_text=_("Spatial grid cell derived from latitude/longitude, used to prefilter radius searches")
+    )
     sub_services = models.ManyToManyField(
         SubService,
         through='ProviderService',
@@ -187,7 +194,13 @@ class ServiceProvider(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ['first_name', 'last_name']
+        # No default ordering: it would be added to every query, including
+        # those filtered on other columns where it can only be a filesort.
+        # Listings order by name explicitly, backed by provider_name_idx.
+        indexes = [
+            models.Index(fields=['grid_cell', 'latitude', 'longitude'], name='provider_grid_cell_idx'),
+            models.Index(fields=['first_name', 'last_name', 'id'], name='provider_name_idx'),
+        ]
         verbose_name = _("Service Provider")
         verbose_name_plural = _("Service Providers")
 
@@ -213,6 +226,13 @@ class ServiceProvider(models.Model):
             self.password != ServiceProvider.objects.get(pk=self.pk).password)
         ):
             self.password = make_password(self.password)
+
+        # Keep the spatial grid cell in sync with the coordinates
+        if self.latitude is not None and self.longitude is not None:
+            self.grid_cell = grid_cell(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'grid_cell'}
         super().save(*args, **kwargs)
 
     def clean(self):
@@ -267,3 +287,123 @@ class ProviderService(models.Model):
             raise ValidationError(
                 _("This sub-service doesn't belong to your main service category.")
             )
+
+
+class ProviderFaceEmbedding(models.Model):
+    """
+    Face embedding of a provider's registered photo for one model.
+
+    Stored as raw float32 bytes. ``model_version`` and ``photo_name`` say
+    what the vector was computed with and from; a row that no longer
+    matches either is stale and is recomputed (see face_embeddings.py).
+    """
+    provider = models.ForeignKey(
+        ServiceProvider,
+        on_delete=models.CASCADE,
+        related_name='face_embeddings'
+    )
+    model_name = models.CharField(
+        max_length=32,
+        help_text=_("DeepFace model that produced the embedding")
+    )
+    model_version = models.CharField(
+        max_length=32,
+        help_text=_("Version tag of the model and preprocessing")
+    )
+    photo_name = models.CharField(
+        max_length=255,
+        help_text=_("Storage name of the photo the embedding was computed from")
+    )
+    dimensions = models.PositiveIntegerField()
+    vector = models.BinaryField(help_text=_("Embedding as little-endian float32"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['provider', 'model_name']
+        indexes = [
+            # Face index sync: embeddings of one model written since a time
+            models.Index(fields=['model_name', 'updated_at'], name='face_embedding_sync_idx'),
+        ]
+        verbose_name = _("Provider Face Embedding")
+        verbose_name_plural = _("Provider Face Embeddings")
+
+    def __str__(self):
+        return f"{self.provider_id} {self.model_name} ({self.model_version})"
+
+    @property
+    def embedding(self):
+        return np.frombuffer(bytes(self.vector), dtype='<f4')
+
+
+class FaceVerificationJobStatus(models.TextChoices):
+    QUEUED = 'queued', _('Queued')
+    RUNNING = 'running', _('Running')
+    DONE = 'done', _('Done')
+    FAILED = 'failed', _('Failed')
+
+
+class FaceJobKind(models.TextChoices):
+    VERIFY = 'verify', _('Verify')
+    EMBEDDINGS = 'embeddings', _('Photo Embeddings')
+    DUPLICATES = 'duplicates', _('Duplicate Check')
+
+
+class FaceVerificationJob(models.Model):
+    """
+    A face verification waiting for, or processed by, a verification worker
+    (manage.py run_face_verification_worker). The table is the queue; the
+    uploaded images are kept only until the job finishes. Signups also queue
+    their photo embeddings and duplicate check here, so the models never
+    run in an API request.
+    """
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=FaceVerificationJobStatus.choices,
+        default=FaceVerificationJobStatus.QUEUED
+    )
+    kind = models.CharField(
+        max_length=10,
+        choices=FaceJobKind.choices,
+        default=FaceJobKind.VERIFY
+    )
+    provider = models.ForeignKey(
+        ServiceProvider,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='face_verification_jobs',
+        help_text=_("Provider whose registered photo image2 is matched against, if any")
+    )
+    notify_id = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text=_("User id whose notifications group receives the result")
+    )
+    image1 = models.BinaryField(null=True, blank=True)
+    image2 = models.BinaryField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveIntegerField(
+        default=0,
+        help_text=_("Times a worker has claimed the job")
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='face_job_status_created_idx'),
+        ]
+        verbose_name = _("Face Verification Job")
+        verbose_name_plural = _("Face Verification Jobs")
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
@@ -0,0 +1,265 @@
+"""
+Resident, per-sub-service provider location index.
+
+Each SubService gets a set of parallel NumPy arrays (provider service id,
+provider id, grid cell, latitude, longitude, is_active) sorted by grid cell.
+A radius query binary-searches the contiguous run of every grid row that
+overlaps the search box and runs the vectorized haversine only on those rows,
+so no database scan is needed to find nearby providers.
+
+Indexes are built lazily on first use, kept up to date from model signals in
+this process, and rebuilt after PROVIDER_INDEX_TTL seconds so writes made by
+other workers are eventually picked up.
+"""
+import threading
+import time
+import uuid
+
+import numpy as np
+from django.conf import settings
+
+from .geo import GRID_COLUMNS, bounding_box, grid_cell, grid_cells, grid_cells_for_box, nearest_k, nearest_within
+
+DEFAULT_TTL = 300
+
+UUID_DTYPE = np.dtype('V16')
+
+
+def _uuid_key(value):
+    if not isinstance(value, uuid.UUID):
+        value = uuid.UUID(str(value))
+    return np.void(value.bytes)
+
+
+class SubServiceIndex:
+    """Location index for the providers offering one sub-service."""
+
+    def __init__(self, provider_service_ids=(), provider_ids=(), latitudes=(), longitudes=(), active=()):
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        cells = grid_cells(latitudes, longitudes)
+        order = np.argsort(cells, kind='stable')
+        # (provider service id, provider id, grid cell, latitude, longitude, is_active)
+        # Columns are swapped as one tuple so concurrent readers always see
+        # arrays of matching length
+        self._columns = (
+            np.asarray(provider_service_ids, dtype=np.int64)[order],
+            np.array([_uuid_key(value) for value in provider_ids], dtype=UUID_DTYPE)[order],
+            cells[order],
+            latitudes[order],
+            longitudes[order],
+            np.asarray(active, dtype=bool)[order],
+        )
+        self.built_at = time.monotonic()
+        self.build_seconds = 0.0
+
+    def __len__(self):
+        return len(self._columns[0])
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self._columns)
+
+    def insert(self, provider_service_id, provider_id, latitude, longitude, is_active):
+        self.remove(provider_service_id)
+        cell = grid_cell(latitude, longitude)
+        position = int(np.searchsorted(self._columns[2], cell, side='right'))
+        values = (provider_service_id, _uuid_key(provider_id), cell, float(latitude), float(longitude), is_active)
+        self._columns = tuple(
+            np.insert(array, position, value) for array, value in zip(self._columns, values)
+        )
+
+    def remove(self, provider_service_id):
+        keep = self._columns[0] != provider_service_id
+        if not keep.all():
+            self._columns = tuple(array[keep] for array in self._columns)
+
+    def update_provider(self, provider_id, latitude, longitude, is_active):
+        ids, provider_ids, cells, latitudes, longitudes, active = self._columns
+        rows = np.flatnonzero(provider_ids == _uuid_key(provider_id))
+        if not len(rows):
+            return
+        cell = grid_cell(latitude, longitude)
+        if (cells[rows] == cell).all():
+            # Written to copies and swapped in, like every other update
+            latitudes, longitudes, active = latitudes.copy(), longitudes.copy(), active.copy()
+            latitudes[rows] = float(latitude)
+            longitudes[rows] = float(longitude)
+            active[rows] = is_active
+            self._columns = (ids, provider_ids, cells, latitudes, longitudes, active)
+            return
+        # The provider moved to another grid cell: reinsert to keep the sort
+        for provider_service_id in ids[rows].tolist():
+            self.insert(provider_service_id, provider_id, latitude, longitude, is_active)
+
+    @staticmethod
+    def _candidate_rows(cells_column, min_lat, max_lat, min_lon, max_lon):
+        cells = grid_cells_for_box(min_lat, max_lat, min_lon, max_lon)
+        if cells is None:
+            return np.arange(len(cells_column))
+
+        # Runs of consecutive cells are one slice each; a box wrapping the
+        # antimeridian splits its grid rows in two
+        ranges = []
+        for cell in sorted(cells):
+            if ranges and cell == ranges[-1][1] + 1:
+                ranges[-1][1] = cell
+            else:
+                ranges.append([cell, cell])
+
+        slices = []
+        for low, high in ranges:
+            start = np.searchsorted(cells_column, low, side='left')
+            stop = np.searchsorted(cells_column, high, side='right')
+            if stop > start:
+                slices.append(np.arange(start, stop))
+        return np.concatenate(slices) if slices else np.arange(0)
+
+    def query_radius(self, latitude, longitude, radius_km, active_only=False):
+        """
+        Return (provider_service_ids, distances) for every provider within
+        radius_km, nearest first.
+        """
+        ids, _, cells, latitudes, longitudes, active = self._columns
+        rows = self._candidate_rows(cells, *bounding_box(latitude, longitude, radius_km))
+        if active_only:
+            rows = rows[active[rows]]
+        indices, distances = nearest_within(
+            latitude, longitude, latitudes[rows], longitudes[rows], radius_km
+        )
+        return ids[rows[indices]], distances
+
+    def query_page(self, latitude, longitude, radius_km, k, after=None, active_only=False):
+        """
+        Return (provider_service_ids, distances) for the k nearest providers
+        within radius_km that come after the (distance, provider service id)
+        position ``after``.
+        """
+        ids, _, cells, latitudes, longitudes, active = self._columns
+        rows = self._candidate_rows(cells, *bounding_box(latitude, longitude, radius_km))
+        if active_only:
+            rows = rows[active[rows]]
+        indices, distances = nearest_k(
+            latitude, longitude, latitudes[rows], longitudes[rows], ids[rows], k,
+            radius_km=radius_km, after=after
+        )
+        return ids[rows[indices]], distances
+
+    def query_nearest(self, latitude, longitude, k, max_radius_km=None, active_only=False):
+        """
+        Return (provider_service_ids, distances) for the k nearest providers,
+        optionally bounded by max_radius_km. The search radius doubles until
+        k providers are found inside it, so the result is exact.
+        """
+        radius = 5.0
+        while True:
+            if max_radius_km is not None:
+                radius = min(radius, float(max_radius_km))
+            ids, distances = self.query_radius(latitude, longitude, radius, active_only)
+            exhausted = (max_radius_km is not None and radius >= max_radius_km) or radius >= np.pi * 6371
+            if len(ids) >= k or exhausted:
+                return ids[:k], distances[:k]
+            radius *= 2
+
+
+class ProviderIndexRegistry:
+    """Process-wide collection of SubServiceIndex objects."""
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.RLock()
+        # One lock per sub-service, so an expired index is rebuilt by one thread
+        self._build_locks = {}
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'PROVIDER_INDEX_TTL', DEFAULT_TTL)
+
+    def build(self, sub_service_id):
+        from .models import ProviderService
+
+        start = time.perf_counter()
+        rows = ProviderService.objects.filter(sub_service_id=sub_service_id).values_list(
+            'id', 'provider_id', 'provider__latitude', 'provider__longitude', 'provider__is_active'
+        )
+        columns = list(zip(*rows)) or [(), (), (), (), ()]
+        index = SubServiceIndex(*columns)
+        index.build_seconds = time.perf_counter() - start
+
+        with self._lock:
+            self._indexes[str(sub_service_id)] = index
+        return index
+
+    def _current(self, key):
+        index = self._indexes.get(key)
+        if index is not None and time.monotonic() - index.built_at <= self.ttl:
+            return index
+        return None
+
+    def get(self, sub_service_id):
+        key = str(sub_service_id)
+        index = self._current(key)
+        if index is None:
+            with self._lock:
+                build_lock = self._build_locks.setdefault(key, threading.Lock())
+            with build_lock:
+                # Another thread may have rebuilt it while this one waited
+                index = self._current(key)
+                if index is None:
+                    index = self.build(sub_service_id)
+        return index
+
+    def invalidate(self, sub_service_id=None):
+        with self._lock:
+            if sub_service_id is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(str(sub_service_id), None)
+
+    # Incremental updates, called from signal handlers
+
+    def provider_service_saved(self, provider_service):
+        provider = provider_service.provider
+        with self._lock:
+            for key, index in self._indexes.items():
+                if key != str(provider_service.sub_service_id):
+                    index.remove(provider_service.id)
+            index = self._indexes.get(str(provider_service.sub_service_id))
+            if index is not None:
+                index.insert(
+                    provider_service.id, provider.id,
+                    provider.latitude, provider.longitude, provider.is_active
+                )
+
+    def provider_service_deleted(self, provider_service_id, sub_service_id):
+        with self._lock:
+            index = self._indexes.get(str(sub_service_id))
+            if index is not None:
+                index.remove(provider_service_id)
+
+    def provider_saved(self, provider):
+        with self._lock:
+            for index in self._indexes.values():
+                index.update_provider(provider.id, provider.latitude, provider.longitude, provider.is_active)
+
+    def stats(self):
+        with self._lock:
+            indexes = {
+                key: {
+                    'providers': len(index),
+                    'memory_bytes': index.nbytes,
+                    'build_seconds': round(index.build_seconds, 4),
+                    'age_seconds': round(time.monotonic() - index.built_at, 1),
+                }
+                for key, index in self._indexes.items()
+            }
+        return {
+            'indexes': len(indexes),
+            'providers': sum(item['providers'] for item in indexes.values()),
+            'memory_bytes': sum(item['memory_bytes'] for item in indexes.values()),
+            'build_seconds': round(sum(item['build_seconds'] for item in indexes.values()), 4),
+            'sub_services': indexes,
+        }
+
+
+provider_index = ProviderIndexRegistry()
@@ -7,35 +7,14 @@ from sub_service.models import SubService
 from orders.models import Orders
 from orders.models import OrderStatus
 from orders.models import OrderStatusHistory
-from django.core.files.base import ContentFile
+from orders.models import ProviderRatingSummary
 import random
-from django.db.models import Avg, Count, Case, When,F, Subquery, OuterRef
-from django.db.models.functions import Coalesce
+from django.db.models import F, Manager, Subquery, OuterRef, Window
+from django.db.models.functions import RowNumber
 
-import base64
-
-class Base64ImageField(serializers.ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            # Get the base64 data after the comma
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            
-            # Convert base64 to file
-            data = ContentFile(base64.b64decode(imgstr), name=f'temp.{ext}')
-        
-        return super().to_internal_value(data)
-    
-    def to_representation(self, value):
-        if not value:
-            return None
-        
-        try:
-            with value.open('rb') as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode()
-                return f'data:image/{value.name.split(".")[-1]};base64,{encoded_string}'
-        except Exception:
-            return None
+from server.images import Base64ImageField
+from .face_embeddings import schedule_provider_embeddings
+from .face_index import schedule_duplicate_check
 
 class ServiceSerializer(serializers.ModelSerializer):
     class Meta:
@@ -146,6 +125,8 @@ class ServiceProviderCreateUpdateSerializer(serializers.ModelSerializer):
         for service_data in provider_services_data:
             ProviderService.objects.create(provider=provider, **service_data)
 
+        schedule_provider_embeddings(provider)
+        schedule_duplicate_check(provider)
         return provider
 
     def update(self, instance, validated_data):
@@ -161,8 +142,11 @@ class ServiceProviderCreateUpdateSerializer(serializers.ModelSerializer):
             instance.provider_services.all().delete()
             for service_data in provider_services_data:
                 ProviderService.objects.create(provider=instance, **service_data)
-                
-        return super().update(instance, validated_data)
+
+        instance = super().update(instance, validated_data)
+        if 'photo' in validated_data:
+            schedule_provider_embeddings(instance)
+        return instance
 
 
 class LoginSerializer(serializers.Serializer):
@@ -200,6 +184,82 @@ class LoginSerializer(serializers.Serializer):
 
             
 
+def provider_rating_summaries(providers):
+    """
+    Map provider id -> ProviderRatingSummary. Summaries already joined with
+    select_related are used as is; the rest are aggregated in one query.
+    """
+    summaries = {}
+    missing = []
+    for provider in providers:
+        if ServiceProvider.rating_summary.is_cached(provider):
+            summaries[provider.id] = getattr(provider, 'rating_summary', None)
+        else:
+            missing.append(provider.id)
+    if missing:
+        summaries.update(
+            (summary.provider_id, summary)
+            for summary in ProviderRatingSummary.aggregate(missing)
+        )
+    return summaries
+
+
+def provider_reviews(provider_ids, limit=10):
+    """Map provider id -> latest ``limit`` reviews, using one window function query."""
+    completion_date_subquery = OrderStatusHistory.objects.filter(
+        order=OuterRef('pk'),
+        status=OrderStatus.COMPLETED
+    ).values('changed_on')[:1]
+
+    rows = Orders.objects.filter(
+        provider_id__in=provider_ids,
+        status=OrderStatus.COMPLETED,
+        rating__isnull=False
+    ).exclude(review__isnull=True).exclude(review='').annotate(
+        completion_date=Subquery(completion_date_subquery)
+    ).annotate(
+        position=Window(
+            expression=RowNumber(),
+            partition_by=[F('provider_id')],
+            order_by=F('completion_date').desc()
+        )
+    ).filter(position__lte=limit).values(
+        'id',
+        'provider_id',
+        'rating',
+        'review',
+        'completion_date',
+        'user__name'
+    ).order_by('provider_id', 'position')
+
+    reviews = {}
+    for review in rows:
+        reviews.setdefault(review['provider_id'], []).append({
+            'order_id': str(review['id']),
+            'rating': review['rating'],
+            'review': review['review'],
+            'date': review['completion_date'],
+            'client_name': review['user__name']
+        })
+    return reviews
+
+
+class ProviderServiceListSerializer(serializers.ListSerializer):
+    """Loads ratings and reviews for every provider on the page up front"""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, Manager) else data)
+        providers = {item.provider_id: item.provider for item in items}
+
+        self.child.page_summaries = provider_rating_summaries(providers.values())
+        self.child.page_reviews = provider_reviews(list(providers))
+        try:
+            return [self.child.to_representation(item) for item in items]
+        finally:
+            del self.child.page_summaries
+            del self.child.page_reviews
+
+
 class ProviderServiceSerializer(serializers.ModelSerializer):
     provider_id = serializers.UUIDField(source='provider.id', read_only=True)
     provider_name = serializers.CharField(source='provider.full_name', read_only=True)
@@ -232,62 +292,24 @@ class ProviderServiceSerializer(serializers.ModelSerializer):
             'price',
             'distance'
         ]
+        list_serializer_class = ProviderServiceListSerializer
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
 
-        # Get all completed orders for this provider
-        completed_orders = Orders.objects.filter(
-            provider=instance.provider,
-            status=OrderStatus.COMPLETED,
-            rating__isnull=False
-        )
-
-        # Calculate average rating
-        avg_rating = completed_orders.aggregate(
-            avg_rating=Coalesce(Avg('rating'), 0.0)
-        )['avg_rating']
-        representation['provider_rating'] = round(float(avg_rating), 2)
-
-        # Calculate rating counts for each star
-        rating_counts = completed_orders.aggregate(
-            one_star=Count(Case(When(rating=1, then=1))),
-            two_star=Count(Case(When(rating=2, then=1))),
-            three_star=Count(Case(When(rating=3, then=1))),
-            four_star=Count(Case(When(rating=4, then=1))),
-            five_star=Count(Case(When(rating=5, then=1)))
-        )
-        representation['rating_counts'] = {
-            '1': rating_counts['one_star'],
-            '2': rating_counts['two_star'],
-            '3': rating_counts['three_star'],
-            '4': rating_counts['four_star'],
-            '5': rating_counts['five_star']
-        }
-
-        # Get reviews
-        completion_date_subquery = OrderStatusHistory.objects.filter(
-        order=OuterRef('pk'),
-        status=OrderStatus.COMPLETED
-        ).values('changed_on')[:1]
-
-        reviews = completed_orders.exclude(review__isnull=True).exclude(review='').annotate(
-            completion_date=Subquery(completion_date_subquery)
-        ).values(
-            'id',
-            'rating',
-            'review',
-            'completion_date',
-            'user__name'
-        ).order_by('-completion_date')[:10]  # Get last 10 reviews
-
-        representation['provider_reviews'] = [{
-            'order_id': str(review['id']),
-            'rating': review['rating'],
-            'review': review['review'],
-            'date': review['completion_date'],
-            'client_name': review['user__name']
-        } for review in reviews]
+        # Ratings and reviews are loaded for the whole page by the list
+        # serializer; a single object loads its own
+        summaries = getattr(self, 'page_summaries', None)
+        if summaries is None:
+            summaries = provider_rating_summaries([instance.provider])
+        reviews = getattr(self, 'page_reviews', None)
+        if reviews is None:
+            reviews = provider_reviews([instance.provider_id])
+
+        summary = summaries.get(instance.provider_id) or ProviderRatingSummary(provider_id=instance.provider_id)
+        representation['provider_rating'] = summary.average_rating
+        representation['rating_counts'] = summary.rating_counts
+        representation['provider_reviews'] = reviews.get(instance.provider_id, [])
 
         # Handle distance
         if hasattr(instance, 'distance'):
@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .face_index import face_index
+from .models import ServiceProvider, ProviderService, ProviderFaceEmbedding
+from .provider_index import provider_index
+
+
+# Index updates run on commit so rolled back writes never reach the index
+
+@receiver(post_save, sender=ProviderService)
+def index_provider_service(sender, instance, **kwargs):
+    transaction.on_commit(lambda: provider_index.provider_service_saved(instance))
+
+
+@receiver(post_delete, sender=ProviderService)
+def unindex_provider_service(sender, instance, **kwargs):
+    # delete() clears the pk before commit, so capture the ids now
+    provider_service_id, sub_service_id = instance.id, instance.sub_service_id
+    transaction.on_commit(
+        lambda: provider_index.provider_service_deleted(provider_service_id, sub_service_id)
+    )
+
+
+@receiver(post_save, sender=ServiceProvider)
+def reindex_provider(sender, instance, created, **kwargs):
+    # A new provider has no services yet; those are indexed as they are added
+    if not created:
+        transaction.on_commit(lambda: provider_index.provider_saved(instance))
+
+
+@receiver(post_save, sender=ProviderFaceEmbedding)
+def index_face_embedding(sender, instance, **kwargs):
+    transaction.on_commit(lambda: face_index.embedding_saved(instance))
+
+
+@receiver(post_delete, sender=ServiceProvider)
+def unindex_provider_face(sender, instance, **kwargs):
+    provider_id = instance.id
+    transaction.on_commit(lambda: face_index.provider_deleted(provider_id))
@@ -1,8 +1,56 @@
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
-from expects import expect, equal, have_keys, contain, be, have_len
+import base64
+import json
+import subprocess
+import sys
+import os
+import posixpath
+import tempfile
+import threading
+import time
+import uuid
+from multiprocessing.connection import Client as ConnectionClient, Listener
+from io import BytesIO, StringIO
+from unittest import mock
+from PIL import Image
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from expects import expect, equal, have_keys, contain, be, have_len, be_above, be_below, be_within, start_with
 from .factory import ServiceProviderFactory, ProviderServiceFactory
+from .geo import grid_cell, grid_cells_for_box, nearby_filter, haversine_distance, haversine_distances, nearest_within, nearest_k
+from .models import ServiceProvider, ProviderService, ProviderFaceEmbedding, FaceVerificationJob
+from .serializers import ProviderServiceSerializer, ServiceProviderCreateUpdateSerializer, provider_reviews
+from orders.factory import OrderFactory, OrderStatusHistoryFactory
+from orders.models import OrderStatus, ProviderRatingSummary
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .provider_index import provider_index
+from .face_cascade import cascade_order, evaluate, run_cascade
+from .face_embeddings import MODEL_VERSION, compute_provider_embeddings, provider_embeddings
+from .face_index import FaceIndex, face_index, key_uuids, schedule_duplicate_check, similar_providers
+from .face_jobs import claim_job, job_metrics, requeue_stale_jobs, run_job, submit_job
+from .face_detection import align_face, detect_faces, prepare_face
+from .face_models import FaceModelRegistry, build_and_warm, forward_batch, tflite_embedder
+from .tflite_backend import convert, graph_path
+from .inference_server import InferenceClient, InferenceService, MicroBatcher, decode_message, encode_message, start_server
+from .face_pool import FacePoolClient, FaceVerificationPool, serve
+from .validate_service_provider import FaceMatcher, decode_image
+from .views import ServiceProviderViewSet
+from django.conf import settings
+from django.test import override_settings, TransactionTestCase
+from unittest import skipUnless
+from server.explain import analyze_tables, query_plan
+from server.lazy_import import lazy_module
+from django.utils import timezone
+from datetime import timedelta
+import cv2
+import numpy as np
+from urllib.parse import urlparse, parse_qs
 from sub_service.factory import SubServiceFactory
+from server.renditions import RENDITIONS, generate_renditions, rendition_name, rendition_url, wait_for_renditions
 from service.factory import ServiceFactory, UserFactory
 
 
@@ -68,4 +116,1252 @@ class TestServiceProviderViewSet(APITestCase):
         self.client.force_authenticate(user=None)
         url = reverse('provider-list')
         response = self.client.get(url)
-        expect(response.status_code).to(equal(401))
\ No newline at end of file
+        expect(response.status_code).to(equal(401))
+
+class TestSubServiceProvidersRadiusSearch(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.sub_service = SubServiceFactory()
+        main_service = self.sub_service.main_service
+
+        # Bengaluru city centre, ~8 km away, and Mysuru (~125 km away)
+        self.near = ServiceProviderFactory(main_service=main_service, latitude='12.971599', longitude='77.594566')
+        self.nearby = ServiceProviderFactory(main_service=main_service, latitude='13.035542', longitude='77.597100')
+        self.far = ServiceProviderFactory(main_service=main_service, latitude='12.295810', longitude='76.639381')
+        for provider in (self.nearby, self.far, self.near):
+            ProviderServiceFactory(provider=provider, sub_service=self.sub_service)
+
+        self.url = reverse('subservice-providers', args=[self.sub_service.id])
+        provider_index.invalidate()
+
+    def test_grid_cell_kept_in_sync_on_save(self):
+        cell = self.near.grid_cell
+        expect(cell).to(equal(grid_cell(self.near.latitude, self.near.longitude)))
+
+        self.near.latitude = '28.613939'
+        self.near.longitude = '77.209023'
+        self.near.save(update_fields=['latitude', 'longitude'])
+        self.near.refresh_from_db()
+        expect(self.near.grid_cell).not_to(equal(cell))
+        expect(self.near.grid_cell).to(equal(grid_cell(28.613939, 77.209023)))
+
+    def test_box_ending_on_the_antimeridian_keeps_its_cells(self):
+        cells = grid_cells_for_box(-16.5, -16.0, 179.5, 180)
+        expect(cells).to(contain(grid_cell(-16.2, 179.9), grid_cell(-16.2, 180)))
+        expect(cells).to(have_len(3 * 3))
+
+    def test_returns_only_providers_within_radius_sorted_by_distance(self):
+        response = self.client.get(self.url, {'latitude': 12.9716, 'longitude': 77.5946, 'radius': 25})
+        expect(response.status_code).to(equal(200))
+        expect([row['provider_id'] for row in response.data]).to(equal([
+            str(self.near.id), str(self.nearby.id)
+        ]))
+        expect(response.data[0]['distance']).to(be_below(response.data[1]['distance']))
+
+    @override_settings(PROVIDER_INDEX_ENABLED=False)
+    def test_database_path_matches_index_path(self):
+        response = self.client.get(self.url, {'latitude': 12.9716, 'longitude': 77.5946, 'radius': 25})
+        expect([row['provider_id'] for row in response.data]).to(equal([
+            str(self.near.id), str(self.nearby.id)
+        ]))
+
+    def test_nearby_filter_matches_exact_distance(self):
+        candidates = ServiceProvider.objects.filter(nearby_filter(12.9716, 77.5946, 25))
+        expect(set(candidates)).to(equal({self.near, self.nearby}))
+
+
+class TestHaversineEngine(APITestCase):
+    def test_vectorized_distances_match_scalar(self):
+        latitudes = [12.971599, 13.035542, 12.295810, 28.613939]
+        longitudes = [77.594566, 77.597100, 76.639381, 77.209023]
+        distances = haversine_distances(12.9716, 77.5946, latitudes, longitudes)
+        for lat, lon, distance in zip(latitudes, longitudes, distances):
+            expect(abs(distance - haversine_distance(12.9716, 77.5946, lat, lon))).to(be_below(1e-9))
+
+    def test_nearest_within_masks_and_orders(self):
+        indices, distances = nearest_within(
+            12.9716, 77.5946,
+            [13.035542, 12.295810, 12.971599],
+            [77.597100, 76.639381, 77.594566],
+            25
+        )
+        expect(indices.tolist()).to(equal([2, 0]))
+        expect(distances[0]).to(be_below(distances[1]))
+
+    def test_nearest_within_empty(self):
+        indices, distances = nearest_within(12.9716, 77.5946, [], [], 25)
+        expect(indices.tolist()).to(equal([]))
+        expect(distances.tolist()).to(equal([]))
+
+
+class TestProviderIndex(APITestCase):
+    def setUp(self):
+        provider_index.invalidate()
+        self.sub_service = SubServiceFactory()
+        self.provider = ServiceProviderFactory(
+            main_service=self.sub_service.main_service, latitude='12.971599', longitude='77.594566'
+        )
+        self.provider_service = ProviderServiceFactory(provider=self.provider, sub_service=self.sub_service)
+        self.index = provider_index.get(self.sub_service.id)
+
+    def query(self, **kwargs):
+        ids, _ = self.index.query_radius(12.9716, 77.5946, 25, **kwargs)
+        return ids.tolist()
+
+    def test_build_and_query(self):
+        expect(self.query()).to(equal([self.provider_service.id]))
+        expect(self.index.query_radius(28.6139, 77.2090, 25)[0].tolist()).to(equal([]))
+
+    def test_incremental_add_and_remove(self):
+        other = ServiceProviderFactory(
+            main_service=self.sub_service.main_service, latitude='12.980000', longitude='77.600000'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            added = ProviderServiceFactory(provider=other, sub_service=self.sub_service)
+        expect(self.query()).to(equal([self.provider_service.id, added.id]))
+
+        url = reverse('provider-remove-services', args=[self.provider.id])
+        self.client.force_authenticate(user=UserFactory())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'service_ids': [self.provider_service.id]}, format='json')
+        expect(self.query()).to(equal([added.id]))
+
+    def test_provider_updates_are_applied(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.provider.is_active = False
+            self.provider.save()
+        expect(self.query()).to(equal([self.provider_service.id]))
+        expect(self.query(active_only=True)).to(equal([]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.provider.latitude = '28.613939'
+            self.provider.longitude = '77.209023'
+            self.provider.save()
+        expect(self.query()).to(equal([]))
+        expect(self.index.query_radius(28.6139, 77.2090, 25)[0].tolist()).to(equal([self.provider_service.id]))
+
+    def test_query_nearest(self):
+        far = ServiceProviderFactory(
+            main_service=self.sub_service.main_service, latitude='12.295810', longitude='76.639381'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            far_service = ProviderServiceFactory(provider=far, sub_service=self.sub_service)
+        ids, distances = self.index.query_nearest(12.9716, 77.5946, 2)
+        expect(ids.tolist()).to(equal([self.provider_service.id, far_service.id]))
+        expect(self.index.query_nearest(12.9716, 77.5946, 2, max_radius_km=25)[0].tolist()).to(
+            equal([self.provider_service.id])
+        )
+
+    def test_provider_update_swaps_columns(self):
+        columns = self.index._columns
+        with self.captureOnCommitCallbacks(execute=True):
+            self.provider.is_active = False
+            self.provider.save()
+        # Readers holding the old columns keep a consistent snapshot
+        expect(self.index._columns).not_to(be(columns))
+        expect(columns[5].tolist()).to(equal([True]))
+
+    def test_expired_index_is_rebuilt_once(self):
+        provider_index.invalidate()
+        barrier = threading.Barrier(4)
+        build = provider_index.build
+
+        def slow_build(sub_service_id):
+            time.sleep(0.1)
+            return build(sub_service_id)
+
+        def get():
+            barrier.wait()
+            provider_index.get(self.sub_service.id)
+
+        with mock.patch.object(provider_index, 'build', side_effect=slow_build) as patched:
+            threads = [threading.Thread(target=get) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        expect(patched.call_count).to(equal(1))
+
+    def test_stats(self):
+        stats = provider_index.stats()
+        expect(stats['providers']).to(equal(1))
+        expect(stats['memory_bytes']).to(equal(self.index.nbytes))
+        expect(stats['sub_services']).to(have_keys(str(self.sub_service.id)))
+
+
+class TestSubServiceProvidersCursorPagination(APITestCase):
+    def setUp(self):
+        provider_index.invalidate()
+        self.client = APIClient()
+        self.sub_service = SubServiceFactory()
+        main_service = self.sub_service.main_service
+
+        # Five providers heading north from the search point, plus one out of range
+        self.expected = []
+        for step in range(5):
+            provider = ServiceProviderFactory(
+                main_service=main_service, latitude=f'{12.9716 + step * 0.01:.6f}', longitude='77.594600'
+            )
+            self.expected.append(ProviderServiceFactory(provider=provider, sub_service=self.sub_service).id)
+        far = ServiceProviderFactory(main_service=main_service, latitude='12.295810', longitude='76.639381')
+        ProviderServiceFactory(provider=far, sub_service=self.sub_service)
+
+        self.url = reverse('subservice-providers', args=[self.sub_service.id])
+        self.params = {'latitude': 12.9716, 'longitude': 77.5946, 'radius': 25, 'limit': 2}
+
+    def collect_pages(self):
+        seen = []
+        params = dict(self.params)
+        while True:
+            response = self.client.get(self.url, params)
+            expect(response.status_code).to(equal(200))
+            expect(len(response.data['data']['results'])).to(be_below(3))
+            seen.extend(row['id'] for row in response.data['data']['results'])
+            next_link = response.data['data']['next']
+            if next_link is None:
+                return seen
+            params['cursor'] = parse_qs(urlparse(next_link).query)['cursor'][0]
+
+    def test_pages_walk_all_providers_in_distance_order(self):
+        expect(self.collect_pages()).to(equal(self.expected))
+
+    @override_settings(PROVIDER_INDEX_ENABLED=False)
+    def test_database_path_pages_match(self):
+        expect(self.collect_pages()).to(equal(self.expected))
+
+    def test_invalid_cursor_and_limit(self):
+        response = self.client.get(self.url, {**self.params, 'cursor': 'not-a-cursor'})
+        expect(response.status_code).to(equal(404))
+        response = self.client.get(self.url, {**self.params, 'limit': 0})
+        expect(response.status_code).to(equal(400))
+
+    def test_nearest_k_breaks_distance_ties_by_key(self):
+        coordinates = [1, 1, 1, 2]
+        keys = [7, 3, 5, 1]
+        indices, distances = nearest_k(0, 0, coordinates, coordinates, keys, 2)
+        expect(indices.tolist()).to(equal([1, 2]))
+
+        indices, _ = nearest_k(0, 0, coordinates, coordinates, keys, 2, after=(distances[-1], 5))
+        expect(indices.tolist()).to(equal([0, 3]))
+
+
+class TestProviderListingQueryCount(APITestCase):
+    def setUp(self):
+        provider_index.invalidate()
+        self.client = APIClient()
+        self.sub_service = SubServiceFactory()
+        self.url = reverse('subservice-providers', args=[self.sub_service.id])
+        self.params = {'latitude': 12.9716, 'longitude': 77.5946, 'radius': 25}
+
+    def add_providers(self, count):
+        for _ in range(count):
+            provider = ServiceProviderFactory(
+                main_service=self.sub_service.main_service, latitude='12.971599', longitude='77.594566'
+            )
+            ProviderServiceFactory(provider=provider, sub_service=self.sub_service)
+            for rating in (3, 5):
+                order = OrderFactory(provider=provider, status=OrderStatus.COMPLETED, rating=rating, review='Nice')
+                OrderStatusHistoryFactory(order=order)
+                ProviderRatingSummary.record_rating(provider.id, rating)
+        provider_index.invalidate()
+
+    def count_queries(self, params):
+        self.client.get(self.url, params)  # build the index outside the measurement
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        expect(response.status_code).to(equal(200))
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.add_providers(2)
+        small = self.count_queries(self.params)
+        self.add_providers(8)
+        large = self.count_queries(self.params)
+        expect(large).to(equal(small))
+        expect(self.count_queries({**self.params, 'limit': 5})).to(equal(small))
+
+    def test_bulk_results_match_per_object_serialization(self):
+        self.add_providers(3)
+        response = self.client.get(self.url, self.params)
+        for row in response.data:
+            single = ProviderServiceSerializer(ProviderService.objects.get(id=row['id'])).data
+            expect(row['provider_rating']).to(equal(single['provider_rating']))
+            expect(row['rating_counts']).to(equal(single['rating_counts']))
+            expect(row['provider_reviews']).to(equal(single['provider_reviews']))
+            expect(row['provider_rating']).to(equal(4.0))
+            expect(row['provider_reviews']).to(have_len(2))
+
+    def test_latest_reviews_are_capped_per_provider(self):
+        provider = ServiceProviderFactory(main_service=self.sub_service.main_service)
+        for _ in range(12):
+            order = OrderFactory(provider=provider, status=OrderStatus.COMPLETED, rating=4, review='Nice')
+            OrderStatusHistoryFactory(order=order)
+        expect(provider_reviews([provider.id])[provider.id]).to(have_len(10))
+
+
+class TestImageRenditions(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.provider = ServiceProviderFactory(photo__width=800, photo__height=600)
+        wait_for_renditions()
+        self.provider_service = ProviderServiceFactory(provider=self.provider)
+
+    def open_rendition(self, rendition, ext):
+        name = rendition_name(self.provider.photo.name, rendition, ext)
+        return Image.open(default_storage.open(name))
+
+    def test_renditions_generated_on_upload(self):
+        for rendition, (width, height) in RENDITIONS.items():
+            webp = self.open_rendition(rendition, 'webp')
+            jpeg = self.open_rendition(rendition, 'jpg')
+            expect(webp.format).to(equal('WEBP'))
+            expect(jpeg.format).to(equal('JPEG'))
+            expect(webp.size[0] <= width and webp.size[1] <= height).to(be(True))
+        expect(self.open_rendition('thumb', 'webp').size).to(equal((96, 72)))
+        # Renditions never upscale the original
+        expect(self.open_rendition('full', 'jpg').size).to(equal((800, 600)))
+
+    def test_only_changed_images_are_rendered(self):
+        with mock.patch('server.renditions._submit') as submit, self.captureOnCommitCallbacks(execute=True):
+            self.provider.is_active = False
+            self.provider.save()
+            self.provider.save(update_fields=['is_active'])
+            ServiceProvider.objects.get(id=self.provider.id).save()
+        expect(submit.called).to(be(False))
+
+        with mock.patch('server.renditions._submit') as submit, self.captureOnCommitCallbacks(execute=True):
+            self.provider.photo = image_upload('new.jpg')
+            self.provider.save()
+        submit.assert_called_once_with(self.provider.photo.name, self.provider.photo.storage)
+
+    def test_up_to_date_renditions_are_not_regenerated(self):
+        expect(generate_renditions(self.provider.photo.name)).to(equal([]))
+        expect(generate_renditions(self.provider.photo.name, force=True)).to(have_len(6))
+
+    def test_sources_sharing_a_stem_keep_their_own_renditions(self):
+        stem = f'services/{uuid.uuid4().hex}'
+        names = []
+        for ext, color in (('png', 'red'), ('jpg', 'blue')):
+            buffer = BytesIO()
+            Image.new('RGB', (40, 30), color).save(buffer, 'PNG' if ext == 'png' else 'JPEG')
+            names.append(default_storage.save(f'{stem}.{ext}', ContentFile(buffer.getvalue())))
+            generate_renditions(names[-1])
+
+        png, jpg = (rendition_name(name, 'thumb', 'jpg') for name in names)
+        expect(png).not_to(equal(jpg))
+        expect(Image.open(default_storage.open(png)).getpixel((0, 0))[0]).to(be_above(200))
+        expect(Image.open(default_storage.open(jpg)).getpixel((0, 0))[2]).to(be_above(200))
+
+    def test_concurrent_generation_overwrites_in_place(self):
+        name = self.provider.photo.name
+        threads = [
+            threading.Thread(target=generate_renditions, args=(name,), kwargs={'force': True})
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        directory = posixpath.dirname(rendition_name(name, 'thumb', 'jpg'))
+        prefix = posixpath.basename(name) + '.'
+        _, files = default_storage.listdir(directory)
+        expect(sorted(f for f in files if f.startswith(prefix))).to(equal(sorted(
+            posixpath.basename(rendition_name(name, rendition, ext))
+            for rendition in RENDITIONS for ext in ('webp', 'jpg')
+        )))
+        expect([f for f in files if f.endswith('.tmp')]).to(equal([]))
+
+    def test_serializer_renditions_are_opt_in(self):
+        url = reverse('subservice-providers', args=[self.provider_service.sub_service_id])
+        params = {'latitude': self.provider.latitude, 'longitude': self.provider.longitude}
+
+        response = self.client.get(url, params, HTTP_ACCEPT='image/webp,*/*')
+        original = self.provider.photo.open('rb').read()
+        expect(response.data[0]['provider_photo']).to(contain(base64.b64encode(original).decode()))
+
+        response = self.client.get(url, {**params, 'image_rendition': 'card'}, HTTP_ACCEPT='image/webp,*/*')
+        expect(response.data[0]['provider_photo']).to(start_with('data:image/webp;base64,'))
+        card = default_storage.open(rendition_name(self.provider.photo.name, 'card', 'webp')).read()
+        expect(response.data[0]['provider_photo']).to(contain(base64.b64encode(card).decode()))
+
+    def test_missing_rendition_falls_back_to_original(self):
+        provider = ServiceProviderFactory()
+        expect(rendition_url(provider.photo, 'thumb')).to(equal(provider.photo.url))
+
+    def test_backfill_command(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            provider = ServiceProviderFactory()
+            default_storage.save('services/broken.jpg', ContentFile(b'not an image'))
+            out, err = StringIO(), StringIO()
+            call_command('generate_renditions', workers=2, stdout=out, stderr=err)
+
+            expect(out.getvalue()).to(contain('2 images: 1 rendered, 0 up to date, 1 failed'))
+            expect(err.getvalue()).to(contain('services/broken.jpg'))
+            expect(default_storage.exists(rendition_name(provider.photo.name, 'card', 'webp'))).to(be(True))
+
+
+@override_settings(FACE_VERIFICATION={'MODELS': ['Facenet', 'ArcFace'], 'PRELOAD': False})
+class TestFaceModelRegistry(APITestCase):
+    def setUp(self):
+        patcher = mock.patch('service_provider.face_models.DeepFace')
+        self.deepface = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.registry = FaceModelRegistry()
+
+    def test_loads_and_warms_each_model_once(self):
+        self.registry.load()
+        self.registry.load()
+
+        expect(self.registry.ready).to(be(True))
+        expect(self.deepface.build_model.call_count).to(equal(2))
+        expect(self.deepface.represent.call_count).to(equal(2))
+        stats = self.registry.stats()
+        expect(stats['models']).to(have_keys('Facenet', 'ArcFace'))
+        expect(stats['models']['Facenet']).to(have_keys('load_seconds', 'warmup_seconds', 'memory_bytes'))
+
+    def test_failed_load_is_reported(self):
+        self.deepface.build_model.side_effect = RuntimeError('weights missing')
+        expect(self.registry.wait()).to(be(False))
+        expect(self.registry.stats()['error']).to(equal('weights missing'))
+
+    def test_matcher_reuses_loaded_models(self):
+        self.registry.load()
+        matcher = FaceMatcher(registry=self.registry)
+        FaceMatcher(registry=self.registry)
+        expect(matcher.models).to(equal(['Facenet', 'ArcFace']))
+        expect(self.deepface.build_model.call_count).to(equal(2))
+
+    def test_readiness_probe(self):
+        url = reverse('verify-faces-ready')
+        with mock.patch('service_provider.views.face_models', self.registry):
+            expect(self.client.get(url).status_code).to(equal(503))
+            self.registry.load()
+            response = self.client.get(url)
+        expect(response.status_code).to(equal(200))
+        expect(response.data['data']['state']).to(equal('ready'))
+
+
+def fake_run_model(model_name, image1, image2, threshold_multiplier):
+    # Runs inside the spawned pool workers, so it must be importable there
+    if model_name == 'Slow':
+        time.sleep(30)
+    if model_name == 'Broken':
+        raise ValueError('bad input')
+    distance = {'Facenet': 0.2, 'ArcFace': 0.4}[model_name]
+    return {'model': model_name, 'verified': distance < 0.3, 'distance': distance, 'threshold': 0.3}
+
+
+class TestFaceVerificationPool(APITestCase):
+    """Runs the real spawn path: pool service, socket client and worker processes."""
+
+    def setUp(self):
+        self.pool = FaceVerificationPool(size=1, timeout=3, runner=fake_run_model, model_names=[])
+        self.addCleanup(self.pool.shutdown)
+        listener = Listener(('127.0.0.1', 0))
+        stop = threading.Event()
+        server = threading.Thread(target=serve, args=(self.pool, listener, stop, b'test'), daemon=True)
+        server.start()
+        self.pool_client = FacePoolClient(address=listener.address, authkey=b'test')
+
+        def stop_server():
+            # Wake the blocked accept() so the thread exits before the port is reused
+            stop.set()
+            ConnectionClient(listener.address).close()
+            server.join(5)
+            listener.close()
+        self.addCleanup(stop_server)
+
+    def test_models_run_in_spawned_workers(self):
+        stats = self.pool_client.stats()
+        expect(stats['size']).to(equal(1))
+
+        results = self.pool_client.verify(['ArcFace', 'Facenet', 'Broken'], 'a.jpg', 'b.jpg', 1.0)
+        expect([res['model'] for res in results]).to(equal(['ArcFace', 'Facenet', 'Broken']))
+        expect(results[1]['verified']).to(be(True))
+        expect(results[2]['error']).to(equal('bad input'))
+
+        pids = {process.pid for process in self.pool.executor._processes.values()}
+        expect(pids).not_to(contain(os.getpid()))
+
+    def test_timed_out_model_does_not_block_later_requests(self):
+        self.pool.start()
+        results = self.pool_client.verify(['Facenet', 'Slow'], 'a.jpg', 'b.jpg', 1.0)
+        expect(results[0]['verified']).to(be(True))
+        expect(results[1]['error']).to(contain('Timed out'))
+
+        # The only worker was stuck in 'Slow'; it is killed and replaced
+        start = time.monotonic()
+        results = self.pool_client.verify(['Facenet'], 'a.jpg', 'b.jpg', 1.0)
+        expect(results[0]['verified']).to(be(True))
+        expect(time.monotonic() - start).to(be_below(30))
+        expect(self.pool.recycles).to(equal(1))
+
+    def test_rejects_wrong_authkey(self):
+        client = FacePoolClient(address=self.pool_client._address, authkey=b'wrong')
+        with self.assertRaises(Exception):
+            client.stats()
+
+    def test_silent_client_does_not_block_others(self):
+        # Connects but never answers the authkey challenge
+        silent = ConnectionClient(self.pool_client._address)
+        self.addCleanup(silent.close)
+
+        expect(self.pool_client.stats()['size']).to(equal(1))
+
+
+@override_settings(FACE_VERIFICATION={'MODELS': ['Facenet', 'ArcFace'], 'EXECUTION': 'parallel', 'PRELOAD': False})
+class TestParallelFaceVerification(APITestCase):
+    def setUp(self):
+        self.pool_client = mock.Mock()
+        self.pool_client.verify.return_value = [
+            fake_run_model('Facenet', None, None, 1.0), fake_run_model('ArcFace', None, None, 1.0)
+        ]
+        self.pool_client.stats.return_value = {'workers': {}}
+        patcher = mock.patch('service_provider.face_pool.face_pool_client', self.pool_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_matcher_merges_parallel_results(self):
+        matcher = FaceMatcher(registry=FaceModelRegistry())
+        with mock.patch('service_provider.validate_service_provider.face_pool_client', self.pool_client), \
+                mock.patch.object(FaceMatcher, 'prepare_face', return_value=(np.zeros((8, 8, 3), np.uint8), None)):
+            result = matcher.verify_faces('a.jpg', 'b.jpg')
+
+        expect(result['success']).to(be(True))
+        expect(result['matched']).to(be(False))
+        expect(result['average_distance']).to(be_within(0.2999, 0.3001))
+
+    def test_web_workers_do_not_load_models(self):
+        registry = FaceModelRegistry()
+        with mock.patch('service_provider.face_models.DeepFace') as deepface:
+            expect(registry.wait()).to(be(True))
+        expect(deepface.build_model.called).to(be(False))
+
+    def test_readiness_rechecks_unreachable_pool(self):
+        registry = FaceModelRegistry()
+        self.pool_client.stats.side_effect = ConnectionRefusedError('refused')
+        registry.load()
+        expect(registry.state).to(equal('failed'))
+
+        self.pool_client.stats.side_effect = None
+        with mock.patch('service_provider.views.face_models', registry):
+            response = self.client.get(reverse('verify-faces-ready'))
+        expect(response.status_code).to(equal(200))
+
+
+def image_upload(name, size=(64, 48)):
+    buffer = BytesIO()
+    Image.new('RGB', size, (120, 80, 40)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(FACE_VERIFICATION={'MODELS': ['Facenet', 'ArcFace'], 'PRELOAD': False})
+class TestInMemoryFaceVerification(APITestCase):
+    def setUp(self):
+        patcher = mock.patch('service_provider.face_models.DeepFace')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        registry = FaceModelRegistry()
+        registry.load()
+        registry_patcher = mock.patch('service_provider.validate_service_provider.face_models', registry)
+        registry_patcher.start()
+        self.addCleanup(registry_patcher.stop)
+
+    def test_decode_image_from_upload_buffer(self):
+        image = decode_image(image_upload('a.jpg'))
+        expect(image.shape).to(equal((48, 64, 3)))
+        expect(decode_image(image)).to(be(image))
+        expect(decode_image(b'not an image')).to(be(None))
+
+    def test_uploads_are_decoded_once_and_never_written(self):
+        seen = []
+
+        def run_model(model_name, image1, image2, threshold_multiplier):
+            seen.append((image1, image2))
+            return fake_run_model(model_name, image1, image2, threshold_multiplier)
+
+        faces = []
+
+        def prepare_face(image):
+            faces.append(decode_image(image))
+            return faces[-1], None
+
+        with tempfile.TemporaryDirectory() as base_dir, override_settings(BASE_DIR=base_dir), \
+                mock.patch('service_provider.validate_service_provider.run_model', side_effect=run_model), \
+                mock.patch.object(FaceMatcher, 'prepare_face', side_effect=prepare_face):
+            response = self.client.post(reverse('verify-faces'), {
+                'image1': image_upload('same.jpg'), 'image2': image_upload('same.jpg', size=(32, 32)),
+            }, format='multipart')
+            expect(os.listdir(base_dir)).to(equal([]))
+
+        expect(response.data['success']).to(be(True))
+        image1, image2 = faces
+        expect(image2.shape).to(equal((32, 32, 3)))
+        # Every model gets the arrays that were checked for a face
+        for model_image1, model_image2 in seen:
+            expect(model_image1).to(be(image1))
+            expect(model_image2).to(be(image2))
+
+    def test_unreadable_upload_is_rejected(self):
+        response = self.client.post(reverse('verify-faces'), {
+            'image1': SimpleUploadedFile('a.jpg', b'not an image'), 'image2': image_upload('b.jpg'),
+        }, format='multipart')
+        expect(response.data['success']).to(be(False))
+        expect(response.data['error']).to(contain('First image issue'))
+
+
+def fake_represent(img_path, model_name, **kwargs):
+    return [{'embedding': {'Facenet': [0.1, 0.2, 0.3, 0.4], 'ArcFace': [1.0, 0.0, 0.5, 0.25]}[model_name]}]
+
+
+@override_settings(FACE_VERIFICATION={'MODELS': ['Facenet', 'ArcFace'], 'PRELOAD': False})
+class TestProviderFaceEmbeddings(APITestCase):
+    def setUp(self):
+        patcher = mock.patch('service_provider.face_models.DeepFace')
+        self.deepface = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.deepface.represent.side_effect = fake_represent
+        # Factory photos are plain colour, so skip the face detection
+        patcher = mock.patch.object(FaceModelRegistry, 'prepare_face', side_effect=lambda image: (decode_image(image), None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.registry = FaceModelRegistry()
+        self.registry.load()
+        self.provider = ServiceProviderFactory()
+        self.deepface.represent.reset_mock()
+
+    def test_embeddings_stored_as_tagged_float32(self):
+        expect(compute_provider_embeddings(self.provider)).to(equal(['Facenet', 'ArcFace']))
+        expect(compute_provider_embeddings(self.provider)).to(equal([]))
+
+        row = ProviderFaceEmbedding.objects.get(provider=self.provider, model_name='Facenet')
+        expect(row.model_version).to(equal(MODEL_VERSION))
+        expect(row.photo_name).to(equal(self.provider.photo.name))
+        expect(row.dimensions).to(equal(4))
+        expect(len(bytes(row.vector))).to(equal(16))
+        expect(row.embedding.dtype.itemsize).to(equal(4))
+        expect(row.embedding[3]).to(be_within(0.3999, 0.4001))
+        expect(self.deepface.represent.call_count).to(equal(2))
+
+    def test_changed_photo_makes_embeddings_stale(self):
+        compute_provider_embeddings(self.provider)
+        serializer = ServiceProviderCreateUpdateSerializer(
+            self.provider, data={'photo': image_upload('new.jpg')}, partial=True
+        )
+        expect(serializer.is_valid()).to(be(True))
+        serializer.save()
+
+        # The new photo is embedded by a verification worker, not in the request
+        expect(self.deepface.represent.call_count).to(equal(2))
+        job = run_job(claim_job())
+        expect(job.kind).to(equal('embeddings'))
+        expect(job.result['computed']).to(equal(['Facenet', 'ArcFace']))
+
+        self.provider.refresh_from_db()
+        expect(provider_embeddings(self.provider, ['Facenet', 'ArcFace'])).to(have_keys('Facenet', 'ArcFace'))
+        expect(ProviderFaceEmbedding.objects.filter(provider=self.provider).count()).to(equal(2))
+        expect(self.deepface.represent.call_count).to(equal(4))
+
+    def test_reverification_only_embeds_selfie(self):
+        compute_provider_embeddings(self.provider)
+        self.deepface.represent.reset_mock()
+
+        with mock.patch.object(FaceMatcher, 'prepare_face', side_effect=lambda image: (decode_image(image), None)):
+            result = FaceMatcher(registry=self.registry).verify_provider(self.provider, image_upload('selfie.jpg'))
+
+        expect(result['success']).to(be(True))
+        expect(result['matched']).to(be(True))
+        expect([res['model'] for res in result['results']]).to(equal(['Facenet', 'ArcFace']))
+        expect(self.deepface.represent.call_count).to(equal(2))
+        self.deepface.verify.assert_not_called()
+
+    def test_verify_endpoint_with_provider_id(self):
+        with mock.patch('service_provider.validate_service_provider.face_models', self.registry), \
+                mock.patch.object(FaceMatcher, 'prepare_face', side_effect=lambda image: (decode_image(image), None)):
+            response = self.client.post(reverse('verify-faces'), {
+                'provider_id': str(self.provider.id), 'image2': image_upload('selfie.jpg'),
+            }, format='multipart')
+            missing = self.client.post(reverse('verify-faces'), {
+                'provider_id': 'not-a-uuid', 'image2': image_upload('selfie.jpg'),
+            }, format='multipart')
+
+        expect(response.data['matched']).to(be(True))
+        expect(missing.status_code).to(equal(404))
+
+    def test_backfill_command(self):
+        ServiceProviderFactory()
+        out = StringIO()
+        with mock.patch('service_provider.management.commands.compute_face_embeddings.face_models', self.registry):
+            call_command('compute_face_embeddings', stdout=out)
+            call_command('compute_face_embeddings', stdout=out)
+
+        expect(out.getvalue()).to(contain('2 providers: 2 embedded, 0 up to date, 0 failed'))
+        expect(out.getvalue()).to(contain('2 providers: 0 embedded, 2 up to date, 0 failed'))
+        expect(ProviderFaceEmbedding.objects.count()).to(equal(4))
+
+
+class TestFaceVerificationJobs(APITestCase):
+    def setUp(self):
+        self.matcher = mock.Mock()
+        self.matcher.verify_faces.return_value = {
+            'success': True, 'matched': True, 'average_distance': np.float64(0.2),
+            'results': [{'model': 'Facenet', 'verified': np.bool_(True), 'distance': np.float64(0.2)}],
+        }
+        patcher = mock.patch('service_provider.face_jobs.get_channel_layer')
+        self.channel_layer = patcher.start().return_value
+        self.channel_layer.group_send = mock.AsyncMock()
+        self.addCleanup(patcher.stop)
+
+    def test_submit_returns_job_id_immediately(self):
+        response = self.client.post(reverse('verify-jobs'), {
+            'image1': image_upload('a.jpg'), 'image2': image_upload('b.jpg'), 'notify_id': 'client-1',
+        }, format='multipart')
+
+        expect(response.status_code).to(equal(202))
+        job = FaceVerificationJob.objects.get(id=response.data['job_id'])
+        expect(job.status).to(equal('queued'))
+        expect(bytes(job.image1)).to(start_with(b'\xff\xd8'))
+        # The recipient is never taken from the request
+        expect(job.notify_id).to(equal(''))
+
+        response = self.client.get(reverse('verify-job-status', args=[job.id]))
+        expect(response.data['status']).to(equal('queued'))
+        expect(response.data['result']).to(be(None))
+
+    def test_provider_jobs_notify_the_provider(self):
+        provider = ServiceProviderFactory()
+        response = self.client.post(reverse('verify-jobs'), {
+            'provider_id': str(provider.id), 'image2': image_upload('b.jpg'), 'notify_id': 'client-1',
+        }, format='multipart')
+
+        expect(response.status_code).to(equal(202))
+        job = FaceVerificationJob.objects.get(id=response.data['job_id'])
+        expect(job.notify_id).to(equal(str(provider.id)))
+
+    def test_worker_runs_job_and_pushes_result(self):
+        job = submit_job(b'second', image1=b'first', notify_id='client-1')
+        claimed = claim_job('test-worker')
+        expect(claimed.id).to(equal(job.id))
+        expect(claimed.status).to(equal('running'))
+        expect(claim_job('test-worker')).to(be(None))
+
+        run_job(claimed, self.matcher)
+
+        self.matcher.verify_faces.assert_called_once_with(b'first', b'second')
+        job.refresh_from_db()
+        expect(job.status).to(equal('done'))
+        expect(job.image1).to(be(None))
+        expect(job.result['results'][0]['verified']).to(be(True))
+        group, event = self.channel_layer.group_send.call_args[0]
+        expect(group).to(equal('notifications_client-1'))
+        expect(event['message']).to(have_keys(type='face_verification', job_id=str(job.id), status='done'))
+
+        response = self.client.get(reverse('verify-job-status', args=[job.id]))
+        expect(response.data['result']['matched']).to(be(True))
+
+    def test_failed_verification_and_push_errors(self):
+        self.matcher.verify_faces.return_value = {'success': False, 'error': 'First image issue: No face detected.'}
+        self.channel_layer.group_send.side_effect = ConnectionError('redis down')
+        submit_job(b'second', image1=b'first', notify_id='client-1')
+
+        job = run_job(claim_job(), self.matcher)
+        expect(job.status).to(equal('failed'))
+        expect(job.error).to(contain('No face detected'))
+
+    def test_stale_running_jobs_are_requeued(self):
+        submit_job(b'second', image1=b'first')
+        job = claim_job()
+        FaceVerificationJob.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(hours=1))
+
+        expect(requeue_stale_jobs()).to(equal(1))
+        expect(claim_job().id).to(equal(job.id))
+
+    def test_requeued_job_keeps_one_result(self):
+        submit_job(b'second', image1=b'first', notify_id='client-1')
+        slow = claim_job('slow-worker')
+        FaceVerificationJob.objects.filter(id=slow.id).update(started_at=timezone.now() - timedelta(hours=1))
+        requeue_stale_jobs()
+        again = claim_job('other-worker')
+
+        self.matcher.verify_faces.return_value = {'success': False, 'error': 'late'}
+        run_job(slow, self.matcher)
+        job = FaceVerificationJob.objects.get(id=slow.id)
+        expect(job.status).to(equal('running'))
+        expect(self.channel_layer.group_send.called).to(be(False))
+
+        self.matcher.verify_faces.return_value = {'success': True, 'matched': True}
+        run_job(again, self.matcher)
+        job.refresh_from_db()
+        expect(job.status).to(equal('done'))
+        expect(job.worker).to(equal('other-worker'))
+        expect(self.channel_layer.group_send.call_count).to(equal(1))
+
+    @override_settings(FACE_VERIFICATION={'JOB_MAX_ATTEMPTS': 2})
+    def test_job_that_keeps_killing_workers_is_failed(self):
+        job = submit_job(b'second', image1=b'first', notify_id='client-1')
+        for attempt in range(2):
+            expect(claim_job().id).to(equal(job.id))
+            FaceVerificationJob.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(hours=1))
+            requeued = requeue_stale_jobs()
+
+        expect(requeued).to(equal(0))
+        job.refresh_from_db()
+        expect(job.attempts).to(equal(2))
+        expect(job.status).to(equal('failed'))
+        expect(job.error).to(contain('2 attempts'))
+        expect(job.image1).to(be(None))
+        expect(claim_job()).to(be(None))
+        group, event = self.channel_layer.group_send.call_args[0]
+        expect(event['message']).to(have_keys(status='failed'))
+
+    def test_signup_jobs_are_not_served(self):
+        job = FaceVerificationJob.objects.create(
+            provider=ServiceProviderFactory(), kind='duplicates', status='done', result={'matches': []}
+        )
+        response = self.client.get(reverse('verify-job-status', args=[job.id]))
+        expect(response.status_code).to(equal(404))
+
+    def test_metrics(self):
+        submit_job(b'b', image1=b'a')
+        run_job(claim_job(), self.matcher)
+        submit_job(b'b', image1=b'a')
+
+        self.client.force_authenticate(user=UserFactory())
+        expect(self.client.get(reverse('verify-jobs-metrics')).status_code).to(equal(403))
+        self.client.force_authenticate(user=UserFactory(is_staff=True))
+        metrics = self.client.get(reverse('verify-jobs-metrics')).data
+        expect(metrics['queue_depth']).to(equal(1))
+        expect(metrics['running']).to(equal(0))
+        expect(metrics['finished']).to(equal(1))
+        expect(metrics['wait_seconds']).to(have_keys('avg', 'p95', 'max'))
+        expect(metrics['run_seconds']['max']).not_to(be(None))
+        expect(job_metrics()['oldest_queued_seconds']).not_to(be(None))
+
+
+def model_result(model_name, distance, threshold=0.4):
+    return {'model': model_name, 'verified': distance < threshold, 'distance': distance, 'threshold': threshold}
+
+
+class TestFaceCascade(APITestCase):
+    def test_cascade_order(self):
+        expect(cascade_order(['VGG-Face', 'Facenet', 'Dlib'], ['Facenet', 'ArcFace', 'VGG-Face'])).to(
+            equal(['Facenet', 'VGG-Face', 'Dlib'])
+        )
+
+    def test_stops_at_first_clear_result(self):
+        distances = {'Facenet': 0.05, 'ArcFace': 0.1}
+        results = run_cascade(['Facenet', 'ArcFace'], lambda model: model_result(model, distances[model]), 0.25)
+        expect([res['model'] for res in results]).to(equal(['Facenet']))
+
+        # 0.38 is within 25% of the 0.4 threshold, so the next model decides
+        distances = {'Facenet': 0.38, 'ArcFace': 0.9}
+        results = run_cascade(['Facenet', 'ArcFace'], lambda model: model_result(model, distances[model]), 0.25)
+        expect([res['model'] for res in results]).to(equal(['Facenet', 'ArcFace']))
+
+    @override_settings(FACE_VERIFICATION={
+        'MODELS': ['VGG-Face', 'Facenet', 'ArcFace'], 'PRELOAD': False, 'POLICY': 'cascade',
+        'CASCADE_ORDER': ['Facenet', 'ArcFace', 'VGG-Face'], 'CASCADE_MARGIN': 0.25,
+    })
+    def test_matcher_records_models_run(self):
+        distances = {'Facenet': 0.35, 'ArcFace': 0.9, 'VGG-Face': 0.1}
+        with mock.patch('service_provider.face_models.DeepFace'):
+            registry = FaceModelRegistry()
+            registry.load()
+        with mock.patch('service_provider.validate_service_provider.run_model',
+                        side_effect=lambda model, *args: model_result(model, distances[model])) as run_model, \
+                mock.patch.object(FaceMatcher, 'prepare_face', side_effect=lambda image: (decode_image(image), None)):
+            result = FaceMatcher(registry=registry).verify_faces(np.zeros((8, 8, 3), np.uint8), np.zeros((8, 8, 3), np.uint8))
+
+        expect(result['policy']).to(equal('cascade'))
+        expect(result['models_run']).to(equal(['Facenet', 'ArcFace']))
+        expect(result['matched']).to(be(False))
+        expect(run_model.call_count).to(equal(2))
+
+    def test_evaluate_reports_savings_and_agreement(self):
+        models = ['Facenet', 'ArcFace']
+        pairs = [
+            # Clear accept: the cascade stops after Facenet and agrees
+            (True, {'Facenet': (model_result('Facenet', 0.05), 1.0), 'ArcFace': (model_result('ArcFace', 0.1), 3.0)}),
+            # Clear accept by Facenet, but ArcFace would have rejected
+            (False, {'Facenet': (model_result('Facenet', 0.1), 1.0), 'ArcFace': (model_result('ArcFace', 0.6), 3.0)}),
+            # Ambiguous: both run
+            (False, {'Facenet': (model_result('Facenet', 0.39), 1.0), 'ArcFace': (model_result('ArcFace', 0.6), 3.0)}),
+        ]
+        report = evaluate(pairs, models, 0.25)
+
+        expect(report['agreement']).to(equal(2))
+        expect(report['all_models']['correct']).to(equal(3))
+        expect(report['cascade']['correct']).to(equal(2))
+        expect(report['cascade']['early_exits']).to(equal(2))
+        expect(report['latency_saved']).to(equal(0.5))
+
+
+def fake_forward(model_name, faces):
+    return np.concatenate(faces).reshape(len(faces), -1).astype(np.float32) + {'Facenet': 0, 'ArcFace': 1}[model_name]
+
+
+class TestInferenceServer(APITestCase):
+    def test_message_round_trip(self):
+        header, arrays = decode_message(encode_message({'models': ['VGG-Face']}, {'VGG-Face': np.arange(3, dtype=np.float32)}))
+        expect(header).to(equal({'models': ['VGG-Face']}))
+        expect(arrays['VGG-Face'].tolist()).to(equal([0.0, 1.0, 2.0]))
+
+    def test_batches_items_from_concurrent_callers(self):
+        batch_sizes = []
+
+        def forward(items):
+            batch_sizes.append(len(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(forward, max_batch=4, max_wait=0.2)
+        self.addCleanup(batcher.stop)
+        futures = [batcher.submit(i) for i in range(6)]
+
+        expect([future.result(5) for future in futures]).to(equal([0, 2, 4, 6, 8, 10]))
+        expect(batch_sizes).to(equal([4, 2]))
+        expect(batcher.stats()['mean_batch']).to(equal(3.0))
+
+    def test_forward_errors_reach_every_caller(self):
+        batcher = MicroBatcher(mock.Mock(side_effect=RuntimeError('oom')), max_batch=2, max_wait=0.05)
+        self.addCleanup(batcher.stop)
+        future = batcher.submit(1)
+        with self.assertRaises(RuntimeError):
+            future.result(5)
+
+    @override_settings(FACE_VERIFICATION={'MODELS': ['Facenet', 'ArcFace'], 'EXECUTION': 'server', 'PRELOAD': False})
+    def test_matcher_client_mode(self):
+        service = InferenceService(
+            ['Facenet', 'ArcFace'], max_batch=8, max_wait=0.01,
+            preprocess=lambda model_name, image: image[np.newaxis].astype(np.float32), forward=fake_forward
+        )
+        server, port = start_server(service, '127.0.0.1:0', threads=4)
+        self.addCleanup(service.stop)
+        self.addCleanup(server.stop, None)
+        client = InferenceClient(f'127.0.0.1:{port}')
+        self.addCleanup(client.close)
+
+        embeddings = client.represent(['Facenet'], np.ones((2, 2), dtype=np.uint8))
+        expect(embeddings['Facenet'].tolist()).to(equal([1.0, 1.0, 1.0, 1.0]))
+
+        with mock.patch('service_provider.inference_server.inference_client', client):
+            registry = FaceModelRegistry()
+            expect(registry.wait()).to(be(True))
+            with mock.patch.object(FaceMatcher, 'prepare_face', side_effect=lambda image: (decode_image(image), None)):
+                result = FaceMatcher(registry=registry).verify_faces(
+                    np.full((2, 2), 3, dtype=np.uint8), np.full((2, 2), 3, dtype=np.uint8)
+                )
+
+        expect(result['matched']).to(be(True))
+        expect(result['models_run']).to(equal(['Facenet', 'ArcFace']))
+
+
+class TestTFLiteBackend(APITestCase):
+    def setUp(self):
+        import tensorflow as tf
+
+        self.keras_model = tf.keras.Sequential([
+            tf.keras.Input((8, 8, 3)), tf.keras.layers.Flatten(), tf.keras.layers.Dense(4),
+        ])
+        self.tflite_dir = tempfile.mkdtemp()
+        for quantization in ('none', 'dynamic'):
+            with open(graph_path(self.tflite_dir, 'Facenet', quantization), 'wb') as graph:
+                graph.write(convert(self.keras_model, quantization))
+
+    def config(self, quantization):
+        return override_settings(FACE_VERIFICATION={
+            'MODELS': ['Facenet'], 'PRELOAD': False, 'BACKEND': 'tflite',
+            'TFLITE_DIR': self.tflite_dir, 'TFLITE_QUANTIZATION': quantization, 'TFLITE_THREADS': 2,
+        })
+
+    def test_embeddings_match_keras(self):
+        faces = [np.random.default_rng(i).random((1, 8, 8, 3), dtype=np.float32) for i in range(3)]
+        reference = self.keras_model(np.concatenate(faces)).numpy()
+
+        for quantization, tolerance in (('none', 1e-5), ('dynamic', 0.05)):
+            with self.config(quantization):
+                embeddings = forward_batch('Facenet', faces)
+                # A later batch of another size resizes the interpreter input
+                single = forward_batch('Facenet', faces[:1])
+            expect(embeddings.shape).to(equal((3, 4)))
+            expect(np.abs(embeddings - reference).max()).to(be_below(tolerance))
+            expect(np.abs(single[0] - reference[0]).max()).to(be_below(tolerance))
+
+    def test_keras_model_is_not_built(self):
+        with self.config('dynamic'), mock.patch('service_provider.face_models.DeepFace') as deepface:
+            embedder, stats = build_and_warm('Facenet')
+            expect(embedder.input_shape).to(equal((8, 8)))
+            expect(stats).to(have_keys('load_seconds', 'memory_bytes'))
+            expect(tflite_embedder('ArcFace')).to(be(None))
+        deepface.build_model.assert_not_called()
+
+
+class TestSinglePassFaceDetection(APITestCase):
+    def setUp(self):
+        self.cascade = mock.Mock()
+        self.eye_cascade = mock.Mock()
+        self.eye_cascade.detectMultiScale.return_value = []
+        self.image = np.zeros((2000, 1000, 3), dtype=np.uint8)
+
+    def test_detects_on_downscaled_copy_and_maps_boxes_back(self):
+        self.cascade.detectMultiScale.return_value = [(100, 200, 50, 60)]
+        expect(detect_faces(self.image, self.cascade, 500)).to(equal([(400, 800, 200, 240)]))
+        expect(self.cascade.detectMultiScale.call_args[0][0].shape).to(equal((500, 250)))
+
+    def test_returns_aligned_crop_from_original(self):
+        self.cascade.detectMultiScale.return_value = [(100, 200, 50, 60)]
+        face, error = prepare_face(self.image, self.cascade, self.eye_cascade, 500)
+        expect(error).to(be(None))
+        # 200x240 box plus a 10% margin on each side, cut from the full-resolution image
+        expect(face.shape).to(equal((288, 240, 3)))
+
+    def test_levels_tilted_eyes(self):
+        crop = np.zeros((100, 100, 3), dtype=np.uint8)
+        self.eye_cascade.detectMultiScale.return_value = [(60, 40, 10, 10), (20, 30, 10, 10)]
+        with mock.patch('service_provider.face_detection.cv2.getRotationMatrix2D', wraps=cv2.getRotationMatrix2D) as rotate:
+            align_face(crop, (0, 0, 100, 100), self.eye_cascade)
+        expect(rotate.call_args[0][1]).to(be_within(14.0, 14.1))
+
+    def test_reports_face_count_errors(self):
+        self.cascade.detectMultiScale.return_value = []
+        expect(prepare_face(self.image, self.cascade, self.eye_cascade, 500)).to(equal((None, 'No face detected.')))
+        self.cascade.detectMultiScale.return_value = [(0, 0, 10, 10), (20, 20, 10, 10)]
+        expect(prepare_face(self.image, self.cascade, self.eye_cascade, 500)[1]).to(equal('Multiple faces detected.'))
+
+    @override_settings(FACE_VERIFICATION={'MODELS': ['Facenet', 'ArcFace'], 'PRELOAD': False})
+    def test_each_image_detected_once_and_models_skip_detection(self):
+        with mock.patch('service_provider.face_models.DeepFace') as deepface:
+            registry = FaceModelRegistry()
+            registry.load()
+            deepface.verify.return_value = {'distance': 0.1, 'threshold': 0.4}
+            matcher = FaceMatcher(registry=registry)
+            with mock.patch('service_provider.validate_service_provider.prepare_face',
+                            side_effect=lambda image, *args: (image[:10, :10], None)) as detect:
+                result = matcher.verify_faces(self.image, self.image)
+
+        expect(result['matched']).to(be(True))
+        expect(detect.call_count).to(equal(2))
+        for call in deepface.verify.call_args_list:
+            expect(call.kwargs['detector_backend']).to(equal('skip'))
+            expect(call.kwargs['img1_path'].shape).to(equal((10, 10, 3)))
+
+
+class TestLazyFaceVerificationImports(APITestCase):
+    def test_url_conf_does_not_import_ml_stack(self):
+        code = (
+            "import sys, django; django.setup(); import server.urls, server.asgi; "
+            "print(','.join(name for name in ('cv2', 'deepface', 'tensorflow') if name in sys.modules))"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'server.settings', 'FACE_VERIFICATION_PRELOAD': ''}
+        output = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        expect(output.strip()).to(equal(''))
+
+    def test_lazy_module_imports_on_first_use(self):
+        module = lazy_module('json.decoder')
+        expect(repr(module)).to(contain('json.decoder'))
+        expect(module.JSONDecodeError.__name__).to(equal('JSONDecodeError'))
+        expect(repr(module)).to(contain('(loaded)'))
+
+
+def clustered_vectors(count, dimensions=16, clusters=8, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions))
+    return centers[rng.integers(clusters, size=count)] + rng.normal(0, 0.1, (count, dimensions))
+
+
+class TestFaceIndex(APITestCase):
+    def setUp(self):
+        self.ids = [uuid.uuid4() for _ in range(600)]
+        self.vectors = clustered_vectors(600)
+        self.index = FaceIndex.from_vectors(self.ids, self.vectors)
+
+    def nearest(self, index, query, k=3, nprobe=None):
+        return key_uuids(index.search(query, k, nprobe=nprobe)[0])
+
+    def test_flat_search_is_exact(self):
+        units = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        expected = np.argsort(-(units @ units[7]))[:3]
+        keys, similarities = self.index.search(self.vectors[7], 3)
+        expect(key_uuids(keys)).to(equal([self.ids[row] for row in expected]))
+        expect(float(similarities[0])).to(be_within(0.999, 1.001))
+
+    def test_incremental_add_and_remove(self):
+        provider_id = uuid.uuid4()
+        vector = np.random.default_rng(1).normal(size=16)
+        self.index.add([provider_id], [vector])
+        expect(len(self.index)).to(equal(601))
+        expect(self.nearest(self.index, vector, 1)).to(equal([provider_id]))
+
+        # Adding again replaces the vector
+        self.index.add([provider_id], [-vector])
+        expect(len(self.index)).to(equal(601))
+        expect(self.nearest(self.index, -vector, 1)).to(equal([provider_id]))
+
+        self.index.remove([provider_id, self.ids[7]])
+        expect(len(self.index)).to(equal(599))
+        expect(self.nearest(self.index, -vector, 5)).not_to(contain(provider_id))
+        expect(self.nearest(self.index, self.vectors[7], 5)).not_to(contain(self.ids[7]))
+
+        self.index.compact()
+        expect(len(self.index)).to(equal(599))
+        expect(self.nearest(self.index, self.vectors[7], 5)).not_to(contain(self.ids[7]))
+
+    def test_ivf_probes_nearest_lists(self):
+        flat = FaceIndex.from_vectors(self.ids, self.vectors)
+        self.index.train(8, seed=1)
+        expect(self.index.nlist).to(equal(8))
+        for row in (0, 100, 200):
+            expect(self.nearest(self.index, self.vectors[row], 1, nprobe=2)).to(equal([self.ids[row]]))
+        # Probing every list is the exact search
+        expect(self.nearest(self.index, self.vectors[5], 10, nprobe=8)).to(equal(self.nearest(flat, self.vectors[5], 10)))
+
+        provider_id = uuid.uuid4()
+        self.index.add([provider_id], [self.vectors[300] * 1.5])
+        expect(self.nearest(self.index, self.vectors[300], 2, nprobe=1)).to(contain(provider_id))
+
+    def test_save_and_memory_mapped_load(self):
+        self.index.train(8)
+        self.index.add([uuid.uuid4()], [np.ones(16)])
+        self.index.meta = {'model_name': 'Facenet'}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'providers')
+            self.index.save(path)
+            self.index.save(path)
+            loaded = FaceIndex.load(path)
+
+            expect(isinstance(loaded._state[0][1], np.memmap)).to(be(True))
+            expect(len(loaded)).to(equal(601))
+            expect(loaded.nlist).to(equal(8))
+            expect(loaded.meta['model_name']).to(equal('Facenet'))
+            expect(self.nearest(loaded, self.vectors[3], 5, nprobe=2)).to(
+                equal(self.nearest(self.index, self.vectors[3], 5, nprobe=2))
+            )
+            # The replaced vectors file is removed
+            expect([name for name in os.listdir(directory) if name.endswith('.npy')]).to(have_len(1))
+
+            provider_id = uuid.uuid4()
+            loaded.add([provider_id], [-np.ones(16)])
+            expect(self.nearest(loaded, -np.ones(16), 1)).to(equal([provider_id]))
+            del loaded
+
+
+@override_settings(FACE_VERIFICATION={'MODELS': ['Facenet', 'ArcFace'], 'PRELOAD': False, 'DUPLICATE_MODEL': 'Facenet'})
+class TestDuplicateProviderDetection(APITestCase):
+    def setUp(self):
+        patcher = mock.patch('service_provider.face_models.DeepFace')
+        self.deepface = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.deepface.represent.side_effect = fake_represent
+        patcher = mock.patch.object(FaceModelRegistry, 'prepare_face', side_effect=lambda image: (decode_image(image), None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        face_index.invalidate()
+        self.addCleanup(face_index.invalidate)
+
+        # fake_represent embeds every photo as [0.1, 0.2, 0.3, 0.4] with Facenet
+        self.providers = ServiceProviderFactory.create_batch(3)
+        for provider, vector in zip(self.providers, ([0.1, 0.2, 0.3, 0.41], [0.4, -0.3, 0.2, -0.1], [-0.1, -0.2, -0.3, -0.4])):
+            self.store(provider, vector)
+
+    def store(self, provider, vector):
+        vector = np.asarray(vector, dtype='<f4')
+        ProviderFaceEmbedding.objects.update_or_create(provider=provider, model_name='Facenet', defaults={
+            'model_version': MODEL_VERSION,
+            'photo_name': provider.photo.name,
+            'dimensions': vector.size,
+            'vector': vector.tobytes(),
+        })
+
+    def test_signup_finds_providers_with_the_same_face(self):
+        provider = ServiceProviderFactory()
+        matches = similar_providers(provider, k=2)
+
+        expect([match['provider_id'] for match in matches]).to(equal([self.providers[0].id, self.providers[1].id]))
+        expect(matches[0]['likely_duplicate']).to(be(True))
+        expect(matches[0]['distance']).to(be_below(0.01))
+        expect(matches[1]['likely_duplicate']).to(be(False))
+        expect(ProviderFaceEmbedding.objects.filter(provider=provider, model_name='Facenet').exists()).to(be(True))
+
+    def test_duplicate_signup_is_logged(self):
+        provider = ServiceProviderFactory()
+        schedule_duplicate_check(provider)
+        with self.assertLogs('service_provider.face_index', 'WARNING') as logs:
+            job = run_job(claim_job())
+        expect(job.kind).to(equal('duplicates'))
+        expect(job.result['matches'][0]['likely_duplicate']).to(be(True))
+        expect(logs.output).to(have_len(1))
+        expect(logs.output[0]).to(contain(str(self.providers[0].id)))
+
+    def test_index_follows_embedding_writes_and_deletes(self):
+        face_index.get()
+        newcomer = ServiceProviderFactory()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store(newcomer, [0, 0, 0, 1])
+        expect(face_index.similar([0, 0, 0, 1], k=1)[0]['provider_id']).to(equal(newcomer.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            newcomer.delete()
+        expect(face_index.similar([0, 0, 0, 1], k=1)[0]['provider_id']).not_to(equal(newcomer.id))
+
+    def test_sync_picks_up_embeddings_from_other_workers(self):
+        face_index.get()
+        newcomer = ServiceProviderFactory()
+        # Written without running the commit hooks, as another worker would
+        self.store(newcomer, [0, 0, 0, 1])
+        expect(face_index.similar([0, 0, 0, 1], k=1)[0]['provider_id']).not_to(equal(newcomer.id))
+
+        face_index.sync()
+        expect(face_index.similar([0, 0, 0, 1], k=1)[0]['provider_id']).to(equal(newcomer.id))
+
+    def test_workers_load_the_saved_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'providers')
+            out = StringIO()
+            call_command('build_face_index', '--output', path, stdout=out)
+            expect(json.loads(out.getvalue())['providers']).to(equal(3))
+
+            face_index.invalidate()
+            config = {**settings.FACE_VERIFICATION, 'DUPLICATE_INDEX_PATH': path}
+            with override_settings(FACE_VERIFICATION=config), mock.patch.object(face_index, 'build') as build:
+                matches = face_index.similar([0.1, 0.2, 0.3, 0.4], k=1)
+            build.assert_not_called()
+            expect(matches[0]['provider_id']).to(equal(self.providers[0].id))
+
+    def test_review_endpoint_is_admin_only(self):
+        url = reverse('verify-duplicates', args=[self.providers[0].id])
+        self.client.force_authenticate(user=UserFactory())
+        expect(self.client.get(url).status_code).to(equal(403))
+
+        self.client.force_authenticate(user=UserFactory(is_staff=True))
+        response = self.client.get(url, {'k': 1})
+        expect(response.status_code).to(equal(200))
+        expect(response.data['data']['matches']).to(have_len(1))
+        expect(response.data['data']['matches'][0]).to(have_keys(
+            provider_id=str(self.providers[1].id), likely_duplicate=False
+        ))
+
+
+@skipUnless(connection.vendor == 'mysql', 'EXPLAIN output is MySQL specific')
+class TestProviderListingQueryPlan(TransactionTestCase):
+    def setUp(self):
+        service = ServiceFactory()
+        ServiceProvider.objects.bulk_create([
+            ServiceProviderFactory.build(main_service=service, photo='providers/plan.jpg')
+            for _ in range(300)
+        ])
+        analyze_tables(ServiceProvider)
+
+    def test_listing_order_is_read_from_name_index(self):
+        page = ServiceProviderViewSet.queryset.all()[:10]
+        tables, filesort = query_plan(page)
+        expect(tables[0]['key']).to(equal('provider_name_idx'))
+        expect(filesort).to(be(False))
+
+    def test_filtered_queries_are_not_sorted(self):
+        queryset = ServiceProvider.objects.filter(is_active=True)
+        expect(queryset.ordered).to(be(False))
+        expect(query_plan(queryset)[1]).to(be(False))
+
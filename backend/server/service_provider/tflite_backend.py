@@ -0,0 +1,91 @@
+"""
+TensorFlow Lite backend for the face embedding models.
+
+The verification nodes are CPU only. With FACE_VERIFICATION['BACKEND'] =
+'tflite' the embedding networks run from converted .tflite graphs, which
+are optionally quantized (``dynamic``: int8 weights; ``int8``: int8
+weights and activations, calibrated on real faces). TFLITE_THREADS sets
+how many CPU threads each interpreter uses. The Keras models are never
+built in this mode, so their float32 weights are not held in memory.
+
+Graphs are produced offline with ``manage.py convert_face_models`` and
+read from TFLITE_DIR as ``<model>.<quantization>.tflite``. Models without
+a converted graph (Dlib is not a Keras model) keep using DeepFace.
+``manage.py bench_face_backends`` reports accuracy parity with the Keras
+path and latency and memory for both.
+"""
+import os
+import threading
+
+import numpy as np
+
+from server.lazy_import import lazy_module
+
+tf = lazy_module('tensorflow')
+
+QUANTIZATIONS = ('none', 'dynamic', 'int8')
+
+
+def graph_path(directory, model_name, quantization):
+    return os.path.join(directory, f'{model_name}.{quantization}.tflite')
+
+
+def convert(keras_model, quantization='dynamic', calibration_faces=None):
+    """
+    Convert a Keras model to a TFLite flatbuffer. ``int8`` needs
+    ``calibration_faces``: preprocessed (1, h, w, 3) faces used to pick the
+    activation ranges. Inputs and outputs stay float32 in every mode.
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f'Unknown quantization {quantization!r}')
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if quantization in ('dynamic', 'int8'):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'int8':
+        if not calibration_faces:
+            raise ValueError('int8 quantization needs calibration faces')
+        converter.representative_dataset = lambda: ([face.astype(np.float32)] for face in calibration_faces)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+class TFLiteEmbedder:
+    """
+    One converted embedding model. Interpreters are not thread safe, so
+    every thread that embeds gets its own, built from one copy of the graph.
+    """
+
+    def __init__(self, path, threads=None, l2_normalize=False):
+        self.path = path
+        self.threads = threads
+        self.l2_normalize = l2_normalize
+        with open(path, 'rb') as graph:
+            self._content = graph.read()
+        self._local = threading.local()
+        # Input size is read from the graph so the Keras model is never needed
+        self.input_shape = tuple(self.interpreter.get_input_details()[0]['shape'][1:3])
+
+    @property
+    def interpreter(self):
+        interpreter = getattr(self._local, 'interpreter', None)
+        if interpreter is None:
+            interpreter = tf.lite.Interpreter(model_content=self._content, num_threads=self.threads)
+            interpreter.allocate_tensors()
+            self._local.interpreter = interpreter
+            self._local.batch = 1
+        return interpreter
+
+    def forward(self, batch):
+        """Embed an (n, h, w, 3) float batch. Returns an (n, dim) float32 array."""
+        interpreter = self.interpreter
+        input_index = interpreter.get_input_details()[0]['index']
+        if self._local.batch != len(batch):
+            interpreter.resize_tensor_input(input_index, [len(batch), *batch.shape[1:]])
+            interpreter.allocate_tensors()
+            self._local.batch = len(batch)
+        interpreter.set_tensor(input_index, batch.astype(np.float32))
+        interpreter.invoke()
+        embeddings = interpreter.get_tensor(interpreter.get_output_details()[0]['index']).astype(np.float32)
+        if self.l2_normalize:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings.reshape(len(batch), -1)
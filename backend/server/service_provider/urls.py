@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import ServiceProviderViewSet,verify_faces,LoginView,SignupView,SubServiceProvidersViewSet,ProviderServicesViewSet
+from .views import ServiceProviderViewSet,verify_faces,face_models_ready,submit_verification_job,verification_job_status,verification_job_metrics,provider_duplicates,LoginView,SignupView,SubServiceProvidersViewSet,ProviderServicesViewSet
 
 urlpatterns = [
     path('', 
@@ -50,6 +50,11 @@ urlpatterns = [
         name='subservice-providers'
     ),
     path('verify/', verify_faces, name='verify-faces'),
+    path('verify/ready/', face_models_ready, name='verify-faces-ready'),
+    path('verify/jobs/', submit_verification_job, name='verify-jobs'),
+    path('verify/jobs/metrics/', verification_job_metrics, name='verify-jobs-metrics'),
+    path('verify/jobs/<uuid:job_id>/', verification_job_status, name='verify-job-status'),
+    path('verify/duplicates/<uuid:provider_id>/', provider_duplicates, name='verify-duplicates'),
     path('login/', LoginView.as_view(), name='provider-login'),
     path('signup/', SignupView.as_view(), name='provider-signup'),
 ]
\ No newline at end of file
@@ -1,83 +1,127 @@
-import cv2
-from deepface import DeepFace
+from .face_cascade import cascade_order, run_cascade
+from .face_embeddings import compare_embeddings, compute_provider_embeddings, embed, provider_embeddings
+from .face_detection import prepare_face
+from .face_models import decode_image, face_models, face_verification_settings, run_model
+from .face_pool import face_pool_client
+
 
 class FaceMatcher:
-    def __init__(self, threshold_multiplier=1.0):
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    def __init__(self, threshold_multiplier=None, registry=None):
+        # Reuse the resident models; this only blocks while a worker is still warming up
+        registry = registry or face_models
+        registry.wait()
+        self.face_cascade = registry.cascade
+        self.eye_cascade = registry.eye_cascade
+        self.models = registry.model_names
+        config = face_verification_settings()
+        self.execution = config['EXECUTION']
+        self.policy = config['POLICY']
+        self.cascade_order = cascade_order(self.models, config['CASCADE_ORDER'])
+        self.cascade_margin = config['CASCADE_MARGIN']
+        self.detection_max_side = config['DETECTION_MAX_SIDE']
+        if threshold_multiplier is None:
+            threshold_multiplier = config['THRESHOLD_MULTIPLIER']
         self.threshold_multiplier = threshold_multiplier
 
-    def detect_face(self, image_path):
-        try:
-            image = cv2.imread(image_path)
-            if image is None:
-                return False, "Image not found."
-            
-            height, width = image.shape[:2]
-            min_face_size = min(height, width) // 8
-            
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(
-                gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_face_size, min_face_size)
-            )
-            
-            if len(faces) == 1:
-                return True, None
-            elif len(faces) == 0:
-                return False, "No face detected."
-            else:
-                return False, "Multiple faces detected."
-        except Exception as e:
-            return False, f"Error in face detection: {str(e)}"
+    def prepare_face(self, image):
+        """
+        Detect the face once (on a downscaled copy) and return its aligned
+        crop, which every model then uses as is. Returns (crop, error).
+        """
+        return prepare_face(decode_image(image), self.face_cascade, self.eye_cascade, self.detection_max_side)
+
+    def detect_face(self, image):
+        face, error = self.prepare_face(image)
+        return face is not None, error
 
-    
-    def verify_faces(self, image1_path, image2_path):
+    def verify_faces(self, image1, image2):
         """
         Match two face images using multiple models for improved accuracy.
+        Each image (a path, bytes, uploaded file or array) is decoded and
+        searched for a face once; every model gets the same aligned crop.
         Returns a dictionary containing the match result and confidence details.
         """
         try:
             # Check faces in both images
-            face1_valid, error1 = self.detect_face(image1_path)
-            face2_valid, error2 = self.detect_face(image2_path)
+            image1, error1 = self.prepare_face(image1)
+            image2, error2 = self.prepare_face(image2)
 
-            if not face1_valid:
+            if image1 is None:
                 return {"success": False, "error": f"First image issue: {error1}"}
-            if not face2_valid:
+            if image2 is None:
                 return {"success": False, "error": f"Second image issue: {error2}"}
 
             # Use multiple models for verification
-            models = ['VGG-Face', 'Facenet', 'ArcFace', 'Dlib']
-            results = []
-
-            for model in models:
-                result = DeepFace.verify(
-                    img1_path=image1_path,
-                    img2_path=image2_path,
-                    model_name=model,
-                    enforce_detection=False  # Assume faces are already detected
+            if self.policy == 'cascade':
+                results = run_cascade(
+                    self.cascade_order,
+                    lambda model: self._run_models([model], image1, image2)[0],
+                    self.cascade_margin
                 )
+            else:
+                results = self._run_models(self.models, image1, image2)
 
-                adjusted_threshold = result['threshold'] * self.threshold_multiplier
-                is_verified = result['distance'] < adjusted_threshold
+            return self._summarize(results)
 
-                results.append({
-                    'model': model,
-                    'verified': is_verified,
-                    'distance': result['distance'],
-                    'threshold': adjusted_threshold
-                })
+        except Exception as e:
+            return {"success": False, "error": str(e)}
 
-            # Analyze results
-            all_verified = all(res['verified'] for res in results)
-            avg_distance = sum(res['distance'] for res in results) / len(results)
+    def _run_models(self, models, image1, image2):
+        if self.execution == 'parallel':
+            return face_pool_client.verify(models, image1, image2, self.threshold_multiplier)
+        if self.execution == 'server':
+            # The inference server only embeds; the distances are computed here
+            embeddings1, embeddings2 = embed(models, image1), embed(models, image2)
+            return [
+                compare_embeddings(model, embeddings1[model], embeddings2[model], self.threshold_multiplier)
+                for model in models
+            ]
+        return [run_model(model, image1, image2, self.threshold_multiplier) for model in models]
 
-            return {
-                "success": True,
-                "matched": all_verified,
-                "results": results,
-                "average_distance": avg_distance,
-                "message": "Faces matched successfully" if all_verified else "Faces did not match."
-            }
+    def verify_provider(self, provider, selfie):
+        """
+        Match a new selfie against the provider's registered photo. The photo
+        side comes from the stored embeddings (computed here first if missing
+        or stale), so only the selfie is run through the models.
+        """
+        try:
+            selfie, error = self.prepare_face(selfie)
+            if selfie is None:
+                return {"success": False, "error": f"Selfie issue: {error}"}
+
+            compute_provider_embeddings(provider, self.models)
+            references = provider_embeddings(provider, self.models)
+
+            def compare(models):
+                embeddings = embed(models, selfie)
+                return [
+                    compare_embeddings(model, references[model], embeddings[model], self.threshold_multiplier)
+                    for model in models
+                ]
+
+            if self.policy == 'cascade':
+                results = run_cascade(self.cascade_order, lambda model: compare([model])[0], self.cascade_margin)
+            else:
+                results = compare(self.models)
+            return self._summarize(results)
 
         except Exception as e:
             return {"success": False, "error": str(e)}
+
+    def _summarize(self, results):
+        # Analyze results; models that failed or timed out count as not verified
+        completed = [res for res in results if 'distance' in res]
+        if not completed:
+            return {"success": False, "error": "; ".join(res['error'] for res in results)}
+        all_verified = all(res['verified'] for res in results)
+        avg_distance = sum(res['distance'] for res in completed) / len(completed)
+
+        return {
+            "success": True,
+            "matched": all_verified,
+            "results": results,
+            "average_distance": avg_distance,
+            "policy": self.policy,
+            "models_run": [res['model'] for res in results],
+            "message": "Faces matched successfully" if all_verified else "Faces did not match."
+        }
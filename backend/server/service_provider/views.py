@@ -6,25 +6,21 @@ from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 
 # Third-party imports
-import os
-import cv2
 import numpy as np
-from PIL import Image
-from deepface import DeepFace
 
 # DRF imports
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, parser_classes, permission_classes
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
 
 # Models
-from .models import ServiceProvider, ProviderService, SubService
+from .models import ServiceProvider, ProviderService, SubService, FaceJobKind, FaceVerificationJob
 
 # Serializers
 from .serializers import (
@@ -38,80 +34,180 @@ from .serializers import (
 )
 
 # Pagination
-from server.pagination import CustomPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
+from server.pagination import CustomPagination, encode_cursor, decode_cursor
 
-# Utilities
+# Utilities (the face verification stack imports OpenCV, DeepFace and TensorFlow on first use)
 from .validate_service_provider import FaceMatcher
+from .face_models import face_models
+from .face_jobs import job_metrics, job_payload, submit_job
+from .face_index import face_index, similar_providers
 
 # Database
 from django.db import transaction
 
 
 import copy
-from math import radians, cos, sin, asin, sqrt
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees)
-    """
-    # Convert decimal degrees to radians
-    lat1, lon1, lat2, lon2 = map(radians, [float(lat1), float(lon1), float(lat2), float(lon2)])
+# Geo
+from .geo import nearby_filter, nearest_k, nearest_within
+from .provider_index import provider_index
 
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    # Radius of earth in kilometers
-    r = 6371
-    return c * r
 
+def _verification_inputs(request):
+    """
+    Returns (image1, image2, provider, error_response). With ``provider_id``
+    instead of image1, the selfie in image2 is matched against that
+    provider's registered photo.
+    """
+    image1 = request.FILES.get('image1')
+    image2 = request.FILES.get('image2')
+    provider_id = request.data.get('provider_id')
 
+    if provider_id:
+        if not image2:
+            return None, None, None, Response({"success": False, "error": "A selfie (image2) is required."}, status=400)
+        try:
+            provider = ServiceProvider.objects.get(id=provider_id)
+        except (ServiceProvider.DoesNotExist, ValidationError):
+            return None, None, None, Response({"success": False, "error": "Provider not found."}, status=404)
+        return None, image2, provider, None
+    if not image1 or not image2:
+        return None, None, None, Response({"success": False, "error": "Both images are required."}, status=400)
+    return image1, image2, None, None
 
 
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
 @permission_classes([AllowAny])
 def verify_faces(request):
-    image1 = request.FILES.get('image1')
-    image2 = request.FILES.get('image2')
-
-    if not image1 or not image2:
-        return Response({"success": False, "error": "Both images are required."}, status=400)
+    """
+    Match image1 against image2, or the selfie in image2 against the
+    provider_id's registered photo using its precomputed embeddings.
+    """
+    image1, image2, provider, error = _verification_inputs(request)
+    if error:
+        return error
 
     matcher = FaceMatcher()
 
     try:
-        # Save the uploaded images to the 'images' folder in the project directory
-        images_dir = os.path.join(settings.BASE_DIR, 'images')
-        os.makedirs(images_dir, exist_ok=True)
+        # Decoded straight from the upload buffers; nothing is written to disk
+        if provider:
+            result = matcher.verify_provider(provider, image2)
+        else:
+            result = matcher.verify_faces(image1, image2)
+    except Exception as e:
+        return Response({"success": False, "error": str(e)}, status=400)
 
-        img1_path = os.path.join('images', image1.name)
-        img2_path = os.path.join('images', image2.name)
+    return Response(result)
 
-        with open(os.path.join(images_dir, image1.name), 'wb+') as destination:
-            for chunk in image1.chunks():
-                destination.write(chunk)
 
-        with open(os.path.join(images_dir, image2.name), 'wb+') as destination:
-            for chunk in image2.chunks():
-                destination.write(chunk)
-                
-        result = matcher.verify_faces(img1_path, img2_path)
-        os.remove(os.path.join(images_dir, image1.name))
-        os.remove(os.path.join(images_dir, image2.name))
+@api_view(['POST'])
+@parser_classes([MultiPartParser, FormParser])
+@permission_classes([AllowAny])
+def submit_verification_job(request):
+    """
+    Queue a verification (same inputs as verify_faces) and return its job id
+    at once. The result can be polled from verification_job_status and is
+    pushed to the notifications group of the verified provider, or else of
+    the authenticated user; never to a recipient named in the request.
+    """
+    image1, image2, provider, error = _verification_inputs(request)
+    if error:
+        return error
+
+    if provider:
+        notify_id = provider.id
+    elif request.user.is_authenticated:
+        notify_id = request.user.pk
+    else:
+        notify_id = ''
+    job = submit_job(image2, image1=image1, provider=provider, notify_id=notify_id)
+    return Response({
+        'success': True,
+        'job_id': str(job.id),
+        'status': job.status,
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def verification_job_status(request, job_id):
+    """
+    State and result of a verification job. Signup embedding and duplicate
+    check jobs share the table but are internal, so they are not served.
+    """
+    job = get_object_or_404(
+        FaceVerificationJob.objects.defer('image1', 'image2'), id=job_id, kind=FaceJobKind.VERIFY
+    )
+    return Response(job_payload(job))
 
-    except Exception as e:
-        return Response({"success": False, "error": str(e)}, status=400)
 
-    return Response(result)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def verification_job_metrics(request):
+    """Queue depth and recent wait/run times of the verification workers."""
+    return Response(job_metrics())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def provider_duplicates(request, provider_id):
+    """
+    Existing providers whose photos are most similar to this provider's,
+    for reviewing signups flagged as likely duplicates. ``k`` overrides
+    DUPLICATE_TOP_K.
+    """
+    provider = get_object_or_404(ServiceProvider, id=provider_id)
+    try:
+        k = int(request.query_params['k']) if 'k' in request.query_params else None
+    except ValueError:
+        return Response({'status': False, 'message': 'k must be an integer', 'data': None},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        matches = similar_providers(provider, k)
+    except ValueError as e:
+        return Response({'status': False, 'message': str(e), 'data': None}, status=status.HTTP_400_BAD_REQUEST)
+
+    # The index can still hold providers another worker deleted since its last build
+    providers = ServiceProvider.objects.in_bulk([match['provider_id'] for match in matches])
+    return Response({
+        'status': True,
+        'message': 'Similar providers',
+        'data': {
+            'model': face_index.model_name,
+            'matches': [
+                {
+                    **match,
+                    'provider_id': str(match['provider_id']),
+                    'name': providers[match['provider_id']].full_name,
+                    'mobile_number': providers[match['provider_id']].mobile_number,
+                }
+                for match in matches if match['provider_id'] in providers
+            ],
+        }
+    })
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def face_models_ready(request):
+    """Readiness probe: 200 once this worker's face models are loaded and warm."""
+    face_models.recheck()
+    ready = face_models.ready
+    return Response({
+        'status': ready,
+        'message': 'Face models ready' if ready else f'Face models {face_models.state}',
+        'data': face_models.stats()
+    }, status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE)
 
 
 
 
 class ServiceProviderViewSet(viewsets.ModelViewSet):
-    queryset = ServiceProvider.objects.all()
+    queryset = ServiceProvider.objects.order_by('first_name', 'last_name', 'id')
     pagination_class = CustomPagination
     lookup_field = 'id'
 
@@ -129,8 +225,10 @@ class ServiceProviderViewSet(viewsets.ModelViewSet):
             if isinstance(provider, Response):
                 return provider
                 
-            provider_services = provider.provider_services.all()
-            serializer = ProviderServiceSerializer(provider_services, many=True)
+            provider_services = provider.provider_services.select_related(
+                'provider__rating_summary', 'sub_service'
+            )
+            serializer = ProviderServiceSerializer(provider_services, many=True, context={'request': request})
             return Response({
                 'status': True,
                 'message': 'Provider services retrieved successfully',
@@ -210,7 +308,7 @@ class ServiceProviderViewSet(viewsets.ModelViewSet):
                     'data': None
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            response_serializer = ProviderServiceSerializer(created_services, many=True)
+            response_serializer = ProviderServiceSerializer(created_services, many=True, context={'request': request})
             return Response({
                 'status': True,
                 'message': f'{len(created_services)} services added successfully',
@@ -361,7 +459,7 @@ class ProviderServicesViewSet(ReadOnlyModelViewSet):
         provider_id = self.request.query_params.get('provider_id')
         subservice_id = self.kwargs.get('subservice_id')
         
-        queryset = ProviderService.objects.select_related('provider', 'sub_service')
+        queryset = ProviderService.objects.select_related('provider__rating_summary', 'sub_service')
         
         if provider_id:
             return queryset.filter(provider_id=provider_id)
@@ -375,38 +473,137 @@ class ProviderServicesViewSet(ReadOnlyModelViewSet):
 class SubServiceProvidersViewSet(ReadOnlyModelViewSet):
     serializer_class = ProviderServiceSerializer
     permission_classes = [AllowAny]
+    max_page_size = 100
    
     def list(self, request, *args, **kwargs):
         subservice_id = self.kwargs.get('subservice_id')
         client_lat = float(self.request.query_params.get('latitude'))
         client_lon = float(self.request.query_params.get('longitude'))
         radius = float(self.request.query_params.get('radius', 25))  # Default 25km radius
+        active_only = self.request.query_params.get('active_only') == 'true'
+
+        # Paged mode: only the k nearest after the cursor are loaded
+        limit = self.request.query_params.get('limit')
+        if limit is not None:
+            try:
+                limit = min(int(limit), self.max_page_size)
+                if limit < 1:
+                    raise ValueError
+            except ValueError:
+                return Response({
+                    'status': False,
+                    'message': 'Invalid limit',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+            return self.list_page(subservice_id, client_lat, client_lon, radius, active_only, limit)
+
+        matches = self.search(subservice_id, client_lat, client_lon, radius, active_only)
+        provider_services_with_distance = [
+            self.with_distance(provider_service, distance)
+            for provider_service, distance in matches
+        ]
        
-        # Get base queryset with provider information
+        # Serialize and return the data
+        serializer = self.get_serializer(provider_services_with_distance, many=True)
+        return Response(serializer.data)
+
+    def list_page(self, subservice_id, client_lat, client_lon, radius, active_only, limit):
+        cursor = self.request.query_params.get('cursor')
+        after = None
+        if cursor:
+            position = decode_cursor(cursor)
+            try:
+                after = (float(position[0]), int(position[1]))
+            except (IndexError, TypeError, ValueError):
+                raise NotFound('Invalid cursor')
+
+        # Fetch one extra row to know whether there is a next page
+        matches = self.search(
+            subservice_id, client_lat, client_lon, radius, active_only,
+            limit=limit + 1, after=after
+        )
+        next_link = None
+        if len(matches) > limit:
+            matches = matches[:limit]
+            last_service, last_distance = matches[-1]
+            next_link = replace_query_param(
+                self.request.build_absolute_uri(), 'cursor',
+                encode_cursor([last_distance, last_service.id])
+            )
+
+        serializer = self.get_serializer([
+            self.with_distance(provider_service, distance)
+            for provider_service, distance in matches
+        ], many=True)
+        return Response({
+            'status': True,
+            'message': 'Data retrieved successfully',
+            'data': {
+                'next': next_link,
+                'results': serializer.data
+            }
+        })
+
+    @staticmethod
+    def with_distance(provider_service, distance):
+        setattr(provider_service, 'distance', round(distance, 2))
+        return provider_service
+
+    def search(self, subservice_id, client_lat, client_lon, radius, active_only, limit=None, after=None):
+        """
+        Return [(provider_service, distance_km)] nearest first. With a limit,
+        only the first ``limit`` matches after the ``after`` position.
+        """
+        if getattr(settings, 'PROVIDER_INDEX_ENABLED', True):
+            return self.search_index(subservice_id, client_lat, client_lon, radius, active_only, limit, after)
+        return self.search_database(subservice_id, client_lat, client_lon, radius, active_only, limit, after)
+
+    def search_index(self, subservice_id, client_lat, client_lon, radius, active_only, limit=None, after=None):
+        """Look up nearby providers in the resident index, then load only those rows"""
+        index = provider_index.get(subservice_id)
+        if limit is None:
+            ids, distances = index.query_radius(client_lat, client_lon, radius, active_only)
+        else:
+            ids, distances = index.query_page(client_lat, client_lon, radius, limit, after, active_only)
+        provider_services = ProviderService.objects.select_related(
+            'provider__rating_summary'
+        ).in_bulk(ids.tolist())
+
+        matches = []
+        for provider_service_id, distance in zip(ids.tolist(), distances.tolist()):
+            provider_service = provider_services.get(provider_service_id)
+            if provider_service is None:
+                # Deleted by another worker since the index was built
+                continue
+            matches.append((provider_service, distance))
+        return matches
+
+    def search_database(self, subservice_id, client_lat, client_lon, radius, active_only, limit=None, after=None):
+        """Prefilter candidates in SQL, then compute exact distances"""
+        # Get candidates inside the search bounding box (index-backed)
+        providers = ServiceProvider.objects.filter(nearby_filter(client_lat, client_lon, radius))
+        if active_only:
+            providers = providers.filter(is_active=True)
         queryset = ProviderService.objects.filter(
+            provider__in=providers.values('id'),
             sub_service_id=subservice_id
-        ).select_related('provider')
+        ).select_related('provider__rating_summary')
        
-        # Calculate distances and filter
-        provider_services_with_distance = []
-        for provider_service in queryset:
-            provider = provider_service.provider
-            distance = haversine_distance(
-                client_lat, client_lon,
-                float(provider.latitude),
-                float(provider.longitude)
+        # Calculate distances, filter and sort in one vectorized pass
+        candidates = list(queryset)
+        latitudes = np.array([ps.provider.latitude for ps in candidates], dtype=np.float64)
+        longitudes = np.array([ps.provider.longitude for ps in candidates], dtype=np.float64)
+        if limit is None:
+            indices, distances = nearest_within(client_lat, client_lon, latitudes, longitudes, radius)
+        else:
+            indices, distances = nearest_k(
+                client_lat, client_lon, latitudes, longitudes,
+                np.array([ps.id for ps in candidates], dtype=np.int64), limit,
+                radius_km=radius, after=after
             )
-            if distance <= radius:
-                # Create a new object or modify existing one to ensure distance is properly set
-                provider_service = copy.copy(provider_service)  # Create a shallow copy
-                setattr(provider_service, 'distance', round(distance, 2))  # Set distance as an attribute
-                provider_services_with_distance.append(provider_service)
-       
-        # Sort by distance
-        provider_services_with_distance.sort(key=lambda x: x.distance)
-       
-        # Serialize and return the data
-        serializer = self.get_serializer(provider_services_with_distance, many=True)
-        return Response(serializer.data)
-        
-        
+
+        # Shallow copies so distance is set on fresh objects
+        return [
+            (copy.copy(candidates[index]), distance)
+            for index, distance in zip(indices.tolist(), distances.tolist())
+        ]
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from django.urls import reverse
+from server.renditions import rendition_url
 from django.db.models import Count, Avg, Q
 from .models import SubService
 
@@ -36,7 +37,7 @@ class SubServiceAdmin(admin.ModelAdmin):
 
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height: 50px; max-width: 100px;"/>', obj.image.url)
+            return format_html('<img src="{}" style="max-height: 50px; max-width: 100px;"/>', rendition_url(obj.image, 'thumb'))
         return 'No Image'
     image_preview.short_description = _('Image Preview')
 